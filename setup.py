@@ -11,6 +11,7 @@ setup(
     author_email='sanbales@gmail.com',
     url='https://github.com/sanbales/system-architect',
     packages=find_packages(),
+    python_requires='>=3.5',
     license='GPLv3',
     platforms='any',
     classifiers=[
@@ -19,13 +20,10 @@ setup(
         'Intended Audience :: Manufacturing',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: Implementation :: PyPy',
         'Framework :: Django',
         'Framework :: Django :: 1.8',
         'Framework :: Django :: 1.9',
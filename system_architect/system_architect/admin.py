@@ -1,10 +1,66 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.conf.urls import url
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import Http404, HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.db import router
+from django.urls import reverse
+from json import loads
 from nested_admin.nested import NestedModelAdmin, NestedTabularInline
 
-from .models import (Category, Function, FunctionRequires, FunctionSatisfies, Goal, Project, Scenario, System,
-                     SystemRequires, SystemSatisfies, SystemSatisfactionRequires, Term, Vote, WeightLevel,
+from .models import (Category, Function, FunctionRequires, FunctionSatisfies, Goal, Job, Project, Scenario,
+                     System, SystemRequires, SystemSatisfies, SystemSatisfactionRequires, Term, Vote, WeightLevel,
                      WeightingScale)
+from .analysis import Centrality, rank_functions
+from .analysis.duplicates import get_reference_counts, merge_entities
+from .database import write_transaction
+from .glossary import LINKED_FIELDS, link_entity_terms
+from .jobs import cancel_job, submit_job
+from .matrix import MATRIX_KINDS, MappingMatrix, import_matrix, read_matrix
+from .models.vote import ExpertProfile, Organization
+from .projects import clone_project, purge_project
+from .search import get_kind, search
+from .views import get_uuid
+
+
+# The most matches the admin search boxes show, within SQLite's query parameter limit
+MAX_ADMIN_SEARCH_RESULTS = 500
+
+
+class IndexedSearchMixin:
+    """Answers the admin search box from the full-text search index."""
+
+    search_fields = ['name', 'description']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        results = search(search_term, kinds=[get_kind(self.model)], limit=MAX_ADMIN_SEARCH_RESULTS)
+        return queryset.filter(pk__in=[result.pk for result in results]), False
+
+
+class TermLinkingMixin:
+    """
+    Links the functions, systems and goals saved to the glossary terms they mention.
+
+    Saving the many-to-many fields of the forms sets the terms back to those
+    picked in the form after the entities were linked as they were saved, so
+    the terms they mention are added again once all of it is saved, keeping
+    those picked.
+
+    """
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        saved = [form.instance]
+        for formset in formsets:
+            saved += formset.new_objects + [instance for instance, _ in formset.changed_objects]
+        linked = dict(LINKED_FIELDS)
+        for instance in saved:
+            if type(instance) in linked:
+                link_entity_terms(instance)
 
 
 class FunctionRequiresInline(NestedTabularInline):
@@ -27,9 +83,26 @@ class FunctionInline(NestedTabularInline):
     extra = 0
 
 
+def merge_selected(modeladmin, request, queryset):
+    """Merge the selected entities into the one most relationships point to."""
+    entities = list(queryset)
+    counts = get_reference_counts(modeladmin.model, [entity.pk for entity in entities])
+    keep = max(entities, key=lambda entity: counts[entity.pk])
+    try:
+        merge_entities(keep, entities)
+    except ValueError as error:
+        modeladmin.message_user(request, str(error), level=messages.ERROR)
+        return
+    modeladmin.message_user(request, "Merged {} duplicates into {}".format(len(entities) - 1, keep))
+
+
+merge_selected.short_description = "Merge selected into the most referenced one"
+
+
 @admin.register(Function)
-class FunctionAdmin(NestedModelAdmin):
+class FunctionAdmin(IndexedSearchMixin, TermLinkingMixin, NestedModelAdmin):
     model = Function
+    actions = [merge_selected]
     inlines = [FunctionRequiresInline, FunctionSatisfiesInline]
 
 
@@ -62,8 +135,9 @@ class SystemInline(NestedTabularInline):
 
 
 @admin.register(System)
-class SystemAdmin(NestedModelAdmin):
+class SystemAdmin(IndexedSearchMixin, TermLinkingMixin, NestedModelAdmin):
     model = System
+    actions = [merge_selected]
     inlines = [SystemRequiresInline, SystemSatisfiesInline]
 
 
@@ -96,6 +170,27 @@ def vote_form_factory(vote):
 
 @admin.register(Vote)
 class VoteAdmin(NestedModelAdmin):
+    """
+    Saves and deletes votes in write transactions.
+
+    The admin reads the vote and validates the form before it writes, which
+    fails at once on a SQLite database another expert is voting in, so posted
+    forms take the write lock before anything else.
+
+    """
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        if request.method != 'POST':
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        with write_transaction(router.db_for_write(self.model)):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        if request.method != 'POST':
+            return super().delete_view(request, object_id, extra_context)
+        with write_transaction(router.db_for_write(self.model)):
+            return super().delete_view(request, object_id, extra_context)
+
     def get_form(self, request, obj=None, **kwargs):
         if obj is not None and obj.type is not None:
             kwargs['form'] = vote_form_factory(obj.type)
@@ -108,13 +203,219 @@ class GoalInline(NestedTabularInline):
     extra = 0
 
 
+def clone_selected(modeladmin, request, queryset):
+    for project in queryset:
+        clone = clone_project(project)
+        modeladmin.message_user(request, "Cloned {} as {}".format(project, clone))
+
+
+clone_selected.short_description = "Clone selected projects"
+
+
+def link_selected_terms(modeladmin, request, queryset):
+    for project in queryset:
+        submit_job('link_terms', project, project=str(project.pk))
+        modeladmin.message_user(request, "Queued linking the glossary terms of {}".format(project))
+
+
+link_selected_terms.short_description = "Link glossary terms of selected projects"
+
+
+PURGE_CONFIRMATION_TEMPLATE = 'admin/system_architect/project/purge_confirmation.html'
+RANKING_TEMPLATE = 'admin/system_architect/project/ranking.html'
+MATRIX_TEMPLATE = 'admin/system_architect/project/matrix.html'
+
+
+def purge_selected(modeladmin, request, queryset):
+    """Delete the selected projects without loading their contents into memory."""
+    if request.POST.get('post'):
+        for project in queryset:
+            purge_project(project)
+        modeladmin.message_user(request, "Deleted {} projects".format(len(queryset)))
+        return None
+    return TemplateResponse(request, PURGE_CONFIRMATION_TEMPLATE, dict(
+        modeladmin.admin_site.each_context(request),
+        title="Are you sure?",
+        opts=modeladmin.model._meta,
+        action='purge_selected',
+        summaries=[
+            (project, purge_project(project, dry_run=True))
+            for project in queryset
+        ],
+    ))
+
+
+purge_selected.short_description = "Delete selected projects"
+
+
 @admin.register(Project)
-class ProjectAdmin(NestedModelAdmin):
+class ProjectAdmin(TermLinkingMixin, NestedModelAdmin):
     model = Project
-    fields = ['name', 'description', 'glossary']
+    fields = ['name', 'description', 'glossary',
+              'cost_limit', 'weight_limit', 'power_limit', 'space_limit']
     inlines = [GoalInline, FunctionInline, SystemInline]
+    actions = [clone_selected, link_selected_terms, purge_selected]
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_view(self, request, object_id, extra_context=None):
+        project = self.get_object(request, unquote(object_id))
+        if project is None or not self.has_delete_permission(request, project):
+            return super().delete_view(request, object_id, extra_context)
+
+        if request.method == 'POST':
+            purge_project(project)
+            self.message_user(request, "Deleted {}".format(project))
+            return HttpResponseRedirect(reverse('admin:system_architect_project_changelist'))
+        return TemplateResponse(request, PURGE_CONFIRMATION_TEMPLATE, dict(
+            self.admin_site.each_context(request),
+            title="Are you sure?",
+            opts=self.model._meta,
+            summaries=[(project, purge_project(project, dry_run=True))],
+            **(extra_context or {})
+        ))
+
+    def get_urls(self):
+        return [
+            url(r'^(.+)/ranking/$', self.admin_site.admin_view(self.ranking_view),
+                name='system_architect_project_ranking'),
+            url(r'^(.+)/matrix/$', self.admin_site.admin_view(self.matrix_view),
+                name='system_architect_project_matrix'),
+        ] + super().get_urls()
+
+    def ranking_view(self, request, object_id):
+        """Show the functions of a project from the most to the least central."""
+        project = self.get_object(request, unquote(object_id))
+        if project is None:
+            raise Http404
+        if not self.has_change_permission(request, project):
+            raise PermissionDenied
+
+        scenario = project.scenarios.filter(pk=request.GET.get('scenario') or None).first()
+        by = request.GET.get('by')
+        if by not in Centrality._fields:
+            by = 'pagerank'
+        return TemplateResponse(request, RANKING_TEMPLATE, dict(
+            self.admin_site.each_context(request),
+            title="Function ranking of {}".format(project),
+            opts=self.model._meta,
+            original=project,
+            scenarios=project.scenarios.all(),
+            scenario=scenario,
+            by=by,
+            fields=Centrality._fields,
+            ranking=rank_functions(project, scenario, by=by),
+        ))
+
+    def matrix_view(self, request, object_id):
+        """
+        Show the votes of the current expert on one kind of relationship as a grid.
+
+        Only the cells edited in the page are posted, as JSON in ``cells``, and
+        a CSV or Excel file of the grid can be uploaded in ``file`` instead.
+
+        """
+        project = self.get_object(request, unquote(object_id))
+        if project is None:
+            raise Http404
+        if not self.has_change_permission(request, project):
+            raise PermissionDenied
+
+        kind = request.GET.get('kind')
+        if kind not in MATRIX_KINDS:
+            kind = next(iter(MATRIX_KINDS))
+        scenario = project.scenarios.filter(pk=get_uuid(request.GET.get('scenario'))).first()
+        scale = (project.scales.filter(pk=get_uuid(request.GET.get('scale'))).first() or
+                 project.scales.first())
+        if scale is None:
+            self.message_user(request, "Add a weighting scale to the project first",
+                              messages.WARNING)
+            return HttpResponseRedirect(reverse('admin:system_architect_project_change',
+                                                args=[project.pk]))
+        expert, _ = ExpertProfile.objects.get_or_create(user=request.user)
+        matrix = MappingMatrix(kind, project, scale, scenario, expert)
+
+        if request.method == 'POST':
+            try:
+                if request.FILES.get('file'):
+                    upload = request.FILES['file']
+                    changed = import_matrix(matrix, read_matrix(upload, upload.name))
+                else:
+                    row_ids = {str(pk): pk for pk, _ in matrix.rows}
+                    column_ids = {str(pk): pk for pk, _ in matrix.columns}
+                    values = {}
+                    for key, value in loads(request.POST.get('cells') or '{}').items():
+                        row, _, column = key.partition(':')
+                        values[(row_ids.get(row, row), column_ids.get(column, column))] = value
+                    changed = matrix.save(values)
+                self.message_user(request, "Saved {} cells".format(changed))
+            except ValueError:
+                self.message_user(request, "The changes could not be read", messages.ERROR)
+            except ValidationError as error:
+                for message in error.messages:
+                    self.message_user(request, message, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+        return TemplateResponse(request, MATRIX_TEMPLATE, dict(
+            self.admin_site.each_context(request),
+            title="Mapping matrix of {}".format(project),
+            opts=self.model._meta,
+            original=project,
+            kinds=list(MATRIX_KINDS),
+            kind=kind,
+            scenarios=project.scenarios.all(),
+            scenario=scenario,
+            scales=project.scales.all(),
+            scale=scale,
+            levels=list(matrix.levels),
+            columns=matrix.columns,
+            rows=[
+                (row_id, name, [
+                    (column_id, matrix.cells.get((row_id, column_id), ''),
+                     (row_id, column_id) in matrix.locked)
+                    for column_id, _ in matrix.columns
+                ])
+                for row_id, name in matrix.rows
+            ],
+        ))
+
+
+@admin.register(Term)
+class TermAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    model = Term
+
+
+def cancel_selected(modeladmin, request, queryset):
+    for job in queryset.exclude(status__in=Job.FINISHED):
+        cancel_job(job)
+    modeladmin.message_user(request, "Cancelled the selected jobs")
+
+
+cancel_selected.short_description = "Cancel selected jobs"
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    model = Job
+    list_display = ['task', 'project', 'status', 'progress', 'message', 'attempts', 'created_on',
+                    'finished_on']
+    list_filter = ['status', 'task']
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = [cancel_selected]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Organization)
+class OrganizationAdmin(admin.ModelAdmin):
+    model = Organization
+    list_display = ['name', 'credibility']
+    list_editable = ['credibility']
 
 
 admin.site.register(Category)
 admin.site.register(Scenario)
-admin.site.register(Term)
@@ -0,0 +1,12 @@
+from .consensus import *
+from .graph import *
+from .evaluation import *
+from .duplicates import *
+from .dsm import *
+from .centrality import *
+from .closure import *
+from .resilience import *
+from .credibility import *
+from .disagreement import *
+from .optimization import *
+from .scenarios import *
@@ -0,0 +1,234 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, defaultdict, namedtuple
+from logging import getLogger
+from threading import RLock
+from ..lazy import LazyModule
+from ..models import Function
+from ..revisions import get_revision
+from .dsm import sort_components
+from .graph import SatisfactionGraph
+
+
+np = LazyModule('numpy')
+sparse = LazyModule('scipy.sparse')
+
+
+__all__ = ('Centrality', 'forget_centrality', 'get_centrality', 'rank_functions')
+
+
+logger = getLogger(__name__)
+
+
+# The chance that the random walk of PageRank follows a dependency rather
+# than jumping anywhere
+DAMPING = 0.85
+# How much each further step of a chain of dependents counts in Katz
+ATTENUATION = 0.1
+TOLERANCE = 1e-10
+MAX_ITERATIONS = 200
+
+# The most results kept, the least recently used being dropped beyond it
+MAX_KEPT = 64
+
+
+Centrality = namedtuple('Centrality', ('pagerank', 'katz', 'dependent_functions',
+                                       'dependent_systems'))
+
+
+def get_dependency_matrix(graph, nodes):
+    """
+    Get the sparse matrix of the active relationships of a graph.
+
+    A mark in row i and column j means that i depends on j, weighted by the
+    consensus on the relationship.
+
+    :return: the weighted matrix and the same matrix with ones as marks
+
+    """
+    index = {node: position for position, node in enumerate(nodes)}
+    rows, columns, weights = [], [], []
+    for relationship_id in graph.active.values():
+        edge = graph.edges[relationship_id]
+        rows.append(index[edge.target])
+        columns.append(index[edge.source])
+        weights.append(graph.get_weight(relationship_id))
+    shape = (len(nodes), len(nodes))
+    return (sparse.csr_matrix((weights, (rows, columns)), shape=shape),
+            sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=shape))
+
+
+def iterate(step, start):
+    """Apply a step until the values settle, or the iterations run out."""
+    values = start
+    for _ in range(MAX_ITERATIONS):
+        updated = step(values)
+        if np.abs(updated - values).sum() < TOLERANCE * len(values):
+            return updated
+        values = updated
+    logger.warning("Centrality did not converge in %d iterations", MAX_ITERATIONS)
+    return values
+
+
+def get_pagerank(matrix):
+    """
+    Get the weighted PageRank of every node of a dependency matrix.
+
+    The random walk goes from a node to one of the nodes it depends on, in
+    proportion to the weights, so nodes that much depends on rank higher.
+
+    """
+    size = matrix.shape[0]
+    if not size:
+        return np.zeros(0)
+    totals = np.asarray(matrix.sum(axis=1)).ravel()
+    inverse = np.divide(1.0, totals, out=np.zeros(size), where=totals > 0)
+    transition = matrix.T.dot(sparse.diags(inverse)).tocsr()
+    dangling = totals == 0
+    return iterate(
+        lambda values: (DAMPING * (transition.dot(values) + values[dangling].sum() / size) +
+                        (1 - DAMPING) / size),
+        np.full(size, 1.0 / size),
+    )
+
+
+def get_katz(matrix, attenuation=ATTENUATION):
+    """
+    Get the Katz centrality of every node of a dependency matrix.
+
+    Counts the weighted chains of dependents of each node, each step counting
+    ``attenuation`` times as much as the previous one. The attenuation is
+    lowered if needed for the sum to converge around dependency cycles.
+
+    """
+    size = matrix.shape[0]
+    if not size:
+        return np.zeros(0)
+    adjacency = matrix.T.tocsr()
+    # The largest row sum bounds the spectral radius of the matrix
+    bound = np.asarray(adjacency.sum(axis=1)).max()
+    if bound * attenuation >= 1:
+        attenuation = 0.9 / bound
+    return iterate(lambda values: attenuation * adjacency.dot(values) + 1, np.ones(size))
+
+
+def get_dependent_sets(structure):
+    """
+    Get the nodes that transitively depend on every node of a dependency matrix.
+
+    The strongly connected components are walked from the last dependents
+    back, so every component merges the sets of the components depending on
+    it once. The sets are integers used as bitsets of node positions.
+
+    """
+    positions = sort_components(structure)
+    members = defaultdict(list)
+    for node, position in enumerate(positions):
+        members[position].append(node)
+    dependents = structure.T.tocsr()
+
+    reached = {}
+    for position in sorted(members, reverse=True):
+        reach, is_cycle = 0, len(members[position]) > 1
+        for node in members[position]:
+            start, end = dependents.indptr[node], dependents.indptr[node + 1]
+            for dependent in dependents.indices[start:end]:
+                dependent_position = positions[dependent]
+                if dependent_position == position:
+                    is_cycle = True
+                else:
+                    reach |= (1 << int(dependent)) | reached[dependent_position]
+        if is_cycle:
+            for node in members[position]:
+                reach |= 1 << node
+        reached[position] = reach
+
+    return [
+        reached[position] & ~(1 << node)
+        for node, position in enumerate(positions)
+    ]
+
+
+def count_bits(value):
+    return bin(value).count('1')
+
+
+def compute_centrality(graph):
+    """Compute the centrality of every node of a satisfaction graph."""
+    nodes = sorted(graph.nodes, key=str)
+    matrix, structure = get_dependency_matrix(graph, nodes)
+    pagerank, katz = get_pagerank(matrix), get_katz(matrix)
+
+    function_mask = system_mask = 0
+    for position, node in enumerate(nodes):
+        if node in graph.functions:
+            function_mask |= 1 << position
+        else:
+            system_mask |= 1 << position
+
+    return {
+        node: Centrality(float(pagerank[position]), float(katz[position]),
+                         count_bits(dependents & function_mask),
+                         count_bits(dependents & system_mask))
+        for position, (node, dependents) in enumerate(zip(nodes, get_dependent_sets(structure)))
+    }
+
+
+_lock = RLock()
+# The centrality by (project id, scenario id), with the revision of the
+# project it was computed from, the least recently used first
+_centrality = OrderedDict()
+
+
+def get_centrality(project, scenario=None):
+    """
+    Get the centrality of the functions and systems of a project.
+
+    The results are kept until the project moves past the revision they were
+    computed from, see system_architect/revisions.py.
+
+    :return: a dictionary of ``Centrality`` tuples keyed by node id
+
+    """
+    key = (project.pk, getattr(scenario, 'pk', None))
+    revision = get_revision(project.pk)
+    with _lock:
+        kept = _centrality.get(key)
+        if kept is not None and kept[0] == revision:
+            _centrality.move_to_end(key)
+            return kept[1]
+        centrality = compute_centrality(SatisfactionGraph.from_project(project, scenario))
+        if revision is not None:
+            _centrality[key] = (revision, centrality)
+            _centrality.move_to_end(key)
+            while len(_centrality) > MAX_KEPT:
+                _centrality.popitem(last=False)
+        return centrality
+
+
+def rank_functions(project, scenario=None, by='pagerank'):
+    """
+    Rank the functions of a project from the most to the least central.
+
+    :param by: the field of ``Centrality`` to rank by
+    :return: a list of (function, centrality) tuples
+
+    """
+    if by not in Centrality._fields:
+        raise ValueError("Cannot rank functions by '{}'".format(by))
+    centrality = get_centrality(project, scenario)
+    functions = [
+        (function, centrality[function.pk])
+        for function in Function.objects.filter(project=project)
+        if function.pk in centrality
+    ]
+    functions.sort(key=lambda pair: (-getattr(pair[1], by), pair[0].name))
+    return functions
+
+
+def forget_centrality(project_id=None):
+    """Forget the kept centrality of a project, or of all projects if none is given."""
+    with _lock:
+        for key in list(_centrality):
+            if project_id is None or key[0] == project_id:
+                del _centrality[key]
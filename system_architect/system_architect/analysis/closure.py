@@ -0,0 +1,346 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Transitive closure of the requires relationships.
+
+Every function or system is stored with each function it ultimately requires,
+the fewest relationships leading there and the criticality of the most
+critical chain of requirements, that is the highest over the chains of their
+lowest criticality. Losing a function then breaks everything in a single
+indexed lookup of ``get_impact``.
+
+When a requires relationship, or a vote on one, changes, only the nodes that
+can reach its requiring end are recomputed, found from the stored closure
+itself, and only the relationships they may reach are loaded. The changes
+are gathered during a transaction and applied once it commits, so deleting a
+function does not recompute the closure for each of the relationships that
+cascade with it.
+
+"""
+from collections import defaultdict, deque
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.db.models.sql import DeleteQuery
+from django.dispatch import receiver
+from heapq import heappop, heappush
+from logging import getLogger
+from ..models import FunctionRequires, RequirementClosure, SystemRequires, Vote, WeightLevel
+from ..revisions import project_changed
+from .consensus import DEFAULT_WEIGHT, get_consensus
+
+
+__all__ = ('get_impact', 'get_requirements', 'rebuild_closure', 'update_closure')
+
+
+logger = getLogger(__name__)
+
+
+REQUIRES_MODELS = (FunctionRequires, SystemRequires)
+CHUNK_SIZE = 400
+TOLERANCE = 1e-9
+
+
+class RequirementGraph(object):
+    """The requires relationships of a project over all of its scenarios."""
+
+    def __init__(self):
+        self.systems = set()
+        # requiring id -> {required id: criticality}
+        self.required = defaultdict(dict)
+        # required id -> set of requiring ids
+        self.requiring = defaultdict(set)
+
+    @classmethod
+    def from_project(cls, project_id, nodes=None):
+        """
+        Load the requires relationships of a project.
+
+        :param nodes: only load the relationships these nodes require, or
+                      None to load them all
+
+        """
+        graph = cls()
+        edges = []
+        for model in REQUIRES_MODELS:
+            relationships = model.objects.filter(project=project_id)
+            if nodes is None:
+                edges.extend((model, *row) for row in
+                             relationships.values_list('pk', 'requiring', 'required'))
+                continue
+            for chunk in get_chunks(sorted(nodes)):
+                edges.extend((model, *row) for row in relationships.filter(requiring__in=chunk)
+                                                                   .values_list('pk', 'requiring',
+                                                                                'required'))
+
+        if nodes is None:
+            content_types = ContentType.objects.get_for_models(*REQUIRES_MODELS,
+                                                               for_concrete_models=False)
+            weights = get_consensus(Vote.objects.filter(
+                relationship__project=project_id,
+                relationship__polymorphic_ctype__in=content_types.values(),
+            ))
+        else:
+            weights = {}
+            for chunk in get_chunks([relationship_id for _, relationship_id, _, _ in edges]):
+                weights.update(get_consensus(Vote.objects.filter(relationship__in=chunk)))
+
+        for model, relationship_id, requiring, required in edges:
+            if model is SystemRequires:
+                graph.systems.add(requiring)
+            if requiring != required:
+                # The same requirement stated for several scenarios
+                # counts with its highest criticality
+                criticality = weights.get(relationship_id, DEFAULT_WEIGHT)
+                graph.required[requiring][required] = max(
+                    criticality, graph.required[requiring].get(required, criticality))
+                graph.requiring[required].add(requiring)
+        return graph
+
+    def get_ancestors(self, nodes):
+        """Get the given nodes and every node that ultimately requires one of them."""
+        found = set(nodes)
+        queue = deque(found)
+        while queue:
+            for requiring in self.requiring.get(queue.popleft(), ()):
+                if requiring not in found:
+                    found.add(requiring)
+                    queue.append(requiring)
+        return found
+
+    def get_closure(self, source):
+        """
+        Get every function a node ultimately requires.
+
+        The depths come from a breadth-first walk, and the criticalities from
+        a best-first walk that always extends the chain whose lowest
+        criticality is the highest.
+
+        :return: a dictionary of (depth, criticality) tuples keyed by function id
+
+        """
+        depths = {}
+        queue = deque([(source, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            for required in self.required.get(node, ()):
+                if required not in depths and required != source:
+                    depths[required] = depth + 1
+                    queue.append((required, depth + 1))
+
+        best = {source: float('inf')}
+        heap = [(-best[source], source)]
+        while heap:
+            width, node = heappop(heap)
+            width = -width
+            if width < best[node]:
+                continue
+            for required, criticality in self.required.get(node, {}).items():
+                candidate = min(width, criticality)
+                if candidate > best.get(required, -1.0):
+                    best[required] = candidate
+                    heappush(heap, (-candidate, required))
+
+        return {required: (depth, best[required]) for required, depth in depths.items()}
+
+
+def update_closure(project_id, nodes=None):
+    """
+    Bring the stored closure of a project up to date.
+
+    Only the changed nodes and those the stored closure says require them
+    are recomputed, from the relationships of the nodes they may now reach.
+    Any path from them to the changed relationships either is in the stored
+    closure or passes through an earlier changed relationship, so the stored
+    closure of the changed nodes, of the nodes they now require and of the
+    nodes those require is all that needs to be read to find them.
+
+    :param project_id: the project whose relationships changed
+    :param nodes: the requiring ends of the changed relationships, before and
+                  after the change, or None to recompute every node of the project
+    :return: the number of rows created, updated and deleted
+
+    """
+    if nodes is None:
+        graph = RequirementGraph.from_project(project_id)
+        sources = set(graph.required)
+        sources.update(RequirementClosure.objects
+                                         .filter(project=project_id)
+                                         .values_list('requiring_function', flat=True))
+        sources.update(RequirementClosure.objects
+                                         .filter(project=project_id)
+                                         .values_list('requiring_system', flat=True))
+        sources.discard(None)
+    else:
+        nodes = set(nodes)
+        sources = nodes | get_stored_requiring(project_id, nodes)
+        required = set()
+        for model in REQUIRES_MODELS:
+            for chunk in get_chunks(sorted(nodes)):
+                required.update(model.objects
+                                     .filter(project=project_id, requiring__in=chunk)
+                                     .values_list('required', flat=True))
+        reach = sources | required | get_stored_required(project_id, sources | required)
+        graph = RequirementGraph.from_project(project_id, reach)
+
+    changes = 0
+    for chunk in get_chunks(sorted(sources)):
+        changes += update_sources(project_id, graph, chunk)
+    logger.debug("Updated %d rows of the requirement closure of project %s", changes, project_id)
+    return changes
+
+
+def get_chunks(values):
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+def get_stored_requiring(project_id, nodes):
+    """Get the nodes the stored closure says require any of the given nodes."""
+    requiring = set()
+    for chunk in get_chunks(sorted(nodes)):
+        rows = (RequirementClosure.objects
+                                  .filter(project=project_id, required__in=chunk)
+                                  .values_list('requiring_function', 'requiring_system'))
+        requiring.update(function or system for function, system in rows)
+    return requiring
+
+
+def get_stored_required(project_id, nodes):
+    """Get the functions the stored closure says any of the given nodes require."""
+    required = set()
+    for chunk in get_chunks(sorted(nodes)):
+        required.update(RequirementClosure.objects
+                                          .filter(Q(requiring_function__in=chunk) |
+                                                  Q(requiring_system__in=chunk),
+                                                  project=project_id)
+                                          .values_list('required', flat=True))
+    return required
+
+
+def update_sources(project_id, graph, sources):
+    existing = {}
+    rows = (RequirementClosure.objects
+                              .filter(Q(requiring_function__in=sources) |
+                                      Q(requiring_system__in=sources),
+                                      project=project_id)
+                              .values_list('pk', 'requiring_function', 'requiring_system',
+                                           'required', 'depth', 'criticality'))
+    for pk, requiring_function, requiring_system, required, depth, criticality in rows:
+        existing[(requiring_function or requiring_system, required)] = (pk, depth, criticality)
+
+    wanted = {
+        (source, required): values
+        for source in sources
+        for required, values in graph.get_closure(source).items()
+    }
+
+    stale = [pk for key, (pk, _, _) in existing.items() if key not in wanted]
+    created, updated = [], []
+    for (source, required), (depth, criticality) in wanted.items():
+        if (source, required) not in existing:
+            is_system = source in graph.systems
+            created.append(RequirementClosure(
+                project_id=project_id,
+                requiring_function_id=None if is_system else source,
+                requiring_system_id=source if is_system else None,
+                required_id=required,
+                depth=depth,
+                criticality=criticality,
+            ))
+            continue
+        pk, old_depth, old_criticality = existing[(source, required)]
+        if depth != old_depth or abs(criticality - old_criticality) > TOLERANCE:
+            updated.append((pk, depth, criticality))
+
+    with transaction.atomic():
+        if stale:
+            DeleteQuery(RequirementClosure).delete_batch(stale, connection.alias)
+        RequirementClosure.objects.bulk_create(created)
+        for pk, depth, criticality in updated:
+            RequirementClosure.objects.filter(pk=pk).update(depth=depth, criticality=criticality)
+    return len(stale) + len(created) + len(updated)
+
+
+def rebuild_closure(project):
+    """Recompute the whole requirement closure of a project."""
+    return update_closure(getattr(project, 'pk', project))
+
+
+def get_requirements(node):
+    """
+    Get every function a function or system ultimately requires.
+
+    :return: a queryset of ``RequirementClosure``, the closest first
+
+    """
+    return (RequirementClosure.objects
+                              .filter(Q(requiring_function=node.pk) | Q(requiring_system=node.pk))
+                              .select_related('required')
+                              .order_by('depth', '-criticality'))
+
+
+def get_impact(function):
+    """
+    Get every function and system that breaks if a function is lost.
+
+    :return: a queryset of ``RequirementClosure``, the closest first
+
+    """
+    return (RequirementClosure.objects
+                              .filter(required=function.pk)
+                              .select_related('requiring_function', 'requiring_system')
+                              .order_by('depth', '-criticality'))
+
+
+@receiver(models.signals.pre_save, sender=FunctionRequires)
+@receiver(models.signals.pre_save, sender=SystemRequires)
+def remember_requiring(sender, instance, **kwargs):
+    instance._saved_requiring = (sender.objects
+                                       .filter(pk=instance.pk)
+                                       .values_list('project', 'requiring')
+                                       .first())
+
+
+@receiver(project_changed)
+def update_changed_closure(sender, project_id, changes, **kwargs):
+    """
+    Bring the closure of a project up to date once its changes commit.
+
+    The writes that send no model signals update the closure themselves, so
+    changes that cannot be told are left out.
+
+    """
+    nodes, voted, moved = set(), set(), defaultdict(set)
+    for change in changes:
+        if change is None:
+            continue
+        model, instance, _ = change
+        if model is WeightLevel:
+            # The criticalities are normalized to the range of their scale
+            nodes = None
+        elif model is Vote:
+            voted.add(instance.relationship_id)
+        elif model in REQUIRES_MODELS:
+            saved = getattr(instance, '_saved_requiring', None)
+            if saved:
+                moved[saved[0]].add(saved[1])
+            if nodes is not None:
+                nodes.add(instance.requiring_id)
+
+    if nodes is not None and voted:
+        # Looked up once the transaction committed, for all of its votes at once
+        voted = sorted(voted)
+        for model in REQUIRES_MODELS:
+            for chunk in get_chunks(voted):
+                nodes.update(model.objects
+                                  .filter(pk__in=chunk, project=project_id)
+                                  .values_list('requiring', flat=True))
+    if nodes is not None:
+        nodes.update(moved.pop(project_id, ()))
+    if nodes is None or nodes:
+        update_closure(project_id, nodes)
+    # The requirements moved to this project from others
+    for other_id, other_nodes in moved.items():
+        if other_id != project_id:
+            update_closure(other_id, other_nodes)
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from django.db import connections
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce
+from logging import getLogger
+from ..models import WeightLevel
+
+
+__all__ = ('DEFAULT_CREDIBILITY', 'DEFAULT_WEIGHT', 'get_consensus', 'get_latest_votes', 'get_scale_ranges')
+
+
+logger = getLogger(__name__)
+
+
+# A relationship nobody has voted on yet is taken at face value
+DEFAULT_WEIGHT = 1.0
+
+# How much the votes cast without an expert count
+DEFAULT_CREDIBILITY = 1.0
+
+
+def get_scale_ranges(levels=None):
+    """
+    Get the lowest and highest value of each weighting scale.
+
+    :param levels: a queryset of weight levels, defaults to all of them
+    :return: a dictionary of (min, max) tuples keyed by scale id
+
+    """
+    if levels is None:
+        levels = WeightLevel.objects.all()
+    ranges = (levels
+              .order_by()
+              .values('scale')
+              .annotate(lowest=Min('value'), highest=Max('value'))
+              .values_list('scale', 'lowest', 'highest'))
+    return {
+        scale_id: (lowest, highest)
+        for scale_id, lowest, highest in ranges
+    }
+
+
+# The ways of finding the latest votes, from the fastest to the most portable
+DISTINCT_ON = 'distinct on'
+WINDOW = 'window'
+NOT_EXISTS = 'not exists'
+
+# SQLite only has window functions since version 3.25
+SQLITE_WINDOW_VERSION = (3, 25, 0)
+
+
+def get_latest_vote_strategies(connection):
+    """Get the ways of finding the latest votes a database supports, fastest first."""
+    strategies = []
+    if connection.vendor == 'postgresql':
+        strategies.extend((DISTINCT_ON, WINDOW))
+    elif (connection.vendor == 'sqlite' and
+          connection.Database.sqlite_version_info >= SQLITE_WINDOW_VERSION):
+        strategies.append(WINDOW)
+    strategies.append(NOT_EXISTS)
+    return strategies
+
+
+def get_latest_votes(votes, strategy=None):
+    """
+    Get the latest vote of each expert on each relationship.
+
+    On PostgreSQL this is a ``DISTINCT ON (relationship, expert)`` query and on
+    SQLite 3.25+ a ``ROW_NUMBER()`` window over the same partitions, both of
+    which read the votes in the order of their (relationship, expert, -cast_on)
+    index. Other databases exclude the votes that have a newer one instead.
+    Votes cast at the same time are told apart by their primary key.
+
+    :param votes: a queryset of votes or vote records
+    :param strategy: how to find the latest votes, defaults to the fastest one
+        the database supports
+    :return: a queryset of the latest votes, which should not be reordered
+        since ``DISTINCT ON`` depends on the ordering
+
+    """
+    connection, model = connections[votes.db], votes.model
+    if strategy is None:
+        strategy = get_latest_vote_strategies(connection)[0]
+    if strategy == DISTINCT_ON:
+        return (votes.order_by('relationship', 'expert', '-cast_on', '-pk')
+                     .distinct('relationship', 'expert'))
+
+    quote_name = connection.ops.quote_name
+    columns = {
+        name: quote_name(model._meta.get_field(name).column)
+        for name in ('id', 'relationship', 'expert', 'cast_on')
+    }
+    sql, params = (votes.order_by()
+                        .values('id', 'relationship', 'expert', 'cast_on')
+                        .query.sql_with_params())
+    if strategy == WINDOW:
+        latest = (
+            "SELECT {id} FROM (SELECT {id}, ROW_NUMBER() OVER ("
+            "PARTITION BY {relationship}, {expert} ORDER BY {cast_on} DESC, {id} DESC"
+            ") AS position FROM ({sql}) votes) ranked WHERE position = 1"
+        ).format(sql=sql, **columns)
+    elif strategy == NOT_EXISTS:
+        latest = (
+            "SELECT {id} FROM ({sql}) votes WHERE NOT EXISTS (SELECT 1 FROM ({sql}) newer "
+            "WHERE newer.{relationship} = votes.{relationship} "
+            "AND (newer.{expert} = votes.{expert} OR "
+            "(newer.{expert} IS NULL AND votes.{expert} IS NULL)) "
+            "AND (newer.{cast_on} > votes.{cast_on} OR "
+            "(newer.{cast_on} = votes.{cast_on} AND newer.{id} > votes.{id})))"
+        ).format(sql=sql, **columns)
+        params = params + params
+    else:
+        raise ValueError("Unknown strategy '{}'".format(strategy))
+
+    return model.objects.using(votes.db).extra(
+        where=["{}.{} IN ({})".format(quote_name(model._meta.db_table), columns['id'], latest)],
+        params=params,
+    )
+
+
+def normalize(value, lowest, highest):
+    span = highest - lowest
+    return (value - lowest) / span if span > 0 else DEFAULT_WEIGHT
+
+
+def get_consensus(votes):
+    """
+    Get the consensus value of every relationship the given votes are on.
+
+    Only the latest vote of each expert is counted, and its value is
+    normalized to the [0, 1] range of the scale it belongs to so that
+    relationships assessed on different scales can be combined. Votes are
+    weighted by the credibility of their expert, which is joined in, and
+    summed up by the database for each relationship and scale.
+
+    :param votes: a queryset of votes
+    :return: a dictionary of consensus values keyed by relationship id,
+             leaving out relationships whose experts all have no credibility
+
+    """
+    latest = get_latest_votes(votes)
+    if latest.query.distinct_fields:
+        # Aggregates cannot be taken over DISTINCT ON
+        latest = latest.model.objects.using(latest.db).filter(pk__in=latest.values('pk'))
+    weight = Coalesce('expert__credibility', Value(DEFAULT_CREDIBILITY),
+                      output_field=FloatField())
+    rows = (latest
+            .order_by()
+            .values('relationship', 'value__scale')
+            .annotate(weighted=Sum(ExpressionWrapper(F('value__value') * weight,
+                                                     output_field=FloatField())),
+                      total=Sum(weight))
+            .values_list('relationship', 'value__scale', 'weighted', 'total'))
+    ranges = get_scale_ranges()
+
+    totals, weights = {}, {}
+    for relationship_id, scale_id, weighted, total in rows:
+        lowest, highest = ranges.get(scale_id, (0.0, 0.0))
+        span = highest - lowest
+        # Normalizing is linear, so the weighted sum of the normalized values
+        # follows from the weighted sum of the values
+        normalized = (weighted - lowest * total) / span if span > 0 else DEFAULT_WEIGHT * total
+        totals[relationship_id] = totals.get(relationship_id, 0.0) + normalized
+        weights[relationship_id] = weights.get(relationship_id, 0.0) + total
+
+    return {
+        relationship_id: total / weights[relationship_id]
+        for relationship_id, total in totals.items()
+        if weights[relationship_id] > 0
+    }
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Weighting experts by how credible their votes are.
+
+The credibility of an expert is the product of three factors, each raised
+to a configurable power, zero leaving it out:
+
+- the credibility of their organization,
+- how closely their latest votes agree with those of the rest of the panel on
+  the same relationships, shrunk towards the panel average for experts who
+  shared few relationships with others, and
+- the average confidence they declared on their latest votes.
+
+The credibility of every expert is computed at once from the whole vote
+table with array operations and stored on their profile, where
+``get_consensus`` joins it in, so it is only as current as the last batch.
+
+"""
+from django.conf import settings
+from django.db.models import Case, FloatField, Value, When
+from logging import getLogger
+from ..database import write_transaction
+from ..lazy import LazyModule
+from ..models import Project, Vote, WeightLevel
+from ..models.vote import ExpertProfile
+from ..revisions import touch_project
+from .closure import update_closure
+from .consensus import get_latest_votes, get_scale_ranges, normalize
+
+
+np = LazyModule('numpy')
+
+
+__all__ = ('get_credibility_factors', 'update_credibility')
+
+
+logger = getLogger(__name__)
+
+
+# The power each factor of the credibility is raised to, overridden by the
+# EXPERT_CREDIBILITY setting
+DEFAULT_CREDIBILITY_FACTORS = {
+    'organization': 1.0,
+    'agreement': 1.0,
+    'confidence': 1.0,
+}
+
+# The factor each confidence level contributes, in the order of Vote.CONFIDENCE_LEVELS
+CONFIDENCE_FACTORS = (1.0, 0.75, 0.5)
+
+# How many votes the panel average agreement counts as
+PRIOR_VOTES = 5
+
+# Credibilities closer than this are not worth writing
+TOLERANCE = 1e-6
+
+CHUNK_SIZE = 200
+
+
+def get_credibility_factors():
+    """Get the power each factor of the credibility is raised to."""
+    factors = dict(DEFAULT_CREDIBILITY_FACTORS)
+    factors.update(getattr(settings, 'EXPERT_CREDIBILITY', None) or {})
+    return factors
+
+
+def get_normalized_levels():
+    """Get an array of the normalized value of every weight level, indexed by its id."""
+    ranges = get_scale_ranges()
+    levels = list(WeightLevel.objects.values_list('pk', 'value', 'scale'))
+    normalized = np.zeros(max((pk for pk, _, _ in levels), default=0) + 1)
+    for pk, value, scale_id in levels:
+        normalized[pk] = normalize(value, *ranges[scale_id])
+    return normalized
+
+
+def get_agreement(relationships, experts, values, count, prior_votes=PRIOR_VOTES):
+    """
+    Get how closely each expert agrees with the rest of the panel.
+
+    Each vote is compared to the mean of the other votes on its relationship,
+    so an expert does not agree with themselves.
+
+    :param relationships: the relationship position of every vote
+    :param experts: the expert position of every vote
+    :param values: the normalized value of every vote
+    :param count: the number of experts
+    :return: an array of agreements between 0 and 1, by expert position
+
+    """
+    _, relationships = np.unique(relationships, return_inverse=True)
+    votes = np.bincount(relationships)[relationships]
+    sums = np.bincount(relationships, weights=values)[relationships]
+    shared = votes > 1
+    deviations = np.abs(values[shared] - (sums[shared] - values[shared]) / (votes[shared] - 1))
+
+    panel = 1.0 - deviations.mean() if len(deviations) else 1.0
+    compared = np.bincount(experts[shared], minlength=count)
+    deviation = np.bincount(experts[shared], weights=deviations, minlength=count)
+    return (compared - deviation + prior_votes * panel) / (compared + prior_votes)
+
+
+def get_confidence(experts, confidences, count):
+    """Get the average confidence factor of the votes of each expert, 1 for those without votes."""
+    votes = np.bincount(experts, minlength=count)
+    totals = np.bincount(experts, weights=np.array(CONFIDENCE_FACTORS)[confidences], minlength=count)
+    return np.where(votes > 0, totals / np.maximum(votes, 1), 1.0)
+
+
+def update_credibility(factors=None):
+    """
+    Compute and store the credibility of every expert.
+
+    The consensus of every relationship changes with the credibilities, so
+    every project moves to a new revision, leaving behind what was kept of
+    its analyses, and the requirement closures are rebuilt when any
+    credibility changed.
+
+    :param factors: the power each factor is raised to, defaults to
+                    ``get_credibility_factors()``
+    :return: the number of experts whose credibility changed
+
+    """
+    factors = factors or get_credibility_factors()
+    profiles = list(ExpertProfile.objects
+                                 .order_by('pk')
+                                 .values_list('pk', 'organization__credibility', 'credibility'))
+    if not profiles:
+        return 0
+    pks = np.array([pk for pk, _, _ in profiles])
+    organization = np.array([1.0 if value is None else value for _, value, _ in profiles])
+    current = np.array([value for _, _, value in profiles])
+
+    rows = np.array(list(get_latest_votes(Vote.objects.filter(expert__isnull=False))
+                         .values_list('relationship', 'expert', 'value', 'confidence')),
+                    dtype=np.int64).reshape(-1, 4)
+    experts = np.searchsorted(pks, rows[:, 1])
+    values = get_normalized_levels()[rows[:, 2]]
+
+    credibility = (
+        np.power(organization, factors['organization']) *
+        np.power(get_agreement(rows[:, 0], experts, values, len(pks)), factors['agreement']) *
+        np.power(get_confidence(experts, rows[:, 3], len(pks)), factors['confidence'])
+    )
+
+    changed = np.flatnonzero(np.abs(credibility - current) > TOLERANCE)
+    with write_transaction():
+        for start in range(0, len(changed), CHUNK_SIZE):
+            chunk = changed[start:start + CHUNK_SIZE]
+            ExpertProfile.objects.filter(pk__in=[int(pks[index]) for index in chunk]).update(
+                credibility=Case(
+                    *(When(pk=int(pks[index]), then=Value(float(credibility[index])))
+                      for index in chunk),
+                    output_field=FloatField()
+                ))
+        if len(changed):
+            # The consensus of every project weighs the votes by credibility
+            for project_id in Project.objects.values_list('pk', flat=True):
+                touch_project(project_id)
+
+    if len(changed):
+        for project_id in Project.objects.values_list('pk', flat=True):
+            update_closure(project_id)
+    logger.debug("Updated the credibility of %d of %d experts", len(changed), len(pks))
+    return len(changed)
@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Finding where experts disagree with each other and where they contradict themselves.
+
+The latest vote of every expert on every relationship of a project is read
+in one query into a ``VoteTable``, the values normalized by their scales,
+and everything else is worked out from its arrays:
+
+- how far apart the votes on each relationship are,
+- how closely each pair of experts agrees, as one minus the mean absolute
+  difference of their votes on the relationships they both voted on, which
+  sparse matrix products give for all pairs at once, and
+- the votes of an expert that cannot all hold, such as rating a
+  requirement of a function critical while rating every satisfier of that
+  function as not satisfying it, or rating two functions as critically
+  requiring each other.
+
+Votes are only compared to votes on relationships stated for the same
+scenario.
+
+"""
+from collections import namedtuple
+from logging import getLogger
+from ..lazy import LazyModule
+from ..models import Vote
+from ..models.vote import ExpertProfile
+from .consensus import get_latest_votes
+from .credibility import get_normalized_levels
+from .graph import (FUNCTION_REQUIRES, FUNCTION_SATISFIES, RELATIONSHIP_FIELDS, SYSTEM_REQUIRES,
+                    SYSTEM_SATISFACTION_REQUIRES, SYSTEM_SATISFIES)
+
+
+np = LazyModule('numpy')
+sparse = LazyModule('scipy.sparse')
+
+
+__all__ = ('Contradiction', 'VoteTable', 'find_contradictions', 'get_agreement_matrix',
+           'get_disagreements', 'get_spreads')
+
+
+logger = getLogger(__name__)
+
+
+# Normalized votes at or above this are critical, and at or below LOW are not at all
+HIGH = 0.9
+LOW = 0.1
+
+# The range of normalized votes on a relationship from which its experts disagree
+SPREAD = 0.5
+
+# The kinds of relationships whose source a target cannot do without, and
+# those whose source satisfies their target
+REQUIREMENT_KINDS = (FUNCTION_REQUIRES, SYSTEM_REQUIRES, SYSTEM_SATISFACTION_REQUIRES)
+SATISFACTION_KINDS = (FUNCTION_SATISFIES, SYSTEM_SATISFIES)
+
+UNSATISFIABLE = 'required but not satisfied'
+MUTUAL = 'mutually required'
+
+
+Contradiction = namedtuple('Contradiction', ('expert', 'kind', 'relationship', 'others'))
+Spreads = namedtuple('Spreads', ('experts', 'lowest', 'highest', 'deviation'))
+
+
+class VoteTable:
+    """
+    The latest votes of the experts on the relationships of a project, as arrays.
+
+    The relationships and experts are numbered by their position in the
+    ``relationships`` and ``experts`` lists, and every vote is a row of the
+    ``relationship``, ``expert`` and ``value`` arrays.
+
+    :param project: the project to read the votes of
+    :param scenario: only read the votes on the relationships stated for this scenario
+
+    """
+
+    def __init__(self, project, scenario=None):
+        self.relationships, self.kinds, self.sources, self.targets, self.scenarios = [], [], [], [], []
+        for kind, model, (source, target, _) in RELATIONSHIP_FIELDS:
+            relationships = model.objects.non_polymorphic().filter(project=project)
+            if scenario is not None:
+                relationships = relationships.filter(scenario=scenario)
+            rows = relationships.values_list('pk', 'scenario', source, target)
+            for pk, scenario_id, source_id, target_id in rows:
+                self.relationships.append(pk)
+                self.kinds.append(kind)
+                self.sources.append(source_id)
+                self.targets.append(target_id)
+                self.scenarios.append(scenario_id)
+        positions = {pk: position for position, pk in enumerate(self.relationships)}
+
+        votes = Vote.objects.filter(relationship__project=project, expert__isnull=False)
+        if scenario is not None:
+            votes = votes.filter(relationship__scenario=scenario)
+        rows = [row for row in get_latest_votes(votes).values_list('relationship', 'expert', 'value')
+                if row[0] in positions]
+        self.experts = sorted({expert for _, expert, _ in rows})
+        experts = {pk: position for position, pk in enumerate(self.experts)}
+        self.relationship = np.array([positions[pk] for pk, _, _ in rows], dtype=np.int64)
+        self.expert = np.array([experts[pk] for _, pk, _ in rows], dtype=np.int64)
+        self.value = get_normalized_levels()[np.array([pk for _, _, pk in rows], dtype=np.int64)]
+
+    def get_expert_names(self):
+        names = dict(ExpertProfile.objects
+                                  .filter(pk__in=self.experts)
+                                  .values_list('pk', 'user__username'))
+        return [names.get(pk, '') for pk in self.experts]
+
+    def get_matrix(self, values):
+        """Get a sparse matrix of the given value of every vote, by expert and relationship."""
+        return sparse.csr_matrix((values, (self.expert, self.relationship)),
+                                 shape=(len(self.experts), len(self.relationships)))
+
+
+def get_spreads(table):
+    """
+    Get how far apart the votes on each relationship are.
+
+    :return: ``Spreads`` of arrays by relationship position: the number of
+             experts who voted, the lowest and highest of their votes and
+             their standard deviation, the last three being NaN where nobody voted
+
+    """
+    size = len(table.relationships)
+    experts = np.bincount(table.relationship, minlength=size)
+    totals = np.bincount(table.relationship, weights=table.value, minlength=size)
+    squares = np.bincount(table.relationship, weights=table.value ** 2, minlength=size)
+    lowest, highest = np.full(size, np.nan), np.full(size, np.nan)
+    np.fmin.at(lowest, table.relationship, table.value)
+    np.fmax.at(highest, table.relationship, table.value)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / experts
+        deviation = np.sqrt(np.maximum(squares / experts - means ** 2, 0.0))
+    return Spreads(experts, lowest, highest, deviation)
+
+
+def get_disagreements(table, spread=SPREAD):
+    """
+    Get the relationships whose experts disagree, most of all first.
+
+    :param spread: the least range of normalized votes that is a disagreement
+    :return: a tuple of the positions of the relationships voted on by more
+             than one expert with votes at least ``spread`` apart, in
+             decreasing order of their standard deviation, and their ``Spreads``
+
+    """
+    spreads = get_spreads(table)
+    with np.errstate(invalid='ignore'):
+        disagreed = np.flatnonzero((spreads.experts > 1) &
+                                   (spreads.highest - spreads.lowest >= spread))
+    return disagreed[np.argsort(-spreads.deviation[disagreed], kind='stable')], spreads
+
+
+def get_agreement_matrix(table):
+    """
+    Get how closely every pair of experts agrees.
+
+    The absolute difference of two votes is the sum, over the thresholds
+    between the distinct vote values, of the gap to the next value for each
+    threshold that one vote reaches and the other does not. Each threshold
+    is a sparse indicator matrix, so the summed differences of all pairs of
+    experts take a few sparse products.
+
+    :return: a tuple of the number of relationships each pair of experts
+             both voted on and their agreement between 0 and 1, NaN for pairs
+             that share none, as square arrays by expert position
+
+    """
+    voted = table.get_matrix(np.ones(len(table.value)))
+    shared = (voted @ voted.T).toarray()
+    differences = np.zeros_like(shared)
+    levels = np.unique(table.value)
+    for gap, level in zip(np.diff(levels), levels[1:]):
+        reached = table.get_matrix((table.value >= level).astype(float))
+        one_sided = (reached @ voted.T).toarray()
+        both = (reached @ reached.T).toarray()
+        differences += gap * (one_sided + one_sided.T - 2.0 * both)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        agreement = np.where(shared > 0, 1.0 - differences / shared, np.nan)
+    return shared.astype(np.int64), agreement
+
+
+def get_keys(*columns):
+    """Combine columns of non-negative integers below their given sizes into one integer key."""
+    key = np.zeros(len(columns[0][0]), dtype=np.int64)
+    for values, size in columns:
+        key = key * size + values
+    return key
+
+
+def find_contradictions(table, high=HIGH, low=LOW):
+    """
+    Find the votes of each expert that contradict each other.
+
+    An expert contradicts themselves when they rate a requirement of a
+    function critical but rate every satisfier of that function, having
+    voted on them all, as not satisfying it at all, or when they rate two
+    functions as critically requiring each other.
+
+    :param high: the normalized vote at or above which a requirement is critical
+    :param low: the normalized vote at or below which a satisfier does not satisfy
+    :return: a list of ``Contradiction`` with the ids of the expert, the
+             critical requirement and the relationships that contradict it
+
+    """
+    relationships = np.array(table.relationships, dtype=object)
+    kinds = np.array(table.kinds, dtype=object)
+    nodes = {node: position for position, node in enumerate(set(table.sources) | set(table.targets))}
+    scenarios = {scenario: position for position, scenario in enumerate(set(table.scenarios))}
+    sources = np.array([nodes[node] for node in table.sources], dtype=np.int64)
+    targets = np.array([nodes[node] for node in table.targets], dtype=np.int64)
+    scenario = np.array([scenarios[pk] for pk in table.scenarios], dtype=np.int64)
+    node_size, scenario_size, expert_size = len(nodes) or 1, len(scenarios) or 1, len(table.experts) or 1
+
+    votes = table.relationship
+    vote_kinds = kinds[votes]
+    contradictions = []
+
+    # The functions each expert says nothing satisfies, by scenario
+    satisfiers = np.isin(kinds, SATISFACTION_KINDS)
+    available, counts = np.unique(get_keys((scenario[satisfiers], scenario_size),
+                                           (targets[satisfiers], node_size)), return_counts=True)
+    rows = np.flatnonzero(np.isin(vote_kinds, SATISFACTION_KINDS))
+    keys = get_keys((scenario[votes[rows]], scenario_size), (table.expert[rows], expert_size),
+                    (targets[votes[rows]], node_size))
+    voted, voted_counts = np.unique(keys, return_counts=True)
+    denied, denied_counts = np.unique(keys[table.value[rows] <= low], return_counts=True)
+    voted_counts = voted_counts[np.searchsorted(voted, denied)]
+    function_keys = get_keys(((denied // node_size) // expert_size, scenario_size),
+                             (denied % node_size, node_size))
+    totals = counts[np.searchsorted(available, function_keys)]
+    denied = denied[(denied_counts == voted_counts) & (denied_counts == totals)]
+
+    critical = np.flatnonzero(np.isin(vote_kinds, REQUIREMENT_KINDS) & (table.value >= high))
+    keys = get_keys((scenario[votes[critical]], scenario_size),
+                    (table.expert[critical], expert_size), (sources[votes[critical]], node_size))
+    flagged = critical[np.isin(keys, denied)]
+    if len(flagged):
+        # The satisfiers each flagged expert voted down
+        satisfier_rows = rows[table.value[rows] <= low]
+        satisfier_keys = get_keys((scenario[votes[satisfier_rows]], scenario_size),
+                                  (table.expert[satisfier_rows], expert_size),
+                                  (targets[votes[satisfier_rows]], node_size))
+        order = np.argsort(satisfier_keys, kind='stable')
+        satisfier_keys, satisfier_rows = satisfier_keys[order], satisfier_rows[order]
+        for row, key in zip(flagged, keys[np.isin(keys, denied)]):
+            start, end = np.searchsorted(satisfier_keys, [key, key + 1])
+            contradictions.append(Contradiction(
+                table.experts[table.expert[row]], UNSATISFIABLE, relationships[votes[row]],
+                tuple(relationships[votes[satisfier_rows[start:end]]])))
+
+    # The pairs of functions an expert says critically require each other
+    requirements = critical[vote_kinds[critical] == FUNCTION_REQUIRES]
+    prefix = ((scenario[votes[requirements]], scenario_size),
+              (table.expert[requirements], expert_size))
+    forward = get_keys(*prefix, (sources[votes[requirements]], node_size),
+                       (targets[votes[requirements]], node_size))
+    backward = get_keys(*prefix, (targets[votes[requirements]], node_size),
+                        (sources[votes[requirements]], node_size))
+    order = np.argsort(forward, kind='stable')
+    mutual = np.isin(backward, forward) & (sources[votes[requirements]] < targets[votes[requirements]])
+    for row, key in zip(requirements[mutual], backward[mutual]):
+        other = requirements[order[np.searchsorted(forward[order], key)]]
+        contradictions.append(Contradiction(
+            table.experts[table.expert[row]], MUTUAL, relationships[votes[row]],
+            (relationships[votes[other]],)))
+
+    logger.debug("Found %d contradictions in %d votes", len(contradictions), len(votes))
+    return contradictions
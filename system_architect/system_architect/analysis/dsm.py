@@ -0,0 +1,369 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, defaultdict
+from csv import writer
+from logging import getLogger
+from struct import pack
+from zlib import compressobj, crc32
+from ..lazy import LazyModule
+from ..models import Function, System
+from .graph import FUNCTION_REQUIRES, FUNCTION_SATISFIES, SYSTEM_SATISFIES, SatisfactionGraph
+
+
+np = LazyModule('numpy')
+sparse = LazyModule('scipy.sparse')
+csgraph = LazyModule('scipy.sparse.csgraph')
+
+
+__all__ = ('DesignStructureMatrix', 'get_dsm', 'get_function_dsm', 'get_system_dsm')
+
+
+logger = getLogger(__name__)
+
+
+# How much more a dependency outside of any cluster costs than one inside a
+# cluster of the same size, as in Thebeau's cluster cost
+SIZE_PENALTY = 2.0
+
+
+def sort_components(matrix):
+    """
+    Sort the strongly connected components of a dependency matrix.
+
+    A mark in row i and column j means that i depends on j, so the component
+    of j is sorted before the component of i unless they are the same.
+
+    :return: the position of the component of every row in the sorted order
+
+    """
+    count, labels = csgraph.connected_components(matrix, directed=True, connection='strong')
+    matrix = sparse.coo_matrix(matrix)
+    between = labels[matrix.row] != labels[matrix.col]
+    # Component a depends on component b when a member of a depends on one of b
+    dependencies = sparse.coo_matrix(
+        (np.ones(between.sum()), (labels[matrix.row[between]], labels[matrix.col[between]])),
+        shape=(count, count),
+    ).tocsr()
+    dependencies.sum_duplicates()
+    dependencies.data[:] = 1
+
+    # Kahn's algorithm, taking the components with no pending dependencies first
+    pending = np.asarray(dependencies.sum(axis=1)).ravel()
+    dependents = dependencies.T.tocsr()
+    ready = list(np.flatnonzero(pending == 0)[::-1])
+    order = []
+    while ready:
+        component = ready.pop()
+        order.append(component)
+        start, end = dependents.indptr[component], dependents.indptr[component + 1]
+        for dependent in dependents.indices[start:end]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+
+    position = np.empty(count, dtype=int)
+    position[order] = np.arange(count)
+    return position[labels]
+
+
+class DesignStructureMatrix:
+    """
+    A sparse matrix of how much the row elements depend on the column elements.
+
+    Following the inputs-in-rows convention, a mark in row i and column j
+    means that i depends on j, weighted by the consensus of the experts on the
+    relationship. Only the marks are stored, so the matrix of thousands of
+    functions takes memory in proportion to the number of relationships.
+
+    """
+
+    def __init__(self, rows, columns, names, matrix):
+        self.rows = list(rows)
+        self.columns = list(columns)
+        self.names = names
+        self.matrix = sparse.csr_matrix(matrix)
+
+    @classmethod
+    def from_marks(cls, rows, columns, names, marks):
+        """Make a matrix from a dictionary of values keyed by (row id, column id)."""
+        row_index = {pk: index for index, pk in enumerate(rows)}
+        column_index = {pk: index for index, pk in enumerate(columns)}
+        keys = list(marks)
+        matrix = sparse.coo_matrix(
+            (np.fromiter((marks[key] for key in keys), dtype=float, count=len(keys)),
+             (np.fromiter((row_index[row] for row, _ in keys), dtype=int, count=len(keys)),
+              np.fromiter((column_index[column] for _, column in keys), dtype=int,
+                          count=len(keys)))),
+            shape=(len(rows), len(columns)),
+        )
+        return cls(rows, columns, names, matrix)
+
+    @property
+    def is_square(self):
+        return self.rows == self.columns
+
+    def reorder(self, rows=None, columns=None):
+        """Get a copy with the rows and columns in the order of the given ids."""
+        rows = self.rows if rows is None else list(rows)
+        columns = self.columns if columns is None else list(columns)
+        row_index = {pk: index for index, pk in enumerate(self.rows)}
+        column_index = {pk: index for index, pk in enumerate(self.columns)}
+        matrix = self.matrix[[row_index[pk] for pk in rows], :]
+        matrix = matrix[:, [column_index[pk] for pk in columns]]
+        return type(self)(rows, columns, self.names, matrix)
+
+    def get_feedback(self):
+        """Get the total weight of the marks above the diagonal."""
+        return sparse.triu(self.matrix, k=1).sum()
+
+    def sequence(self):
+        """
+        Order the elements so that they come after the elements they depend on.
+
+        The elements of a dependency cycle cannot be ordered that way, so they
+        are kept together in a block and are the only marks left above the
+        diagonal.
+
+        :return: the element ids in order and the block index of each of them
+
+        """
+        if not self.is_square:
+            raise ValueError("Only square matrices can be sequenced")
+        blocks = sort_components(self.matrix)
+        ordering = np.lexsort((np.arange(len(self.rows)), blocks))
+        return [self.rows[index] for index in ordering], blocks[ordering].tolist()
+
+    def cluster(self, max_size=None, passes=20, size_penalty=SIZE_PENALTY):
+        """
+        Group the elements into modules that depend mostly on one another.
+
+        Marks are made symmetric and the cluster cost of Thebeau is minimized
+        by moving one element at a time to the cluster of one of its neighbors
+        or on its own. A mark inside a cluster of size s costs w * s^p and one
+        outside any cluster costs w * n^p, so each move only looks at the
+        marks of the element moved.
+
+        :param max_size: the largest number of elements in a cluster
+        :param passes: the most times every element is considered for a move
+        :param size_penalty: the exponent p of the cluster sizes in the cost
+        :return: the cluster index of every element, in the order of the rows
+
+        """
+        if not self.is_square:
+            raise ValueError("Only square matrices can be clustered")
+        size = len(self.rows)
+        max_size = max_size or size
+        symmetric = (self.matrix + self.matrix.T).tocoo()
+        linked = symmetric.row != symmetric.col
+        symmetric = sparse.csr_matrix(
+            (symmetric.data[linked], (symmetric.row[linked], symmetric.col[linked])),
+            shape=(size, size),
+        )
+
+        labels = np.arange(size)
+        sizes = np.ones(size, dtype=int)
+        internal = np.zeros(size)
+        outside = size ** size_penalty
+
+        for _ in range(passes):
+            moved = False
+            for element in range(size):
+                start, end = symmetric.indptr[element], symmetric.indptr[element + 1]
+                if start == end:
+                    continue
+                links = defaultdict(float)
+                for neighbor, weight in zip(symmetric.indices[start:end], symmetric.data[start:end]):
+                    links[labels[neighbor]] += weight
+
+                current = labels[element]
+                current_links = links.pop(current, 0.0)
+                leaving = (
+                    (internal[current] - current_links) * (sizes[current] - 1) ** size_penalty -
+                    internal[current] * sizes[current] ** size_penalty +
+                    current_links * outside
+                )
+                best, best_change = None, 0.0
+                if sizes[current] > 1 and leaving < -1e-9:
+                    best, best_change = -1, leaving
+                for cluster, cluster_links in links.items():
+                    if sizes[cluster] >= max_size:
+                        continue
+                    change = leaving + (
+                        (internal[cluster] + cluster_links) * (sizes[cluster] + 1) ** size_penalty -
+                        internal[cluster] * sizes[cluster] ** size_penalty -
+                        cluster_links * outside
+                    )
+                    if change < best_change - 1e-9:
+                        best, best_change = cluster, change
+                if best is None:
+                    continue
+
+                if best == -1:
+                    # Start a new cluster in the slot of an empty one
+                    best = np.flatnonzero(sizes == 0)[0]
+                    cluster_links = 0.0
+                else:
+                    cluster_links = links[best]
+                internal[current] -= current_links
+                sizes[current] -= 1
+                internal[best] += cluster_links
+                sizes[best] += 1
+                labels[element] = best
+                moved = True
+            if not moved:
+                break
+
+        # Number the clusters from zero in the order they first appear
+        _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+        renumbered = np.argsort(np.argsort(first))
+        return renumbered[inverse].tolist()
+
+    def get_cost(self, labels, size_penalty=SIZE_PENALTY):
+        """Get the cluster cost of grouping the elements as labeled."""
+        labels = np.asarray(labels)
+        sizes = np.bincount(labels)
+        symmetric = sparse.triu(self.matrix + self.matrix.T, k=1).tocoo()
+        inside = labels[symmetric.row] == labels[symmetric.col]
+        return (
+            (symmetric.data[inside] * sizes[labels[symmetric.row[inside]]] ** size_penalty).sum() +
+            symmetric.data[~inside].sum() * len(self.rows) ** size_penalty
+        )
+
+    def organize(self, max_size=None):
+        """
+        Get a copy ordered by clusters, and by dependencies within each one.
+
+        The clusters are ordered by the average sequence position of their
+        elements, so modules that others depend on come first.
+
+        :return: the reordered matrix and the cluster index of each element
+
+        """
+        sequence, _ = self.sequence()
+        labels = dict(zip(self.rows, self.cluster(max_size=max_size)))
+        position = {pk: index for index, pk in enumerate(sequence)}
+        members = defaultdict(list)
+        for pk in sequence:
+            members[labels[pk]].append(pk)
+        clusters = sorted(members, key=lambda cluster: np.mean([
+            position[pk] for pk in members[cluster]
+        ]))
+        order = [pk for cluster in clusters for pk in members[cluster]]
+        renumbered = {cluster: index for index, cluster in enumerate(clusters)}
+        return self.reorder(order, order), [renumbered[labels[pk]] for pk in order]
+
+    def sort_rows(self):
+        """Get a copy with the rows sorted by the column of their strongest mark."""
+        def get_position(index):
+            row = self.matrix.getrow(index)
+            if not row.nnz:
+                return len(self.columns)
+            return row.indices[row.data.argmax()]
+
+        order = sorted(range(len(self.rows)), key=get_position)
+        return self.reorder([self.rows[index] for index in order])
+
+    def write_csv(self, output):
+        """Write the matrix as CSV, one row at a time, with the names as headers."""
+        csv = writer(output)
+        csv.writerow([''] + [self.names[pk] for pk in self.columns])
+        for index, pk in enumerate(self.rows):
+            values = self.matrix.getrow(index).toarray().ravel()
+            csv.writerow([self.names[pk]] + ['{:g}'.format(value) if value else ''
+                                             for value in values])
+
+    def write_png(self, output, cell_size=4):
+        """
+        Write the matrix as a grayscale PNG image, darker for stronger marks.
+
+        The image is compressed one row of cells at a time, so large matrices
+        never need an uncompressed image in memory.
+
+        """
+        width, height = len(self.columns) * cell_size, len(self.rows) * cell_size
+
+        def write_chunk(kind, data):
+            output.write(pack('>I', len(data)))
+            output.write(kind + data)
+            output.write(pack('>I', crc32(kind + data) & 0xffffffff))
+
+        output.write(b'\x89PNG\r\n\x1a\n')
+        write_chunk(b'IHDR', pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+        compressor, data = compressobj(9), []
+        for index in range(len(self.rows)):
+            values = self.matrix.getrow(index).toarray().ravel()
+            shades = np.clip(255 - np.rint(values * 255), 0, 255).astype(np.uint8)
+            line = b'\x00' + np.repeat(shades, cell_size).tobytes()
+            data.append(compressor.compress(line * cell_size))
+        data.append(compressor.flush())
+        write_chunk(b'IDAT', b''.join(data))
+        write_chunk(b'IEND', b'')
+
+
+def get_names(queryset):
+    return OrderedDict(queryset.order_by('name').values_list('pk', 'name'))
+
+
+def get_function_dsm(project, scenario=None, graph=None):
+    """
+    Get the function by function matrix of a project.
+
+    A function depends on the functions it requires and on the functions that
+    satisfy it. When both relationships are stated the strongest one is kept.
+
+    :param graph: the satisfaction graph of the project, if already loaded
+    :return: a ``DesignStructureMatrix`` with the functions sorted by name
+
+    """
+    graph = graph or SatisfactionGraph.from_project(project, scenario)
+    names = get_names(Function.objects.filter(project=project))
+    marks = {}
+    for relationship_id in graph.active.values():
+        edge = graph.edges[relationship_id]
+        if edge.kind in (FUNCTION_REQUIRES, FUNCTION_SATISFIES) and edge.source != edge.target:
+            key = (edge.target, edge.source)
+            marks[key] = max(marks.get(key, 0.0), graph.get_weight(relationship_id))
+    return DesignStructureMatrix.from_marks(list(names), list(names), names, marks)
+
+
+def get_system_dsm(project, scenario=None, graph=None):
+    """
+    Get the system by function matrix of how well systems satisfy functions.
+
+    :param graph: the satisfaction graph of the project, if already loaded
+    :return: a ``DesignStructureMatrix`` with the systems in the rows
+
+    """
+    graph = graph or SatisfactionGraph.from_project(project, scenario)
+    systems = get_names(System.objects.filter(project=project))
+    functions = get_names(Function.objects.filter(project=project))
+    marks = {
+        (graph.edges[relationship_id].source, graph.edges[relationship_id].target):
+            graph.get_weight(relationship_id)
+        for relationship_id in graph.active.values()
+        if graph.edges[relationship_id].kind == SYSTEM_SATISFIES
+    }
+    return DesignStructureMatrix.from_marks(list(systems), list(functions),
+                                            {**systems, **functions}, marks)
+
+
+def get_dsm(project, scenario=None, systems=False, organize=False):
+    """
+    Get the function or system matrix of a project, ready to be shown.
+
+    Organized matrices have the functions grouped into modules and ordered by
+    dependencies, and the systems next to the functions they satisfy most.
+
+    :param systems: whether to get the system by function matrix
+    :param organize: whether to cluster and sequence the functions
+    :return: a ``DesignStructureMatrix``
+
+    """
+    graph = SatisfactionGraph.from_project(project, scenario)
+    dsm = get_function_dsm(project, graph=graph)
+    if organize:
+        dsm, _ = dsm.organize()
+    if not systems:
+        return dsm
+    system_dsm = get_system_dsm(project, graph=graph).reorder(columns=dsm.columns)
+    return system_dsm.sort_rows() if organize else system_dsm
@@ -0,0 +1,294 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import Counter, defaultdict, namedtuple
+from django.db import models, transaction
+from django.db.models import Count, Q
+from django.dispatch import receiver
+from functools import reduce
+from logging import getLogger
+from operator import or_
+from random import Random
+from re import UNICODE, findall
+from struct import pack, unpack
+from zlib import crc32
+from ..models import (Function, FunctionRequires, FunctionSatisfies, System, SystemArchitecture,
+                      SystemRequires, SystemSatisfactionRequires, SystemSatisfies, Vote,
+                      VoteHistory)
+from ..revisions import touch_project
+from .closure import rebuild_closure
+
+
+__all__ = ('DuplicateCandidate', 'find_duplicates', 'get_signature', 'merge_entities')
+
+
+logger = getLogger(__name__)
+
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS_PER_BAND = SIGNATURE_SIZE // BANDS
+
+MERSENNE_PRIME = (1 << 61) - 1
+_random = Random(20170629)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+    for _ in range(SIGNATURE_SIZE)
+]
+
+STOP_WORDS = {
+    'a', 'all', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or',
+    'the', 'to', 'under', 'with',
+}
+SUFFIXES = ('ation', 'ion', 'ing', 'ed', 'es', 's')
+
+
+# The relationship fields that point to each kind of entity
+REFERENCES = {
+    Function: (
+        (FunctionRequires, 'requiring'),
+        (FunctionRequires, 'required'),
+        (FunctionSatisfies, 'satisfier'),
+        (FunctionSatisfies, 'satisfied'),
+        (SystemRequires, 'required'),
+        (SystemSatisfies, 'satisfied'),
+        (SystemSatisfactionRequires, 'required'),
+    ),
+    System: (
+        (SystemRequires, 'requiring'),
+        (SystemSatisfies, 'satisfier'),
+    ),
+}
+
+# The relationship types and the fields that may point to a merged entity, in
+# the order duplicate relationships are merged
+IDENTITIES = (
+    (FunctionRequires, ('requiring', 'required')),
+    (FunctionSatisfies, ('satisfier', 'satisfied')),
+    (SystemRequires, ('requiring', 'required')),
+    (SystemSatisfies, ('satisfier', 'satisfied')),
+    (SystemSatisfactionRequires,
+     ('required', 'relationship__satisfier', 'relationship__satisfied')),
+)
+
+
+DuplicateCandidate = namedtuple('DuplicateCandidate', ('first', 'second', 'similarity'))
+
+
+def get_tokens(*texts):
+    """Get the set of normalized words in the given texts."""
+    tokens = set()
+    for word in findall(r'\w+', " ".join(texts).lower(), UNICODE):
+        if word in STOP_WORDS:
+            continue
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        tokens.add(word)
+    return tokens
+
+
+def get_signature(name, description=''):
+    """
+    Get the MinHash signature of an entity's name and description.
+
+    The share of positions two signatures agree on estimates the Jaccard
+    similarity of their normalized words, regardless of word order.
+
+    :return: the packed signature, or None if there are no words to hash
+
+    """
+    hashes = [crc32(token.encode('utf-8')) for token in get_tokens(name, description)]
+    if not hashes:
+        return None
+    return pack('<{}I'.format(SIGNATURE_SIZE), *(
+        min((a * value + b) % MERSENNE_PRIME for value in hashes) & 0xffffffff
+        for a, b in PERMUTATIONS
+    ))
+
+
+def unpack_signature(signature):
+    return unpack('<{}I'.format(SIGNATURE_SIZE), bytes(signature))
+
+
+def update_missing_signatures(queryset):
+    """Sign the entities saved before signatures were kept."""
+    for pk, name, description in (queryset.filter(signature__isnull=True)
+                                          .values_list('pk', 'name', 'description')):
+        queryset.model.objects.filter(pk=pk).update(signature=get_signature(name, description))
+
+
+def find_duplicates(project, model=Function, threshold=0.5):
+    """
+    Find the pairs of functions or systems of a project that are likely duplicates.
+
+    Locality sensitive hashing groups the signatures by bands, so only entities
+    that share a band are compared instead of every pair.
+
+    :param project: the project to search
+    :param model: either ``Function`` or ``System``
+    :param threshold: the lowest estimated similarity to report, in [0, 1]
+    :return: a list of duplicate candidates, most similar first
+
+    """
+    queryset = model.objects.filter(project=project)
+    update_missing_signatures(queryset)
+
+    signatures, buckets = {}, defaultdict(list)
+    for pk, signature in queryset.filter(signature__isnull=False).values_list('pk', 'signature'):
+        signatures[pk] = values = unpack_signature(signature)
+        for band in range(BANDS):
+            start = band * ROWS_PER_BAND
+            buckets[band, values[start:start + ROWS_PER_BAND]].append(pk)
+
+    pairs = {
+        tuple(sorted((first, second), key=str))
+        for members in buckets.values()
+        for index, first in enumerate(members)
+        for second in members[index + 1:]
+    }
+
+    candidates = []
+    for first, second in pairs:
+        matches = sum(
+            one == other
+            for one, other in zip(signatures[first], signatures[second])
+        )
+        similarity = matches / SIGNATURE_SIZE
+        if similarity >= threshold:
+            candidates.append((first, second, similarity))
+
+    entities = queryset.in_bulk({
+        pk
+        for first, second, _ in candidates
+        for pk in (first, second)
+    })
+    candidates.sort(key=lambda candidate: candidate[2], reverse=True)
+    return [
+        DuplicateCandidate(entities[first], entities[second], similarity)
+        for first, second, similarity in candidates
+    ]
+
+
+def get_reference_counts(model, pks):
+    """Count how many relationships point to each of the given entities."""
+    counts = Counter()
+    for relationship_model, field in REFERENCES[model]:
+        counts.update(dict(
+            relationship_model.objects
+                              .filter(**{field + '__in': pks})
+                              .order_by()
+                              .values_list(field)
+                              .annotate(count=Count('pk'))
+        ))
+    return counts
+
+
+def merge_entities(keep, duplicates):
+    """
+    Merge duplicate functions or systems into the one to keep.
+
+    Every relationship pointing to a duplicate is rewired to the one kept with
+    one update per relationship field. Relationships that end up stating the
+    same thing are then merged, moving their votes to the surviving one.
+
+    """
+    model = type(keep)
+    duplicate_ids = [duplicate.pk for duplicate in duplicates if duplicate.pk != keep.pk]
+    if model not in REFERENCES:
+        raise TypeError("Only functions and systems can be merged")
+    if model.objects.filter(pk__in=duplicate_ids).exclude(project=keep.project_id).exists():
+        raise ValueError("Only entities of the same project can be merged")
+
+    with transaction.atomic():
+        for relationship_model, field in REFERENCES[model]:
+            (relationship_model.objects
+                               .filter(**{field + '__in': duplicate_ids})
+                               .update(**{field: keep}))
+
+        merge_relationships(keep)
+
+        keep.categories.add(*model.categories.through.objects
+                                  .filter(**{model._meta.model_name + '__in': duplicate_ids})
+                                  .values_list('category', flat=True))
+        keep.terms.add(*model.terms.through.objects
+                             .filter(**{model._meta.model_name + '__in': duplicate_ids})
+                             .values_list('term', flat=True))
+        if model is System:
+            architectures = (SystemArchitecture.systems.through.objects
+                                               .filter(system__in=duplicate_ids)
+                                               .values_list('systemarchitecture', flat=True))
+            keep.systemarchitecture_set.add(*set(architectures))
+
+        model.objects.filter(pk__in=duplicate_ids).delete()
+        # The relationships were rewired by updates, which send no signals
+        touch_project(keep.project_id)
+
+    rebuild_closure(keep.project_id)
+
+
+def merge_relationships(entity):
+    """Merge the relationships of an entity that state the same thing."""
+    FunctionRequires.objects.filter(requiring=entity.pk, required=entity.pk).delete()
+    FunctionSatisfies.objects.filter(satisfier=entity.pk, satisfied=entity.pk).delete()
+
+    for relationship_model, ends in IDENTITIES:
+        fields = relationship_model.identity_fields + ('scenario',)
+        touching = reduce(or_, (Q(**{end: entity.pk}) for end in ends))
+        survivors, merged = {}, defaultdict(list)
+        rows = (relationship_model.objects
+                                  .filter(touching)
+                                  .order_by('pk')
+                                  .values_list('pk', *fields))
+        for pk, *identity in rows:
+            survivor = survivors.setdefault(tuple(identity), pk)
+            if survivor != pk:
+                merged[survivor].append(pk)
+
+        for survivor, pks in merged.items():
+            Vote.objects.filter(relationship__in=pks).update(relationship=survivor)
+            VoteHistory.objects.filter(relationship__in=pks).update(relationship=survivor)
+            if relationship_model is SystemSatisfies:
+                (SystemSatisfactionRequires.objects
+                                           .filter(relationship__in=pks)
+                                           .update(relationship=survivor))
+        if relationship_model is SystemSatisfies and merged:
+            merge_incompatibilities({pk: survivor for survivor, pks in merged.items() for pk in pks})
+        relationship_model.objects.filter(pk__in=[
+            pk
+            for pks in merged.values()
+            for pk in pks
+        ]).delete()
+
+
+def merge_incompatibilities(survivors):
+    """
+    Move the incompatibilities of merged system satisfactions to the ones they were merged into.
+
+    :param survivors: the id of the satisfaction each merged one was merged into, by merged id
+
+    """
+    through = SystemSatisfies.incompatible.through
+    ids = set(survivors) | set(survivors.values())
+    rows = list(through.objects
+                       .filter(Q(from_systemsatisfies__in=ids) | Q(to_systemsatisfies__in=ids))
+                       .values_list('pk', 'from_systemsatisfies', 'to_systemsatisfies'))
+    # Both directions of each incompatibility are stored, and merging may
+    # state one twice or make a satisfaction incompatible with itself
+    pairs = {
+        (survivors.get(source, source), survivors.get(target, target))
+        for _, source, target in rows
+    }
+    through.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    through.objects.bulk_create([
+        through(from_systemsatisfies_id=source, to_systemsatisfies_id=target)
+        for source, target in sorted(pairs, key=str)
+        if source != target
+    ])
+
+
+@receiver(models.signals.pre_save, sender=Function)
+@receiver(models.signals.pre_save, sender=System)
+def update_signature(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.signature = get_signature(instance.name, instance.description)
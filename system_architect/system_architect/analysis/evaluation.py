@@ -0,0 +1,483 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, namedtuple
+from django.dispatch import receiver
+from heapq import heappop, heappush
+from itertools import count
+from logging import getLogger
+from threading import RLock
+from ..lazy import LazyModule
+from ..models import Function, Project, System, SystemArchitecture, Term, Vote
+from ..models.relationship import Relationship
+from ..revisions import CREATED, DELETED, get_revision, project_changed
+from .consensus import get_consensus
+from .graph import (FUNCTION_REQUIRES, FUNCTION_SATISFIES, SYSTEM_SATISFIES,
+                    SatisfactionGraph, get_top_functions, make_edge)
+
+
+np = LazyModule('numpy')
+
+
+__all__ = ('SatisfactionEvaluator', 'WhatIf', 'evaluate_architecture', 'evaluate_variants',
+           'forget_evaluators', 'get_evaluator')
+
+
+logger = getLogger(__name__)
+
+
+# The most times the members of a dependency cycle are evaluated together
+MAX_CYCLE_ITERATIONS = 1000
+
+# The most evaluators kept, the least recently used being dropped beyond it
+MAX_EVALUATORS = 64
+
+
+WhatIf = namedtuple('WhatIf', ('added', 'removed', 'satisfaction', 'delta', 'functions'))
+
+
+class SatisfactionEvaluator:
+    """
+    Evaluates how well the systems of an architecture satisfy each function.
+
+    A function is satisfied by its best satisfier (an OR over the functions and
+    systems that satisfy it) and is then penalized by its worst shortfall (an
+    AND over the functions it requires). A system only contributes if it is
+    in the architecture, and only as much as the functions it requires allow.
+
+    The last result is kept, so that when an edge or its weight changes only
+    the nodes downstream of it are re-evaluated, in dependency order.
+
+    """
+    tolerance = 1e-9
+
+    def __init__(self, graph, system_ids):
+        self.graph = graph
+        self.system_ids = set(system_ids)
+        self.values = {}
+        # The revision of the project the evaluation is up to date with
+        self.revision = None
+        self.ranks, self.cycles = graph.get_ranks()
+        self.propagate(graph.nodes)
+
+    def get_function_values(self):
+        return {
+            function_id: self.values.get(function_id, 0.0)
+            for function_id in self.graph.functions
+        }
+
+    def set_systems(self, system_ids):
+        """Change the systems in the architecture and re-evaluate what they affect."""
+        system_ids = set(system_ids)
+        changed = system_ids ^ self.system_ids
+        self.system_ids = system_ids
+        return self.propagate(changed)
+
+    def set_weight(self, relationship_id, weight):
+        return self.propagate(self.graph.set_weight(relationship_id, weight))
+
+    def add_edge(self, relationship_id, edge):
+        return self.restructure(self.graph.add(relationship_id, edge))
+
+    def discard_edge(self, relationship_id):
+        return self.restructure(self.graph.discard(relationship_id))
+
+    def restructure(self, nodes):
+        """Re-rank the graph after its edges changed and re-evaluate the given nodes."""
+        if not nodes:
+            return set()
+        self.ranks, self.cycles = self.graph.get_ranks()
+        return self.propagate(nodes)
+
+    def propagate(self, nodes):
+        """
+        Re-evaluate the given nodes and everything downstream whose value changes.
+
+        When a dependency cycle is reached, all its members are reset and solved
+        together, so a cycle cannot keep supporting itself after losing the
+        input that satisfied it in the first place.
+
+        :return: the set of nodes whose value changed
+
+        """
+        heap, queued, reset, changed = [], set(), set(), set()
+        counter = count()
+
+        def push(node):
+            if node not in queued:
+                queued.add(node)
+                heappush(heap, (self.ranks.get(node, -1), next(counter), node))
+
+        for node in nodes:
+            push(node)
+
+        while heap:
+            *_, node = heappop(heap)
+            queued.discard(node)
+            cycle = self.cycles.get(node)
+            if cycle and node not in reset:
+                reset.update(cycle)
+                for member in cycle:
+                    if self.values.get(member, 0.0) != 0.0:
+                        changed.add(member)
+                        for dependent in self.graph.get_dependents(member):
+                            push(dependent)
+                    self.values[member] = 0.0
+                    push(member)
+
+            value = self.evaluate(node)
+            if node in self.values and abs(value - self.values[node]) <= self.tolerance:
+                continue
+            self.values[node] = value
+            changed.add(node)
+            for dependent in self.graph.get_dependents(node):
+                push(dependent)
+
+        return changed
+
+    def evaluate(self, node):
+        if node in self.graph.systems:
+            if node not in self.system_ids:
+                return 0.0
+            return 1.0 - self.get_shortfall(self.graph.inputs[node])
+
+        graph, values = self.graph, self.values
+        supply, shortfall, is_decomposed = None, 0.0, False
+        for relationship_id in graph.inputs[node]:
+            kind, source, *_ = graph.edges[relationship_id]
+            weight = graph.get_weight(relationship_id)
+            if kind == FUNCTION_REQUIRES:
+                is_decomposed = True
+                shortfall = max(shortfall, weight * (1.0 - values.get(source, 0.0)))
+            elif kind == FUNCTION_SATISFIES:
+                supply = max(supply or 0.0, weight * values.get(source, 0.0))
+            elif kind == SYSTEM_SATISFIES:
+                conditions = self.get_shortfall(graph.conditions[relationship_id])
+                supply = max(supply or 0.0,
+                             weight * values.get(source, 0.0) * (1.0 - conditions))
+
+        if supply is None:
+            # A function nothing can satisfy directly is only as good as the
+            # functions it is decomposed into
+            supply = 1.0 if is_decomposed else 0.0
+        return supply * (1.0 - shortfall)
+
+    def get_shortfall(self, relationship_ids):
+        return max(
+            (
+                self.graph.get_weight(relationship_id) *
+                (1.0 - self.values.get(self.graph.edges[relationship_id].source, 0.0))
+                for relationship_id in relationship_ids
+            ),
+            default=0.0,
+        )
+
+    def evaluate_system_sets(self, system_sets):
+        """
+        Evaluate the nodes affected by changing the systems to each of several sets at once.
+
+        Only the nodes downstream of the systems that some set adds or removes
+        are evaluated, once for all the sets together with arrays holding a
+        value per set. The other nodes keep the values evaluated last.
+
+        :param system_sets: a list of sets of system ids
+        :return: a dictionary of arrays of values, one per set, keyed by the
+                 nodes that were evaluated
+
+        """
+        size = len(system_sets)
+        members = {}
+        for system_ids in system_sets:
+            for system in (system_ids ^ self.system_ids) & self.graph.systems:
+                if system not in members:
+                    members[system] = np.array([system in other for other in system_sets])
+
+        affected, stack = set(members), list(members)
+        while stack:
+            for dependent in self.graph.get_dependents(stack.pop()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    stack.append(dependent)
+
+        values = {}
+        for node in sorted(affected, key=lambda node: self.ranks.get(node, -1)):
+            if node in values:
+                continue
+            cycle = self.cycles.get(node)
+            if cycle is None:
+                values[node] = self.evaluate_many(node, values, members, size)
+                continue
+            # Like ``propagate``, solve the cycle from scratch so it cannot support itself
+            for member in cycle:
+                values[member] = np.zeros(size)
+            for _ in range(MAX_CYCLE_ITERATIONS):
+                change = 0.0
+                for member in cycle:
+                    value = self.evaluate_many(member, values, members, size)
+                    change = max(change, np.abs(value - values[member]).max())
+                    values[member] = value
+                if change <= self.tolerance:
+                    break
+        return values
+
+    def evaluate_many(self, node, values, members, size):
+        """Evaluate a node like ``evaluate``, for several sets of systems at once."""
+        graph = self.graph
+
+        def get(source):
+            value = values.get(source)
+            return self.values.get(source, 0.0) if value is None else value
+
+        if node in graph.systems:
+            present = members.get(node, node in self.system_ids)
+            value = present * (1.0 - self.get_shortfalls(graph.inputs[node], get))
+            return np.broadcast_to(value, (size,))
+
+        supply, shortfall, is_decomposed = None, 0.0, False
+        for relationship_id in graph.inputs[node]:
+            kind, source, *_ = graph.edges[relationship_id]
+            weight = graph.get_weight(relationship_id)
+            if kind == FUNCTION_REQUIRES:
+                is_decomposed = True
+                shortfall = np.maximum(shortfall, weight * (1.0 - get(source)))
+            elif kind == FUNCTION_SATISFIES:
+                supply = np.maximum(0.0 if supply is None else supply, weight * get(source))
+            elif kind == SYSTEM_SATISFIES:
+                conditions = self.get_shortfalls(graph.conditions[relationship_id], get)
+                supply = np.maximum(0.0 if supply is None else supply,
+                                    weight * get(source) * (1.0 - conditions))
+
+        if supply is None:
+            supply = 1.0 if is_decomposed else 0.0
+        return np.broadcast_to(supply * (1.0 - shortfall), (size,))
+
+    def get_shortfalls(self, relationship_ids, get):
+        shortfall = 0.0
+        for relationship_id in relationship_ids:
+            shortfall = np.maximum(shortfall, self.graph.get_weight(relationship_id) *
+                                   (1.0 - get(self.graph.edges[relationship_id].source)))
+        return shortfall
+
+
+_lock = RLock()
+# The kept evaluators by (architecture id, scenario id), the least recently used first
+_evaluators = OrderedDict()
+
+
+def get_evaluator(architecture, scenario=None):
+    """
+    Get the evaluator of an architecture under a scenario.
+
+    Evaluators are kept between calls, stamped with the revision of their
+    project, and brought up to date as the changes to the project commit. One
+    whose project has since been changed elsewhere, such as by another
+    process, is evaluated again.
+
+    """
+    key = (architecture.pk, getattr(scenario, 'pk', None))
+    revision = get_revision(architecture.project_id)
+    with _lock:
+        evaluator = _evaluators.get(key)
+        if evaluator is None or evaluator.revision != revision:
+            graph = SatisfactionGraph.from_project(architecture.project, scenario)
+            evaluator = SatisfactionEvaluator(
+                graph, architecture.systems.values_list('pk', flat=True))
+            evaluator.revision = revision
+            if revision is None:
+                # Worked out from changes that may still roll back
+                return evaluator
+            _evaluators[key] = evaluator
+        _evaluators.move_to_end(key)
+        while len(_evaluators) > MAX_EVALUATORS:
+            _evaluators.popitem(last=False)
+        return evaluator
+
+
+def evaluate_architecture(architecture, scenario=None):
+    """
+    Evaluate the functional satisfaction of an architecture.
+
+    :return: a dictionary of satisfaction values in [0, 1] keyed by function id
+
+    """
+    evaluator = get_evaluator(architecture, scenario)
+    with _lock:
+        return evaluator.get_function_values()
+
+
+def evaluate_variants(architecture, variants, scenario=None, weights=None):
+    """
+    Evaluate variants of an architecture that add and remove systems, all at once.
+
+    The variants are evaluated together from the kept evaluation of the
+    architecture, so that only what the systems they change affect is
+    worked out, once for all of them, and the architecture is left as is.
+
+    :param architecture: the ``SystemArchitecture`` the variants start from
+    :param variants: an iterable of (added, removed) pairs of iterables of system ids
+    :param scenario: the scenario to evaluate under
+    :param weights: how much each function counts towards the satisfaction,
+                    keyed by function id, defaults to the top functions
+                    counting equally
+    :return: a list of ``WhatIf`` in the order of the variants, with the
+             weighted satisfaction of each variant, its change from that of
+             the architecture, and the change of every function whose
+             satisfaction changes, keyed by function id
+
+    """
+    variants = [(frozenset(added), frozenset(removed)) for added, removed in variants]
+    evaluator = get_evaluator(architecture, scenario)
+    with _lock:
+        if weights is None:
+            weights = dict.fromkeys(get_top_functions(evaluator.graph), 1.0)
+        total = sum(weights.values())
+        base = evaluator.values
+        satisfaction = sum(weight * base.get(function, 0.0)
+                           for function, weight in weights.items()) / total if total else 0.0
+
+        system_ids = evaluator.system_ids
+        values = evaluator.evaluate_system_sets(
+            [(system_ids - removed) | added for added, removed in variants])
+        deltas = np.zeros(len(variants))
+        changes = [{} for _ in variants]
+        for node, value in values.items():
+            if node not in evaluator.graph.functions:
+                continue
+            delta = value - base.get(node, 0.0)
+            if total and node in weights:
+                deltas += weights[node] * delta / total
+            for position in np.flatnonzero(np.abs(delta) > evaluator.tolerance):
+                changes[position][node] = float(delta[position])
+
+    return [
+        WhatIf(added, removed, satisfaction + float(delta), float(delta), functions)
+        for (added, removed), delta, functions in zip(variants, deltas, changes)
+    ]
+
+
+def forget_evaluators(project_id=None, architecture_id=None):
+    """Drop the kept evaluators of a project, an architecture, or all of them."""
+    with _lock:
+        for key, evaluator in list(_evaluators.items()):
+            if project_id is not None and evaluator.graph.project_id != project_id:
+                continue
+            if architecture_id is not None and key[0] != architecture_id:
+                continue
+            del _evaluators[key]
+
+
+@receiver(project_changed)
+def update_project_evaluators(sender, project_id, revision, changes, **kwargs):
+    """
+    Bring the evaluators of a project up to date once its changes commit.
+
+    Only the evaluators stamped with the revision before, or already with
+    this one, can catch up, and only with changes that say what they are.
+    The others are dropped and evaluated again when next asked for.
+
+    """
+    with _lock:
+        evaluators = {}
+        for key, evaluator in list(_evaluators.items()):
+            if evaluator.graph.project_id != project_id:
+                continue
+            if None in changes or evaluator.revision not in (revision - 1, revision):
+                del _evaluators[key]
+            else:
+                evaluators[key] = evaluator
+        if not evaluators:
+            return
+
+        voted = set()
+        for model, instance, action in changes:
+            if model is Vote:
+                voted.add(instance.relationship_id)
+            elif issubclass(model, Relationship):
+                if action == DELETED:
+                    discard_relationship_edge(evaluators, instance)
+                elif not update_relationship_edge(evaluators, instance):
+                    break
+            elif model in (Function, System) and action != DELETED:
+                if action == CREATED:
+                    add_node(evaluators, model, instance)
+            elif model is SystemArchitecture.systems.through:
+                update_architecture_systems(evaluators, instance)
+            elif model is SystemArchitecture:
+                if action == DELETED:
+                    for key in [key for key in evaluators if key[0] == instance.pk]:
+                        del evaluators[key], _evaluators[key]
+            elif model in (Term, Project.glossary.through):
+                # The glossary does not enter the evaluation
+                continue
+            else:
+                # Removing nodes, rescaling votes or moving scenarios around
+                # changes too much of the graphs to catch up with
+                break
+        else:
+            update_relationship_weights(evaluators, voted)
+            for evaluator in evaluators.values():
+                evaluator.revision = revision
+            return
+        forget_evaluators(project_id=project_id)
+
+
+def update_relationship_weights(evaluators, relationship_ids):
+    relationship_ids = {
+        relationship_id
+        for relationship_id in relationship_ids
+        for evaluator in evaluators.values()
+        if relationship_id in evaluator.graph.edges
+    }
+    if not relationship_ids:
+        return
+    weights = get_consensus(Vote.objects.filter(relationship__in=relationship_ids))
+    for evaluator in evaluators.values():
+        for relationship_id in relationship_ids & evaluator.graph.edges.keys():
+            evaluator.set_weight(relationship_id, weights.get(relationship_id))
+
+
+def update_relationship_edge(evaluators, instance):
+    """Move the edge of a saved relationship, or return False if that cannot be done."""
+    if type(instance) is Relationship:
+        instance = instance.get_real_instance()
+    weights = None
+    for evaluator in evaluators.values():
+        graph = evaluator.graph
+        old_edge = graph.edges.get(instance.pk)
+        if instance.scenario_id not in graph.depths:
+            evaluator.discard_edge(instance.pk)
+            continue
+        edge = make_edge(instance, graph.depths[instance.scenario_id])
+        if (old_edge is not None and old_edge.kind == SYSTEM_SATISFIES and
+                old_edge.target != edge.target):
+            # The conditions on this satisfaction now point elsewhere too
+            return False
+        if old_edge is None:
+            if weights is None:
+                weights = get_consensus(Vote.objects.filter(relationship=instance.pk))
+            graph.set_weight(instance.pk, weights.get(instance.pk))
+        evaluator.add_edge(instance.pk, edge)
+    return True
+
+
+def discard_relationship_edge(evaluators, instance):
+    for evaluator in evaluators.values():
+        evaluator.discard_edge(instance.pk)
+        evaluator.graph.weights.pop(instance.pk, None)
+
+
+def update_architecture_systems(evaluators, architecture):
+    system_ids = None
+    for (architecture_id, _), evaluator in evaluators.items():
+        if architecture_id == architecture.pk:
+            if system_ids is None:
+                system_ids = list(SystemArchitecture.systems.through.objects
+                                                    .filter(systemarchitecture=architecture_id)
+                                                    .values_list('system', flat=True))
+            evaluator.set_systems(system_ids)
+
+
+def add_node(evaluators, model, instance):
+    for evaluator in evaluators.values():
+        nodes = evaluator.graph.functions if model is Function else evaluator.graph.systems
+        nodes.add(instance.pk)
+        evaluator.restructure({instance.pk})
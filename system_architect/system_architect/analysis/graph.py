@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from collections import defaultdict, namedtuple
+from django.db.models import Q
+from logging import getLogger
+from ..models import (FunctionRequires, FunctionSatisfies, SystemRequires, SystemSatisfies,
+                      SystemSatisfactionRequires, Vote)
+from .consensus import DEFAULT_WEIGHT, get_consensus
+
+
+__all__ = ('Edge', 'SatisfactionGraph', 'FUNCTION_REQUIRES', 'FUNCTION_SATISFIES',
+           'SYSTEM_REQUIRES', 'SYSTEM_SATISFIES', 'SYSTEM_SATISFACTION_REQUIRES',
+           'get_top_functions')
+
+
+logger = getLogger(__name__)
+
+
+FUNCTION_REQUIRES = 'function requires'
+FUNCTION_SATISFIES = 'function satisfies'
+SYSTEM_REQUIRES = 'system requires'
+SYSTEM_SATISFIES = 'system satisfies'
+SYSTEM_SATISFACTION_REQUIRES = 'system satisfaction requires'
+
+
+# The kind of edge and the fields holding its (source, target, via), where the
+# value of the target depends on the value of the source
+RELATIONSHIP_FIELDS = (
+    (FUNCTION_REQUIRES, FunctionRequires, ('required', 'requiring', None)),
+    (FUNCTION_SATISFIES, FunctionSatisfies, ('satisfier', 'satisfied', None)),
+    (SYSTEM_REQUIRES, SystemRequires, ('required', 'requiring', None)),
+    (SYSTEM_SATISFIES, SystemSatisfies, ('satisfier', 'satisfied', None)),
+    (SYSTEM_SATISFACTION_REQUIRES, SystemSatisfactionRequires,
+     ('required', 'relationship__satisfied', 'relationship')),
+)
+
+
+Edge = namedtuple('Edge', ('kind', 'source', 'target', 'via', 'depth'))
+
+
+def get_scenario_depths(scenario=None):
+    """
+    Get how deep in the scenario tree the given scenario and its ancestors are.
+
+    Relationships without a scenario apply everywhere and sit at depth zero.
+
+    """
+    chain = []
+    while scenario is not None and scenario.pk not in chain:
+        chain.append(scenario.pk)
+        scenario = scenario.parent
+    depths = {None: 0}
+    for depth, scenario_id in enumerate(reversed(chain), start=1):
+        depths[scenario_id] = depth
+    return depths
+
+
+def make_edge(relationship, depth):
+    """Make the edge for a concrete relationship instance."""
+    for kind, model, (source, target, via) in RELATIONSHIP_FIELDS:
+        if type(relationship) is model:
+            break
+    else:
+        raise TypeError("Unknown relationship {!r}".format(relationship))
+
+    if kind == SYSTEM_SATISFACTION_REQUIRES:
+        return Edge(kind, relationship.required_id,
+                    relationship.relationship.satisfied_id,
+                    relationship.relationship_id, depth)
+    return Edge(kind, getattr(relationship, source + '_id'),
+                getattr(relationship, target + '_id'), None, depth)
+
+
+class SatisfactionGraph:
+    """
+    The requires/satisfies network of a project as seen under one scenario.
+
+    Functions and systems are the nodes, relationships are the edges. When a
+    relationship with the same end points is stated for several scenarios of
+    the same branch of the scenario tree, only the most specific one is active.
+
+    """
+
+    def __init__(self, project_id, depths):
+        self.project_id = project_id
+        self.depths = depths
+        self.functions = set()
+        self.systems = set()
+        self.edges = {}
+        self.weights = {}
+        self.candidates = defaultdict(dict)
+        self.active = {}
+        self.inputs = defaultdict(set)
+        self.outputs = defaultdict(set)
+        self.conditions = defaultdict(set)
+
+    @classmethod
+    def from_project(cls, project, scenario=None):
+        """Load the graph of a project with one query per relationship type."""
+        graph = cls(project.pk, get_scenario_depths(scenario))
+        graph.functions.update(project.functions.values_list('pk', flat=True))
+        graph.systems.update(project.systems.values_list('pk', flat=True))
+
+        for kind, model, (source, target, via) in RELATIONSHIP_FIELDS:
+            fields = (source, target, via) if via else (source, target)
+            rows = (model.objects
+                    .filter(graph.get_applicable(), project=project)
+                    .values_list('pk', 'scenario', *fields))
+            for pk, scenario_id, source_id, target_id, *via_id in rows:
+                edge = Edge(kind, source_id, target_id, next(iter(via_id), None),
+                            graph.depths[scenario_id])
+                graph.add(pk, edge)
+
+        graph.weights = get_consensus(Vote.objects.filter(
+            graph.get_applicable('relationship__'),
+            relationship__project=project,
+        ))
+        return graph
+
+    def get_applicable(self, prefix=''):
+        """Get the filter for the relationships that apply to this graph's scenario."""
+        scenario_ids = [pk for pk in self.depths if pk is not None]
+        return (Q(**{prefix + 'scenario__in': scenario_ids}) |
+                Q(**{prefix + 'scenario__isnull': True}))
+
+    @property
+    def nodes(self):
+        return self.functions | self.systems
+
+    def get_weight(self, relationship_id):
+        return self.weights.get(relationship_id, DEFAULT_WEIGHT)
+
+    def set_weight(self, relationship_id, weight):
+        """Change the weight of an edge and return the nodes it affects."""
+        if weight is None:
+            self.weights.pop(relationship_id, None)
+        else:
+            self.weights[relationship_id] = weight
+        return self._get_affected(relationship_id)
+
+    def get_dependents(self, node):
+        return {
+            self.edges[relationship_id].target
+            for relationship_id in self.outputs[node]
+        }
+
+    def add(self, relationship_id, edge):
+        """Add an edge and return the nodes whose inputs changed."""
+        self.discard(relationship_id)
+        if edge.kind == SYSTEM_SATISFIES:
+            self.systems.add(edge.source)
+            self.functions.add(edge.target)
+        elif edge.kind == SYSTEM_REQUIRES:
+            self.functions.add(edge.source)
+            self.systems.add(edge.target)
+        else:
+            self.functions.update((edge.source, edge.target))
+
+        self.edges[relationship_id] = edge
+        key = edge[:4]
+        self.candidates[key][relationship_id] = edge.depth
+        return self._resolve(key)
+
+    def discard(self, relationship_id):
+        """Remove an edge if present and return the nodes whose inputs changed."""
+        edge = self.edges.pop(relationship_id, None)
+        if edge is None:
+            return set()
+        key = edge[:4]
+        self.candidates[key].pop(relationship_id, None)
+        if self.active.get(key) != relationship_id:
+            return set()
+        self._deactivate(key, edge, relationship_id)
+        return {edge.target} | self._resolve(key)
+
+    def get_ranks(self):
+        """
+        Rank the nodes so that every node is ranked after the nodes it depends on.
+
+        The nodes of a dependency cycle share the same rank. The members of the
+        cycle each node belongs to, if any, are returned alongside the ranks.
+
+        """
+        index, lowest, stack, on_stack = {}, {}, [], set()
+        components = []
+        for root in self.nodes:
+            if root in index:
+                continue
+            work = [(root, iter(self.get_dependents(root)))]
+            index[root] = lowest[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, dependents = work[-1]
+                for dependent in dependents:
+                    if dependent not in index:
+                        index[dependent] = lowest[dependent] = len(index)
+                        stack.append(dependent)
+                        on_stack.add(dependent)
+                        work.append((dependent, iter(self.get_dependents(dependent))))
+                        break
+                    if dependent in on_stack:
+                        lowest[node] = min(lowest[node], index[dependent])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowest[parent] = min(lowest[parent], lowest[node])
+                    if lowest[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+        # Tarjan's algorithm finds the components in reverse topological order
+        ranks, cycles = {}, {}
+        for rank, component in enumerate(reversed(components)):
+            is_cycle = len(component) > 1 or component[0] in self.get_dependents(component[0])
+            for node in component:
+                ranks[node] = rank
+                if is_cycle:
+                    cycles[node] = component
+        return ranks, cycles
+
+    def _get_affected(self, relationship_id):
+        edge = self.edges.get(relationship_id)
+        if edge is None or self.active.get(edge[:4]) != relationship_id:
+            return set()
+        return {edge.target}
+
+    def _resolve(self, key):
+        candidates = self.candidates[key]
+        current = self.active.get(key)
+        if not candidates:
+            self.candidates.pop(key, None)
+            return set()
+        winner = max(candidates, key=lambda pk: (candidates[pk], str(pk)))
+        if winner == current:
+            return set()
+        if current is not None:
+            self._deactivate(key, self.edges[current], current)
+        edge = self.edges[winner]
+        self.active[key] = winner
+        self.inputs[edge.target].add(winner)
+        self.outputs[edge.source].add(winner)
+        if edge.kind == SYSTEM_SATISFACTION_REQUIRES:
+            self.conditions[edge.via].add(winner)
+        return {edge.target}
+
+    def _deactivate(self, key, edge, relationship_id):
+        del self.active[key]
+        self.inputs[edge.target].discard(relationship_id)
+        self.outputs[edge.source].discard(relationship_id)
+        if edge.kind == SYSTEM_SATISFACTION_REQUIRES:
+            self.conditions[edge.via].discard(relationship_id)
+
+
+def get_top_functions(graph):
+    """Get the functions of a graph that no other function depends on."""
+    function_kinds = (FUNCTION_REQUIRES, FUNCTION_SATISFIES)
+    dependents = {
+        edge.source
+        for relationship_id, edge in graph.edges.items()
+        if edge.kind in function_kinds and graph.active.get(edge[:4]) == relationship_id
+    }
+    return graph.functions - dependents
@@ -0,0 +1,388 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Choosing the systems that best satisfy a project within its resource limits.
+
+The objective is the weighted average satisfaction of the functions of the
+project, its top functions counting equally by default, and every system
+chosen uses up some of each limited resource.
+
+Satisfaction does not add up, since a function is only as satisfied as its
+best satisfier and systems may need each other, so the search has two
+stages. First, each system gets a contribution vector over the functions,
+the most it adds to each on its own or as the last system of the project,
+and the knapsack over the weighted contributions is solved: by dynamic
+programming when a single resource is limited, and by Lagrangian relaxation
+when several are. The vectors are computed once, so that weighting the
+functions differently only costs a matrix product. Then the set found is
+improved by adding and swapping systems. Every possible change is screened
+with the contribution vectors, thousands of them in a few array operations,
+and only the most promising are evaluated exactly, by an incremental
+evaluator that only re-evaluates what the change affects.
+
+"""
+from collections import namedtuple
+from logging import getLogger
+from ..lazy import LazyModule
+from ..models import RESOURCES, System
+from .evaluation import SatisfactionEvaluator
+from .graph import SatisfactionGraph, get_top_functions
+
+
+np = LazyModule('numpy')
+
+
+__all__ = ('ArchitectureOptimizer', 'Optimization', 'optimize_architecture', 'solve_knapsack',
+           'solve_lagrangian')
+
+
+logger = getLogger(__name__)
+
+
+# The number of steps the limit is split into by the dynamic program
+RESOLUTION = 1000
+
+# The most prices the Lagrangian relaxation tries
+ITERATIONS = 200
+
+# The most exact evaluations made while improving the set of systems
+MAX_EVALUATIONS = 20000
+
+TOLERANCE = 1e-9
+
+
+Optimization = namedtuple('Optimization', ('systems', 'satisfaction', 'functions', 'resources',
+                                           'evaluations'))
+
+
+def solve_knapsack(values, costs, limit, resolution=RESOLUTION):
+    """
+    Solve a 0-1 knapsack with a single resource by dynamic programming.
+
+    Costs are rounded up to a step of the limit, so the set found always fits
+    and is optimal up to that rounding. Negative costs count as zero.
+
+    :param values: the value of each item
+    :param costs: the cost of each item
+    :param limit: the most the chosen items may cost together
+    :return: a boolean array of the chosen items
+
+    """
+    values = np.asarray(values, dtype=float)
+    costs = np.maximum(np.asarray(costs, dtype=float), 0.0)
+    scale = resolution / limit if limit > 0 else 0.0
+    steps = np.minimum(np.ceil(costs * scale - TOLERANCE), resolution).astype(int)
+
+    best = np.zeros(resolution + 1)
+    taken = np.zeros((len(values), resolution + 1), dtype=bool)
+    for item in np.flatnonzero((values > 0) & (costs <= limit + TOLERANCE)):
+        step = steps[item]
+        candidates = best[:resolution + 1 - step] + values[item]
+        improved = candidates > best[step:]
+        taken[item, step:] = improved
+        best[step:][improved] = candidates[improved]
+
+    chosen = np.zeros(len(values), dtype=bool)
+    capacity = resolution
+    for item in reversed(range(len(values))):
+        if taken[item, capacity]:
+            chosen[item] = True
+            capacity -= steps[item]
+    return chosen
+
+
+def fit(chosen, values, fractions, order):
+    """
+    Make a set of items fit the limits, then fill it up with what still fits.
+
+    The items dropped first are those worth the least for the resources that
+    are overused, and the items added are tried in the given order.
+
+    """
+    chosen = chosen.copy()
+    load = fractions[chosen].sum(axis=0)
+    while np.any(load > 1.0 + TOLERANCE):
+        overused = load > 1.0 + TOLERANCE
+        positions = np.flatnonzero(chosen)
+        densities = values[positions] / (fractions[positions][:, overused].sum(axis=1) + TOLERANCE)
+        dropped = positions[np.argmin(densities)]
+        chosen[dropped] = False
+        load -= fractions[dropped]
+    for item in order:
+        if not chosen[item] and np.all(load + fractions[item] <= 1.0 + TOLERANCE):
+            chosen[item] = True
+            load += fractions[item]
+    return chosen
+
+
+def solve_lagrangian(values, usage, limits, iterations=ITERATIONS):
+    """
+    Solve a 0-1 knapsack with several resources by Lagrangian relaxation.
+
+    Each resource gets a price, and every item worth more than the resources
+    it uses is taken. The prices of the overused resources are then raised,
+    and those of the resources left over lowered, by shrinking subgradient
+    steps. Every set taken is made to fit the limits, and the best of them is
+    kept. Negative usages count as zero.
+
+    :param values: the value of each item
+    :param usage: an array of how much of each resource each item uses
+    :param limits: the limit of each resource
+    :return: a boolean array of the chosen items
+
+    """
+    values = np.asarray(values, dtype=float)
+    usage = np.maximum(np.asarray(usage, dtype=float), 0.0)
+    limits = np.asarray(limits, dtype=float)
+    allowed = (values > 0) & np.all(usage <= limits + TOLERANCE, axis=1)
+    best = np.zeros(len(values), dtype=bool)
+    if not allowed.any():
+        return best
+
+    # Usages as fractions of the limits, so that prices are comparable
+    fractions = usage / np.maximum(limits, TOLERANCE)
+    fractions[~allowed] = 0.0
+    densities = values / (fractions.sum(axis=1) + TOLERANCE)
+    order = [item for item in np.argsort(-densities, kind='stable') if allowed[item]]
+
+    prices = np.zeros(len(limits))
+    step = values[allowed].max()
+    best_value = 0.0
+    for iteration in range(iterations):
+        relaxed = allowed & (values > fractions @ prices)
+        chosen = fit(relaxed, values, fractions, order)
+        value = values[chosen].sum()
+        if value > best_value:
+            best, best_value = chosen, value
+
+        gradient = fractions[relaxed].sum(axis=0) - 1.0
+        if np.all(gradient <= TOLERANCE) and abs(prices @ gradient) <= TOLERANCE:
+            # The relaxed set fits and uses up every priced resource, so it is optimal
+            break
+        prices = np.maximum(prices + step * gradient / (iteration + 1), 0.0)
+    return best
+
+
+class ArchitectureOptimizer:
+    """
+    Chooses the systems of a project that best satisfy its functions within
+    the limits of its resources.
+
+    :param graph: the ``SatisfactionGraph`` of the project
+    :param resources: the amount of each resource each system uses, as
+                      dictionaries keyed by system id
+    :param limits: the limit of each limited resource
+    :param weights: how much each function counts, keyed by function id,
+                    defaults to the top functions of the graph counting equally
+
+    """
+
+    def __init__(self, graph, resources, limits, weights=None):
+        if weights is None:
+            weights = dict.fromkeys(get_top_functions(graph), 1.0)
+        unknown = set(weights) - graph.functions
+        if unknown:
+            raise ValueError("Unknown functions: {}".format(", ".join(sorted(map(str, unknown)))))
+        if any(weight < 0 for weight in weights.values()) or not sum(weights.values()) > 0:
+            raise ValueError("The weights must not be negative and must add up to more than zero")
+        if any(limit < 0 for limit in limits.values()):
+            raise ValueError("The limits must not be negative")
+
+        self.graph = graph
+        self.systems = sorted(graph.systems, key=str)
+        self.functions = sorted(weights, key=str)
+        self.weights = np.array([weights[function] for function in self.functions], dtype=float)
+        self.weights /= self.weights.sum()
+        self.resources = sorted(limits)
+        self.limits = np.array([limits[resource] for resource in self.resources], dtype=float)
+        self.amounts = {system: resources.get(system, {}) for system in self.systems}
+        self.usage = np.array([
+            [self.amounts[system].get(resource) or 0.0 for resource in self.resources]
+            for system in self.systems
+        ], dtype=float).reshape(len(self.systems), len(self.resources))
+
+        self.evaluator = SatisfactionEvaluator(graph, ())
+        self.evaluations = 0
+        self.cache = {}
+        self.contributions = self.get_contributions()
+
+    def get_satisfactions(self, positions):
+        """Evaluate the satisfaction of each weighted function with the systems at the given positions."""
+        self.evaluator.set_systems(self.systems[position] for position in positions)
+        self.evaluations += 1
+        values = self.evaluator.values
+        return np.array([values.get(function, 0.0) for function in self.functions])
+
+    def evaluate(self, positions):
+        """Get the weighted satisfaction of the systems at the given positions."""
+        positions = frozenset(positions)
+        value = self.cache.get(positions)
+        if value is None:
+            value = self.cache[positions] = float(self.weights @ self.get_satisfactions(positions))
+        return value
+
+    def get_contributions(self):
+        """
+        Get the contribution vector of every system.
+
+        A system contributes to a function the satisfaction it brings on its
+        own, or the satisfaction lost without it when every other system is
+        there, whichever is larger, so that systems that need others count too.
+
+        :return: an array of contributions by system and function position
+
+        """
+        everything = range(len(self.systems))
+        full = self.get_satisfactions(everything)
+        contributions = np.zeros((len(self.systems), len(self.functions)))
+        # Consecutive sets only differ by two systems, so each takes little re-evaluation
+        for position in everything:
+            contributions[position] = full - self.get_satisfactions(
+                other for other in everything if other != position)
+        for position in everything:
+            np.maximum(contributions[position], self.get_satisfactions((position,)),
+                       out=contributions[position])
+        return contributions
+
+    def get_scores(self):
+        return self.contributions @ self.weights
+
+    def get_load(self, positions):
+        return self.usage[sorted(positions)].sum(axis=0)
+
+    def solve_knapsack(self):
+        """Get the positions of the systems whose contributions best fit the limits."""
+        scores = self.get_scores()
+        if not self.resources:
+            chosen = scores > 0
+        elif len(self.resources) == 1:
+            chosen = solve_knapsack(scores, self.usage[:, 0], self.limits[0])
+        else:
+            chosen = solve_lagrangian(scores, self.usage, self.limits)
+        return set(np.flatnonzero(chosen).tolist())
+
+    def get_moves(self, chosen, load):
+        """
+        Get the changes to a set of systems that fit the limits, the most promising first.
+
+        A change adds a system, in place of another or not, and is screened by
+        the weighted satisfaction the set would have if each function were as
+        satisfied as the largest contribution to it, which takes a few array
+        operations rather than an evaluation of the graph.
+
+        :return: a list of (added, removed) positions, removed being None for additions
+
+        """
+        inside = sorted(chosen)
+        removals = [None] + inside
+        contributions = self.contributions
+        coverage = contributions[inside]
+        bases = np.zeros((len(removals), len(self.functions)))
+        if inside:
+            best = coverage.max(axis=0)
+            runner_up = np.sort(coverage, axis=0)[-2] if len(inside) > 1 else np.zeros_like(best)
+            bases[0] = best
+            # Without each system, every function it covered best falls to the runner-up
+            bases[1:] = np.where(coverage.argmax(axis=0) == np.arange(len(inside))[:, None],
+                                 runner_up, best)
+        freed = np.vstack([np.zeros((1, len(self.resources))), self.usage[inside]])
+        ceiling = self.limits + TOLERANCE
+
+        moves = []
+        for added in range(len(self.systems)):
+            if added in chosen:
+                continue
+            fits = np.all(load + self.usage[added] - freed <= ceiling, axis=1)
+            if not fits.any():
+                continue
+            values = np.maximum(bases, contributions[added]) @ self.weights
+            moves.extend((-values[index], len(moves), added, removals[index])
+                         for index in np.flatnonzero(fits))
+        moves.sort(key=lambda move: move[:2])
+        return [(added, removed) for _, _, added, removed in moves]
+
+    def improve(self, chosen, max_evaluations=MAX_EVALUATIONS):
+        """
+        Improve a set of systems by adding and swapping systems until none helps.
+
+        The changes are evaluated exactly from the most promising, and the
+        first one that raises the weighted satisfaction is kept.
+
+        :return: the improved set of positions and its weighted satisfaction
+
+        """
+        budget = self.evaluations + max_evaluations
+        chosen = set(chosen)
+        best = self.evaluate(chosen)
+        improved = True
+        while improved and best < 1.0 - TOLERANCE and self.evaluations < budget:
+            improved = False
+            for added, removed in self.get_moves(chosen, self.get_load(chosen)):
+                candidate = (chosen - {removed}) | {added}
+                value = self.evaluate(candidate)
+                if value > best + TOLERANCE:
+                    chosen, best, improved = candidate, value, True
+                    break
+                if self.evaluations >= budget:
+                    break
+        return chosen, best
+
+    def optimize(self, max_evaluations=MAX_EVALUATIONS):
+        """
+        Find the set of systems that best satisfies the weighted functions within the limits.
+
+        :param max_evaluations: the most exact evaluations made to improve on the knapsack
+        :return: an ``Optimization`` with the ids of the chosen systems, their
+                 weighted satisfaction, the satisfaction of each weighted
+                 function, the total of each resource they use and the number
+                 of exact evaluations made
+
+        """
+        chosen, satisfaction = self.improve(self.solve_knapsack(), max_evaluations)
+        positions = sorted(chosen)
+        satisfactions = self.get_satisfactions(positions)
+        resources = sorted({
+            resource
+            for amounts in self.amounts.values()
+            for resource in amounts
+        } | set(self.resources))
+        logger.debug("Chose %d of %d systems with %d evaluations", len(positions),
+                     len(self.systems), self.evaluations)
+        return Optimization(
+            frozenset(self.systems[position] for position in positions),
+            satisfaction,
+            dict(zip(self.functions, satisfactions.tolist())),
+            {
+                resource: sum(self.amounts[self.systems[position]].get(resource) or 0.0
+                              for position in positions)
+                for resource in resources
+            },
+            self.evaluations,
+        )
+
+
+def optimize_architecture(project, scenario=None, limits=None, weights=None,
+                          max_evaluations=MAX_EVALUATIONS):
+    """
+    Find the systems of a project that best satisfy its functions within its resource limits.
+
+    :param project: the ``Project`` to choose the systems of
+    :param scenario: the scenario to look at the project under
+    :param limits: the limit of each limited resource, defaults to those of the project
+    :param weights: how much each function counts, keyed by function id,
+                    defaults to the top functions counting equally
+    :param max_evaluations: the most exact evaluations made to improve on the knapsack
+    :return: an ``Optimization``
+
+    """
+    if limits is None:
+        limits = project.get_resource_limits()
+    unknown = set(limits) - set(RESOURCES)
+    if unknown:
+        raise ValueError("Unknown resources: {}".format(", ".join(sorted(unknown))))
+    resources = {
+        pk: dict(zip(RESOURCES, amounts))
+        for pk, *amounts in System.objects.filter(project=project).values_list('pk', *RESOURCES)
+    }
+    graph = SatisfactionGraph.from_project(project, scenario)
+    return ArchitectureOptimizer(graph, resources, limits, weights).optimize(max_evaluations)
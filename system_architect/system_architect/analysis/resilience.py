@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Minimal cut sets of system architectures.
+
+A cut set of a function is a set of systems of the architecture whose loss
+pushes the satisfaction of the function below a threshold, and it is minimal
+when losing any smaller part of it does not. Since losing systems can only
+lower satisfaction, the sets are searched by increasing size and any superset
+of a known cut is skipped, so every cut found is minimal. Only the systems
+upstream of a function can be part of its minimal cuts, so the sets are drawn
+from those of each function rather than from the whole architecture.
+
+System sets are integers used as bitsets over the systems of the
+architecture. Each size is evaluated in chunks across a process pool, each
+worker keeping its own evaluator and only re-evaluating what changes from one
+set of systems to the next. The workers are started through
+``processes.call``, so the pool works however its processes are started.
+
+"""
+from collections import namedtuple
+from itertools import combinations
+from logging import getLogger
+from multiprocessing import Pool, cpu_count
+from ..processes import call, prepare_call
+from .evaluation import SatisfactionEvaluator
+from .graph import SatisfactionGraph, get_top_functions
+
+
+__all__ = ('CutSets', 'find_cut_sets')
+
+
+logger = getLogger(__name__)
+
+
+DEFAULT_THRESHOLD = 0.5
+CHUNK_SIZE = 2000
+
+
+CutSets = namedtuple('CutSets', ('function', 'satisfaction', 'cuts'))
+
+
+def get_upstream(graph, function):
+    """Get the nodes whose value the value of a function depends on."""
+    found, stack = set(), [function]
+    while stack:
+        for relationship_id in graph.inputs.get(stack.pop(), ()):
+            source = graph.edges[relationship_id].source
+            if source not in found:
+                found.add(source)
+                stack.append(source)
+    return found
+
+
+def get_candidates(size, upstream, cuts, standing):
+    """Get the sets of systems of a size that may be a minimal cut of a standing function."""
+    candidates = set()
+    for position in standing:
+        for members in combinations(upstream[position], size):
+            bitset = sum(1 << member for member in members)
+            if bitset not in candidates and all(cut & bitset != cut for cut in cuts[position]):
+                candidates.add(bitset)
+    return sorted(candidates)
+
+
+def get_members(bitset, systems):
+    return frozenset(system for position, system in enumerate(systems) if bitset >> position & 1)
+
+
+# The evaluator of each worker process, set up once by ``start_worker``
+_worker = None
+
+
+def start_worker(graph, systems, functions, threshold):
+    global _worker
+    _worker = (SatisfactionEvaluator(graph, systems), systems, functions, threshold)
+
+
+def evaluate_losses(bitsets):
+    """
+    Evaluate the loss of each set of systems with the evaluator of this process.
+
+    :return: a list of (bitset, failures) tuples, the failures being a bitset
+             of the positions of the functions that fall below the threshold
+
+    """
+    evaluator, systems, functions, threshold = _worker
+    results = []
+    for bitset in bitsets:
+        evaluator.set_systems(
+            system for position, system in enumerate(systems) if not bitset >> position & 1)
+        failures = 0
+        for position, function in enumerate(functions):
+            if evaluator.values.get(function, 0.0) < threshold:
+                failures |= 1 << position
+        if failures:
+            results.append((bitset, failures))
+    return results
+
+
+def find_cut_sets(architecture, scenario=None, threshold=DEFAULT_THRESHOLD, max_size=3,
+                  functions=None, processes=None, progress=None):
+    """
+    Find the minimal cut sets of an architecture for each of its top functions.
+
+    :param architecture: the ``SystemArchitecture`` to analyze
+    :param scenario: the scenario to look at the project under
+    :param threshold: the satisfaction below which a function is lost
+    :param max_size: the most systems lost at once
+    :param functions: the ids of the functions to analyze, defaults to the top ones
+    :param processes: the size of the process pool, defaults to the number of
+                      CPUs; with one process the sets are evaluated in this one
+    :param progress: a function called with how far the search is, between 0
+                     and 1, after each chunk of sets evaluated and once done
+    :return: a dictionary of ``CutSets`` keyed by function id, the cuts being a
+             list of frozensets of system ids from the smallest up. A function
+             that is already below the threshold has the empty set as its cut.
+
+    """
+    graph = SatisfactionGraph.from_project(architecture.project, scenario)
+    systems = sorted(set(architecture.systems.values_list('pk', flat=True)) & graph.systems,
+                     key=str)
+    if functions is None:
+        functions = get_top_functions(graph)
+    functions = sorted(functions, key=str)
+
+    start_worker(graph, systems, functions, threshold)
+    baseline = dict(_worker[0].get_function_values())
+    cuts = [[0] if baseline.get(function, 0.0) < threshold else [] for function in functions]
+    # The functions that are still standing with every system in place
+    standing = [position for position, function_cuts in enumerate(cuts) if not function_cuts]
+    positions = {system: position for position, system in enumerate(systems)}
+    upstream = [
+        sorted(positions[node] for node in get_upstream(graph, function) if node in positions)
+        for function in functions
+    ]
+
+    processes = processes or cpu_count()
+    sizes = min(max_size, len(systems))
+    pool = None
+    try:
+        for size in range(1, sizes + 1):
+            candidates = get_candidates(size, upstream, cuts, standing)
+            if not candidates:
+                break
+            chunks = [candidates[start:start + CHUNK_SIZE]
+                      for start in range(0, len(candidates), CHUNK_SIZE)]
+            if processes > 1 and len(chunks) > 1:
+                if pool is None:
+                    pool = Pool(processes, call,
+                                prepare_call(start_worker, graph, systems, functions, threshold))
+                results = pool.imap(evaluate_losses, chunks)
+            else:
+                results = map(evaluate_losses, chunks)
+
+            found = 0
+            for done, chunk in enumerate(results, 1):
+                for bitset, failures in chunk:
+                    for position in standing:
+                        if failures >> position & 1 and all(cut & bitset != cut
+                                                            for cut in cuts[position]):
+                            cuts[position].append(bitset)
+                            found += 1
+                if progress is not None:
+                    # Reported between chunks, so that a cancelled job stops there
+                    progress((size - 1 + done / len(chunks)) / sizes)
+            logger.debug("Evaluated %d losses of %d systems, %d minimal cuts",
+                         len(candidates), size, found)
+        if progress is not None:
+            # Also when no larger set could cut a standing function
+            progress(1.0)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return {
+        function: CutSets(function, baseline.get(function, 0.0),
+                          [get_members(bitset, systems) for bitset in cuts[position]])
+        for position, function in enumerate(functions)
+    }
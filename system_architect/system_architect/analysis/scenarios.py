@@ -0,0 +1,351 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Scoring architectures across the whole scenario tree of a project.
+
+Each scenario sees the relationships stated without a scenario, those of its
+ancestors and its own, the most specific statement of a relationship
+overriding the broader ones. Rather than loading and evaluating one graph
+per scenario, the relationships of the project are loaded once and the tree
+is walked once, each scenario inheriting the relationships in force in its
+parent. Every edge then gets an array of its weight in each scenario, and
+the nodes are evaluated in dependency order for every scenario and
+architecture at once.
+
+The score of an architecture in a scenario is the average satisfaction of
+the top functions, and its aggregate score is the average of those weighted
+by the weights of the scenarios, each taken with one matrix product. The
+satisfaction of every function in every scenario is kept for each
+architecture until its project moves past the revision it was worked out
+from, see system_architect/revisions.py.
+
+"""
+from collections import OrderedDict, defaultdict, namedtuple
+from logging import getLogger
+from threading import RLock
+from ..lazy import LazyModule
+from ..models import Scenario, SystemArchitecture, Vote
+from ..revisions import get_revision
+from .consensus import DEFAULT_WEIGHT, get_consensus
+from .graph import (FUNCTION_REQUIRES, FUNCTION_SATISFIES, RELATIONSHIP_FIELDS,
+                    SYSTEM_SATISFACTION_REQUIRES, SYSTEM_SATISFIES, Edge, SatisfactionGraph,
+                    get_top_functions)
+
+
+np = LazyModule('numpy')
+
+
+__all__ = ('ScenarioGraph', 'ScenarioScores', 'evaluate_scenarios', 'forget_scenario_scores',
+           'score_architectures')
+
+
+logger = getLogger(__name__)
+
+
+TOLERANCE = 1e-9
+
+# The most times the members of a dependency cycle are evaluated together
+MAX_CYCLE_ITERATIONS = 1000
+
+# The most scenario graphs and architecture satisfactions kept, the least
+# recently used being dropped beyond them
+MAX_GRAPHS = 16
+MAX_ARCHITECTURES = 256
+
+
+ScenarioScores = namedtuple('ScenarioScores', ('satisfaction', 'scenarios', 'functions'))
+
+
+class ScenarioGraph:
+    """
+    The requires/satisfies network of a project under all its scenarios at once.
+
+    The columns are the project as seen without a scenario, then every
+    scenario, parents before their children. A scenario whose ancestry loops
+    is looked at as if it had no parent.
+
+    """
+
+    def __init__(self, project):
+        self.project_id = project.pk
+        self.functions = sorted(project.functions.values_list('pk', flat=True), key=str)
+        self.systems = set(project.systems.values_list('pk', flat=True))
+
+        # Every relationship, and the one stated for each scenario and end points
+        union = SatisfactionGraph(project.pk, {})
+        union.functions.update(self.functions)
+        union.systems.update(self.systems)
+        stated = defaultdict(dict)
+        for kind, model, (source, target, via) in RELATIONSHIP_FIELDS:
+            fields = (source, target, via) if via else (source, target)
+            rows = (model.objects
+                         .filter(project=project)
+                         .values_list('pk', 'scenario', *fields))
+            for pk, scenario_id, source_id, target_id, *via_id in rows:
+                edge = Edge(kind, source_id, target_id, next(iter(via_id), None), 0)
+                union.add(pk, edge)
+                key = edge[:4]
+                # Like ``SatisfactionGraph``, the largest id wins among equally specific ones
+                current = stated[scenario_id].get(key)
+                if current is None or str(pk) > str(current):
+                    stated[scenario_id][key] = pk
+        self.relationship_ids = frozenset(union.edges)
+        self.ranks, self.cycles = union.get_ranks()
+        self.top_functions = get_top_functions(union)
+
+        self.scenarios, self.weights = [None], [0.0]
+        in_force = [dict(stated[None])]
+        scenarios = {
+            pk: (parent, weight)
+            for pk, parent, weight in (Scenario.objects
+                                               .filter(project=project)
+                                               .order_by('name')
+                                               .values_list('pk', 'parent', 'weight'))
+        }
+        children = defaultdict(list)
+        for pk, (parent, _) in scenarios.items():
+            children[parent if parent in scenarios else None].append(pk)
+        stack, visited = [(pk, 0) for pk in reversed(children[None])], set()
+        while stack or len(visited) < len(scenarios):
+            if not stack:
+                # Only scenarios whose ancestry loops are left
+                stack = [(min(set(scenarios) - visited, key=str), 0)]
+            pk, parent_column = stack.pop()
+            relationships = dict(in_force[parent_column])
+            relationships.update(stated[pk])
+            visited.add(pk)
+            self.scenarios.append(pk)
+            self.weights.append(scenarios[pk][1])
+            in_force.append(relationships)
+            column = len(self.scenarios) - 1
+            stack.extend((child, column) for child in reversed(children[pk])
+                         if child not in visited)
+
+        # Without scenario weights, the project without a scenario is all that counts
+        self.weights = np.maximum(np.array(self.weights, dtype=float), 0.0)
+        if not self.weights.sum() > 0:
+            self.weights[0] = 1.0
+        self.weights /= self.weights.sum()
+
+        consensus = get_consensus(Vote.objects.filter(relationship__project=project))
+        self.inputs = self.get_inputs(union.edges, in_force, consensus)
+
+    def get_inputs(self, edges, in_force, consensus):
+        """
+        Get the weight of every edge in each scenario, grouped by the node it leads to.
+
+        An edge weighs zero where it is not in force, and its mask tells it apart
+        from an edge in force that weighs zero. The conditions on a system
+        satisfying a function are attached to the satisfaction they are stated
+        on, so they only hold where that very relationship is in force.
+
+        :return: a dictionary of lists of (kind, source, weights, mask,
+                 conditions) tuples, keyed by node
+
+        """
+        size = len(self.scenarios)
+        columns = defaultdict(lambda: [None] * size)
+        for column, relationships in enumerate(in_force):
+            for key, pk in relationships.items():
+                columns[key][column] = pk
+
+        def get_weights(pks):
+            mask = np.array([pk is not None for pk in pks])
+            weights = np.array([
+                consensus.get(pk, DEFAULT_WEIGHT) if pk is not None else 0.0
+                for pk in pks
+            ])
+            return weights, mask
+
+        conditions = defaultdict(list)
+        for key, pks in columns.items():
+            kind, source, target, via = key
+            if kind != SYSTEM_SATISFACTION_REQUIRES:
+                continue
+            satisfaction = edges[via][:4]
+            satisfactions = columns.get(satisfaction, [None] * size)
+            stated_on = [pk if pk is not None and satisfactions[column] == via else None
+                         for column, pk in enumerate(pks)]
+            conditions[satisfaction].append((source,) + get_weights(stated_on))
+
+        inputs = defaultdict(list)
+        for key, pks in columns.items():
+            kind, source, target, _ = key
+            if kind != SYSTEM_SATISFACTION_REQUIRES:
+                inputs[target].append((kind, source) + get_weights(pks) + (conditions[key],))
+        return inputs
+
+    def evaluate(self, system_sets):
+        """
+        Evaluate every node for several sets of systems under every scenario at once.
+
+        :param system_sets: a list of sets of system ids
+        :return: a dictionary of arrays of values by set and column, keyed by node
+
+        """
+        shape = (len(system_sets), len(self.scenarios))
+        presence = {
+            system: np.array([[system in system_ids] for system_ids in system_sets], dtype=float)
+            for system in self.systems
+        }
+        values = {}
+        nodes = sorted(self.ranks, key=lambda node: self.ranks[node])
+        for node in nodes:
+            if node in values:
+                continue
+            cycle = self.cycles.get(node)
+            if cycle is None:
+                values[node] = self.evaluate_node(node, values, presence, shape)
+                continue
+            # Like ``SatisfactionEvaluator``, a cycle cannot support itself
+            for member in cycle:
+                values[member] = np.zeros(shape)
+            for _ in range(MAX_CYCLE_ITERATIONS):
+                change = 0.0
+                for member in cycle:
+                    value = self.evaluate_node(member, values, presence, shape)
+                    change = max(change, np.abs(value - values[member]).max())
+                    values[member] = value
+                if change <= TOLERANCE:
+                    break
+        return values
+
+    def evaluate_node(self, node, values, presence, shape):
+        """Evaluate a node like ``SatisfactionEvaluator.evaluate``, for every set and scenario."""
+        def get_shortfall(requirements):
+            shortfall = 0.0
+            for source, weights, mask in requirements:
+                shortfall = np.maximum(shortfall, weights * (1.0 - values.get(source, 0.0)))
+            return shortfall
+
+        if node in self.systems:
+            requirements = [(source, weights, mask)
+                            for _, source, weights, mask, _ in self.inputs[node]]
+            return np.broadcast_to(presence[node] * (1.0 - get_shortfall(requirements)), shape)
+
+        supply, shortfall, supplied, decomposed = 0.0, 0.0, False, False
+        for kind, source, weights, mask, conditions in self.inputs[node]:
+            if kind == FUNCTION_REQUIRES:
+                decomposed = decomposed | mask
+                shortfall = np.maximum(shortfall, weights * (1.0 - values.get(source, 0.0)))
+            elif kind == FUNCTION_SATISFIES:
+                supplied = supplied | mask
+                supply = np.maximum(supply, weights * values.get(source, 0.0))
+            elif kind == SYSTEM_SATISFIES:
+                supplied = supplied | mask
+                supply = np.maximum(supply, weights * values.get(source, 0.0) *
+                                    (1.0 - get_shortfall(conditions)))
+        supply = np.where(supplied, supply, np.where(decomposed, 1.0, 0.0))
+        return np.broadcast_to(supply * (1.0 - shortfall), shape)
+
+
+_lock = RLock()
+# The scenario graph of each project, with the revision of the project it
+# was loaded from, the least recently used first
+_graphs = OrderedDict()
+# The satisfaction of every function of the scenario graph by column, by architecture id
+_satisfactions = OrderedDict()
+
+
+def get_scenario_graph(project):
+    """
+    Get the scenario graph of a project, kept until the project moves past its revision.
+
+    :return: the graph and whether it was kept, a graph loaded from
+             uncommitted changes not being kept
+
+    """
+    revision = get_revision(project.pk)
+    with _lock:
+        kept = _graphs.get(project.pk)
+        if kept is not None and kept[0] == revision:
+            _graphs.move_to_end(project.pk)
+            return kept[1], True
+        graph = ScenarioGraph(project)
+        if revision is None:
+            return graph, False
+        _graphs[project.pk] = (revision, graph)
+        while len(_graphs) > MAX_GRAPHS:
+            _graphs.popitem(last=False)
+        return graph, True
+
+
+def score_architectures(architectures):
+    """
+    Score architectures under every scenario of their projects and across them.
+
+    The architectures not kept yet are evaluated together, in one pass over
+    the scenario graph of each project.
+
+    :param architectures: the ``SystemArchitecture`` instances to score
+    :return: a dictionary of ``ScenarioScores`` keyed by architecture id, with
+             the aggregate satisfaction, the satisfaction under each scenario
+             keyed by scenario id, ``None`` standing for no scenario, and the
+             aggregate satisfaction of every function keyed by function id
+
+    """
+    projects = defaultdict(list)
+    for architecture in architectures:
+        projects[architecture.project_id].append(architecture)
+
+    scores = {}
+    with _lock:
+        for project_architectures in projects.values():
+            graph, keep = get_scenario_graph(project_architectures[0].project)
+            satisfactions = {
+                architecture.pk: _satisfactions[architecture.pk][1]
+                for architecture in project_architectures
+                if _satisfactions.get(architecture.pk, (None,))[0] is graph
+            }
+            missing = [architecture.pk for architecture in project_architectures
+                       if architecture.pk not in satisfactions]
+            if missing:
+                system_sets = {pk: set() for pk in missing}
+                rows = (SystemArchitecture.systems.through.objects
+                                          .filter(systemarchitecture__in=missing)
+                                          .values_list('systemarchitecture', 'system'))
+                for architecture_id, system_id in rows:
+                    system_sets[architecture_id].add(system_id)
+                values = graph.evaluate([system_sets[pk] for pk in missing])
+                for position, pk in enumerate(missing):
+                    satisfactions[pk] = np.array([
+                        values[function][position] for function in graph.functions
+                    ]).reshape(len(graph.functions), len(graph.scenarios))
+                    if keep:
+                        _satisfactions[pk] = (graph, satisfactions[pk])
+
+            for architecture in project_architectures:
+                if keep:
+                    _satisfactions.move_to_end(architecture.pk)
+                satisfaction = satisfactions[architecture.pk]
+                top = np.array([function in graph.top_functions for function in graph.functions])
+                by_scenario = satisfaction[top].mean(axis=0) if top.any() else np.zeros(
+                    len(graph.scenarios))
+                scores[architecture.pk] = ScenarioScores(
+                    float(by_scenario @ graph.weights),
+                    dict(zip(graph.scenarios, by_scenario.tolist())),
+                    dict(zip(graph.functions, (satisfaction @ graph.weights).tolist())),
+                )
+        while len(_satisfactions) > MAX_ARCHITECTURES:
+            _satisfactions.popitem(last=False)
+    return scores
+
+
+def evaluate_scenarios(architecture):
+    """Score an architecture under every scenario of its project and across them."""
+    return score_architectures([architecture])[architecture.pk]
+
+
+def forget_scenario_scores(project_id=None, architecture_id=None):
+    """Forget the kept scores of a project, an architecture, or all of them."""
+    with _lock:
+        for pk, (graph, _) in list(_satisfactions.items()):
+            if project_id is not None and graph.project_id != project_id:
+                continue
+            if architecture_id is not None and pk != architecture_id:
+                continue
+            del _satisfactions[pk]
+        if architecture_id is None:
+            for pk in list(_graphs):
+                if project_id is None or pk == project_id:
+                    del _graphs[pk]
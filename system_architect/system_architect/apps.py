@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SystemArchitectConfig(AppConfig):
     name = 'system_architect'
     verbose_name = 'System Architect'
+
+    def ready(self):
+        # Connect the signal receivers that keep the analyses and index up to date
+        # and watching clients, and that tune new database connections
+        from . import analysis, archive, database, events, glossary, revisions, search  # noqa: F401
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Archival of the votes that have been superseded by newer ones.
+
+Every revote adds a row and the analyses only count the latest vote of each
+expert, so the superseded votes cast before a horizon are moved to the vote
+history in short chunks. The ``VoteRecord`` view over the votes and their
+history keeps answering what the experts thought at any point in time.
+
+"""
+from django.db import connection, models
+from django.db.models.sql import DeleteQuery
+from django.dispatch import receiver
+from logging import getLogger
+from .analysis import get_latest_votes
+from .database import write_transaction
+from .models import Vote, VoteHistory, VoteRecord
+
+
+__all__ = ('archive_votes', 'create_vote_record_view', 'get_votes_as_of')
+
+
+logger = getLogger(__name__)
+
+
+def create_vote_record_view():
+    """Create the view over the current and archived votes."""
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(
+        quote_name(field.column)
+        for field in VoteRecord._meta.concrete_fields
+    )
+    if connection.vendor == 'sqlite':
+        create = "CREATE VIEW IF NOT EXISTS"
+    else:
+        create = "CREATE OR REPLACE VIEW"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "{create} {view} AS SELECT {columns} FROM {votes} "
+            "UNION ALL SELECT {columns} FROM {history}".format(
+                create=create,
+                view=quote_name(VoteRecord._meta.db_table),
+                columns=columns,
+                votes=quote_name(Vote._meta.db_table),
+                history=quote_name(VoteHistory._meta.db_table),
+            )
+        )
+
+
+def get_superseded(pks):
+    """Get which of the given votes have a newer one from the same expert."""
+    relationships = Vote.objects.filter(pk__in=pks).values('relationship')
+    latest = set(get_latest_votes(Vote.objects.filter(relationship__in=relationships))
+                 .values_list('pk', flat=True))
+    return [pk for pk in pks if pk not in latest]
+
+
+def archive_votes(horizon, chunk_size=500):
+    """
+    Move the superseded votes cast before a horizon to the vote history.
+
+    The votes are walked in the order of their primary key, and each chunk is
+    copied and deleted in its own short write transaction, so voting carries
+    on while the archive runs. Deleting without signals is safe since only
+    superseded votes are moved and the consensus does not change.
+
+    :param horizon: the datetime before which superseded votes are archived
+    :param chunk_size: how many votes to look at per transaction
+    :return: the number of votes archived
+
+    """
+    fields = VoteHistory._meta.concrete_fields
+    archived, last_pk = 0, 0
+    while True:
+        pks = list(Vote.objects
+                       .filter(cast_on__lt=horizon, pk__gt=last_pk)
+                       .order_by('pk')
+                       .values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        last_pk = pks[-1]
+
+        with write_transaction():
+            superseded = get_superseded(pks)
+            if not superseded:
+                continue
+            rows = (Vote.objects
+                        .filter(pk__in=superseded)
+                        .values_list(*(field.name for field in fields)))
+            VoteHistory.objects.bulk_create(
+                VoteHistory(**{field.attname: value for field, value in zip(fields, row)})
+                for row in rows
+            )
+            DeleteQuery(Vote).delete_batch(superseded, connection.alias)
+        archived += len(superseded)
+        logger.debug("Archived %d votes", archived)
+
+    return archived
+
+
+def get_votes_as_of(moment, records=None):
+    """
+    Get the latest vote of each expert at some point in time.
+
+    The consensus at that time is ``get_consensus`` of the records cast up
+    to it, since it only counts the latest vote of each expert itself.
+
+    :param moment: the datetime to look back to
+    :param records: a queryset of vote records, defaults to all of them
+    :return: a queryset of vote records
+
+    """
+    if records is None:
+        records = VoteRecord.objects.all()
+    return get_latest_votes(records.filter(cast_on__lte=moment))
+
+
+@receiver(models.signals.post_migrate)
+def create_vote_records(sender, **kwargs):
+    if sender.name == 'system_architect':
+        create_vote_record_view()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tuning of SQLite for many experts voting at the same time.
+
+By default SQLite locks the whole database while a transaction writes, so
+readers block writers and concurrent votes fail with "database is locked"
+once the busy timeout runs out. Setting ``SQLITE_PROFILE = 'concurrent'``
+applies pragmas on every new connection that let readers and a writer work at
+the same time and make writers wait for each other instead of failing.
+
+It also gathers what the transactions change, for whatever is kept in memory
+to catch up with once they commit.
+
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from logging import getLogger
+
+
+__all__ = ('SQLITE_PROFILES', 'apply_pragmas', 'get_pending_items', 'on_commit_with',
+           'write_transaction')
+
+
+logger = getLogger(__name__)
+
+
+SQLITE_PROFILES = {
+    # What SQLite and its Python driver use out of the box
+    'default': OrderedDict((
+        ('journal_mode', 'DELETE'),
+        ('synchronous', 'FULL'),
+        ('busy_timeout', 5000),
+        ('mmap_size', 0),
+        ('cache_size', -2000),
+    )),
+    # Write-ahead logging lets readers carry on while one connection writes,
+    # and only needs to sync the log at checkpoints to stay consistent
+    'concurrent': OrderedDict((
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', 20000),
+        ('mmap_size', 256 * 1024 * 1024),
+        ('cache_size', -64 * 1024),
+    )),
+}
+
+
+def apply_pragmas(connection, pragmas):
+    """Set the given pragmas on a SQLite connection."""
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    Run a block in a transaction that takes the write lock as it begins.
+
+    SQLite transactions are deferred, so one that reads before it writes
+    fails at once, without waiting, if another connection wrote in between.
+    Taking the lock up front makes concurrent writers queue up instead, so
+    the block should only hold the writes.
+
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'sqlite' and not connection.connection.in_transaction:
+            with connection.cursor() as cursor:
+                cursor.execute("BEGIN IMMEDIATE")
+        yield
+
+
+class Batch(list):
+    """The items gathered for a function until the transaction commits."""
+
+    def __init__(self, function):
+        super().__init__()
+        self.function = function
+
+    def __call__(self):
+        self.function(self)
+
+
+def on_commit_with(function, item, using=None):
+    """
+    Call a function with an item once the current transaction commits.
+
+    The items given for the same function in the same transaction are passed
+    to it together, as a list, in a single call, and dropped with the
+    savepoint or transaction they were given in if it rolls back. Outside of
+    a transaction the function is called right away.
+
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        function([item])
+        return
+    savepoint_ids = set(connection.savepoint_ids)
+    for sids, batch in connection.run_on_commit:
+        if sids == savepoint_ids and isinstance(batch, Batch) and batch.function == function:
+            break
+    else:
+        batch = Batch(function)
+        connection.on_commit(batch)
+    batch.append(item)
+
+
+def get_pending_items(function, using=None):
+    """Get the items waiting in the current transaction to be passed to a function."""
+    connection = transaction.get_connection(using)
+    return [
+        item
+        for _, batch in connection.run_on_commit
+        if isinstance(batch, Batch) and batch.function == function
+        for item in batch
+    ]
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    profile = getattr(settings, 'SQLITE_PROFILE', None)
+    if connection.vendor == 'sqlite' and profile:
+        if profile not in SQLITE_PROFILES:
+            raise ImproperlyConfigured("Unknown SQLITE_PROFILE '{}'".format(profile))
+        apply_pragmas(connection, SQLITE_PROFILES[profile])
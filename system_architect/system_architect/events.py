@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Pushing consensus and architecture changes to the clients watching a project.
+
+When a transaction that changed a project commits, ``project_changed`` tells
+which votes changed, and the consensus of their relationships and the
+evaluation of the architectures of the project are worked out once and
+published to a ``Broadcaster`` that every client watching the project waits
+on. Watching clients thus cost no queries of their own, nothing is worked out
+for projects nobody watches, and nothing is published for rolled back votes.
+The bulk writes of matrices, merges and credibility updates do not tell which
+votes changed, so the consensus of every relationship of the project is
+compared to the published one instead. Cloned projects are new, so nobody
+watches them yet. The changes of a project are worked out and published
+under a lock of its own, also held while a new watcher loads what they are
+compared to, so transactions committing at once publish their deltas in
+order and from one another's.
+
+The broadcaster lives in the process, so clients only hear about the votes
+saved by the same server process; deployments with several processes should
+route the clients of a workshop and its votes to the same one.
+
+"""
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
+from django.dispatch import receiver
+from json import dumps
+from logging import getLogger
+from threading import Condition, RLock
+from time import monotonic
+from .analysis import evaluate_architecture, get_consensus
+from .models import SystemArchitecture, Vote
+from .revisions import project_changed
+
+
+__all__ = ('Broadcaster', 'Event', 'broadcaster', 'format_event', 'stream_events', 'watch')
+
+
+logger = getLogger(__name__)
+
+
+# How many events are kept for the clients that reconnect
+HISTORY_SIZE = 1000
+
+# How long a project counts as watched after its last client left, so that
+# long polling clients do not miss the votes cast between their requests
+WATCH_GRACE = 60.0
+
+# Changes smaller than this are not worth telling anyone about
+TOLERANCE = 1e-9
+
+
+Event = namedtuple('Event', ('id', 'project_id', 'kind', 'data'))
+
+
+class Broadcaster:
+    """
+    Hands the events of each project to every client waiting for them.
+
+    Events get increasing ids, and the latest ones are kept so that clients
+    can pick up where they left off. A client that fell further behind is
+    sent a ``reset`` event, telling it to load the project again.
+
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE, watch_grace=WATCH_GRACE):
+        self.condition = Condition()
+        self.history = deque(maxlen=history_size)
+        self.last_id = 0
+        self.watch_grace = watch_grace
+        # The number of connected clients, and when the last one left, by project id
+        self.listeners = Counter()
+        self.left_on = {}
+        # The last published consensus by relationship id, and satisfactions
+        # by (architecture id, function id), of every watched project. They
+        # go stale while nobody watches, so they are then forgotten.
+        self.consensus = {}
+        self.satisfaction = {}
+        # The lock held while those of a project are loaded, compared or
+        # updated, by project id
+        self.locks = {}
+
+    @contextmanager
+    def listen(self, project_id):
+        """Count a client as watching a project while in the block."""
+        with self.condition:
+            self.listeners[project_id] += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.listeners[project_id] -= 1
+                if not self.listeners[project_id]:
+                    del self.listeners[project_id]
+                    self.left_on[project_id] = monotonic()
+
+    def get_lock(self, project_id):
+        """Get the lock that keeps the changes of a project from being published out of order."""
+        with self.condition:
+            return self.locks.setdefault(project_id, RLock())
+
+    def is_watched(self, project_id):
+        with self.condition:
+            if self.listeners[project_id]:
+                return True
+            left_on = self.left_on.get(project_id)
+            if left_on is not None and monotonic() - left_on < self.watch_grace:
+                return True
+            self.left_on.pop(project_id, None)
+            self.consensus.pop(project_id, None)
+            self.satisfaction.pop(project_id, None)
+            return False
+
+    def publish(self, project_id, kind, data):
+        with self.condition:
+            self.last_id += 1
+            self.history.append(Event(self.last_id, project_id, kind, data))
+            self.condition.notify_all()
+
+    def get_events(self, project_id, after, timeout=0.0):
+        """
+        Get the events of a project published after an event.
+
+        :param after: the id of the last event the client has seen
+        :param timeout: the seconds to wait for an event if there is none yet
+        :return: a list of events, empty if none came in time
+
+        """
+        deadline = monotonic() + timeout
+        with self.condition:
+            while True:
+                if self.history and after < self.history[0].id - 1:
+                    # The events the client missed are no longer kept
+                    return [Event(self.last_id, project_id, 'reset', {})]
+                events = [
+                    event
+                    for event in self.history
+                    if event.id > after and event.project_id == project_id
+                ]
+                remaining = deadline - monotonic()
+                if events or remaining <= 0:
+                    return events
+                self.condition.wait(remaining)
+
+
+broadcaster = Broadcaster()
+
+
+@contextmanager
+def watch(project_id):
+    """Watch a project in the block, loading what its changes are compared to if need be."""
+    fresh = not broadcaster.is_watched(project_id)
+    with broadcaster.listen(project_id):
+        if fresh:
+            with broadcaster.get_lock(project_id):
+                broadcaster.consensus[project_id] = get_consensus(
+                    Vote.objects.filter(relationship__project=project_id))
+                broadcaster.satisfaction[project_id] = {
+                    (architecture.pk, function_id): value
+                    for architecture in SystemArchitecture.objects.filter(project=project_id)
+                    for function_id, value in evaluate_architecture(architecture).items()
+                }
+        yield
+
+
+def format_event(event):
+    """Format an event as a server-sent event."""
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event.id, event.kind, dumps(event.data))
+
+
+def stream_events(project_id, after, duration=300.0, keepalive=15.0):
+    """
+    Yield the events of a project as server-sent events as they are published.
+
+    The stream ends after a while, and the client reconnects with the id of
+    the last event it got, so that server threads are eventually released.
+
+    """
+    deadline = monotonic() + duration
+    with watch(project_id):
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            events = broadcaster.get_events(project_id, after, min(keepalive, remaining))
+            if not events:
+                # Comments keep proxies from closing idle connections
+                yield ': keepalive\n\n'
+            for event in events:
+                after = event.id
+                yield format_event(event)
+
+
+def publish_consensus(project_id, relationship_ids=None):
+    """Publish the consensus of the relationships that changed, by default of the whole project."""
+    published = broadcaster.consensus.setdefault(project_id, {})
+    if relationship_ids is None:
+        consensus = get_consensus(Vote.objects.filter(relationship__project=project_id))
+        relationship_ids = set(consensus) | {pk for pk, value in published.items()
+                                             if value is not None}
+    else:
+        consensus = get_consensus(Vote.objects.filter(relationship__in=relationship_ids))
+    for relationship_id in sorted(relationship_ids):
+        value = consensus.get(relationship_id)
+        previous = published.get(relationship_id)
+        if value is not None and previous is not None and abs(value - previous) < TOLERANCE:
+            continue
+        published[relationship_id] = value
+        broadcaster.publish(project_id, 'consensus', {
+            'relationship': relationship_id,
+            'consensus': value,
+            'previous': previous,
+            'delta': None if value is None or previous is None else value - previous,
+        })
+
+
+def publish_satisfaction(project_id):
+    published = broadcaster.satisfaction.setdefault(project_id, {})
+    for architecture in SystemArchitecture.objects.filter(project=project_id):
+        changes = {}
+        for function_id, value in evaluate_architecture(architecture).items():
+            key = (architecture.pk, function_id)
+            previous = published.get(key)
+            published[key] = value
+            if previous is not None and abs(value - previous) >= TOLERANCE:
+                changes[str(function_id)] = {'satisfaction': value, 'delta': value - previous}
+        if changes:
+            broadcaster.publish(project_id, 'architecture', {
+                'architecture': str(architecture.pk),
+                'functions': changes,
+            })
+
+
+@receiver(project_changed)
+def publish_changes(sender, project_id, changes, **kwargs):
+    if not broadcaster.is_watched(project_id):
+        return
+    if None in changes:
+        relationship_ids = None
+    else:
+        relationship_ids = {change.instance.relationship_id
+                            for change in changes if change.model is Vote}
+    try:
+        # Changes committing at once are worked out and published one after
+        # the other, each from what the other published
+        with broadcaster.get_lock(project_id):
+            if relationship_ids is None or relationship_ids:
+                publish_consensus(project_id, relationship_ids)
+            publish_satisfaction(project_id)
+    except Exception:
+        # The changes are saved anyway, the watching clients just miss them
+        logger.exception("Could not publish the changes to %s", project_id)
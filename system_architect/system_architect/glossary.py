@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Linking the functions, systems and goals of a project to the glossary terms they mention.
+
+The names of the terms in the glossary of a project are compiled into an
+Aho-Corasick automaton, which finds every term in a text in a single pass
+over it, however many terms there are. Terms match whole words, regardless of
+case and punctuation. The automaton is kept until the project moves past the
+revision it was compiled at, which a change to a term or to the glossary
+bumps.
+
+Linking a project scans the names and descriptions of its entities once per
+table and bulk inserts the links that are missing. Saving an entity adds the
+links it is missing on its own, and the admin does so once it has saved the
+many-to-many fields of its forms, which would otherwise set the links back to
+those picked in the form. Links are only ever added when saving, so those
+picked by hand are kept, and the links to terms that are no longer mentioned
+are only removed by ``link_terms`` with ``replace``, e.g. by
+``manage.py link_terms --replace``.
+
+"""
+from collections import OrderedDict, deque
+from django.db import models, transaction
+from django.dispatch import receiver
+from logging import getLogger
+from re import UNICODE, findall
+from threading import RLock
+from .models import Function, Goal, System, Term
+from .revisions import get_revision
+
+
+__all__ = ('LINKED_FIELDS', 'TermMatcher', 'forget_matchers', 'get_matcher', 'link_entity_terms',
+           'link_terms')
+
+
+logger = getLogger(__name__)
+
+
+# The models whose entities are linked to terms, and the fields mentioning them
+LINKED_FIELDS = (
+    (Function, ('name', 'description')),
+    (System, ('name', 'description')),
+    (Goal, ('name', 'description', 'body')),
+)
+
+# The most matchers kept at once
+MAX_MATCHERS = 64
+
+
+class TermMatcher:
+    """
+    An Aho-Corasick automaton over the names of some terms.
+
+    Texts and names are split into lower case words and the automaton steps
+    over words rather than characters, so terms only match whole words and
+    the words are split by the regular expression engine rather than in
+    Python.
+
+    """
+
+    def __init__(self, terms):
+        """
+        :param terms: an iterable of (term id, name) tuples
+
+        """
+        self.transitions = [{}]
+        self.failures = [0]
+        # The ids of the terms ending at each state
+        self.outputs = [()]
+        for term_id, name in terms:
+            words = get_words(name)
+            if words:
+                self.add(words, term_id)
+        self.compile()
+
+    def add(self, words, term_id):
+        state = 0
+        for word in words:
+            following = self.transitions[state].get(word)
+            if following is None:
+                following = len(self.transitions)
+                self.transitions[state][word] = following
+                self.transitions.append({})
+                self.failures.append(0)
+                self.outputs.append(())
+            state = following
+        self.outputs[state] += (term_id,)
+
+    def compile(self):
+        """Link every state to the longest proper suffix of it that is also a state."""
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, following in self.transitions[state].items():
+                queue.append(following)
+                failure = self.failures[state]
+                while failure and word not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                failure = self.transitions[failure].get(word, 0)
+                self.failures[following] = failure
+                self.outputs[following] += self.outputs[failure]
+
+    def find(self, text):
+        """Get the ids of the terms that appear in a text."""
+        transitions, failures, outputs = self.transitions, self.failures, self.outputs
+        found = set()
+        state = 0
+        for word in get_words(text):
+            while state and word not in transitions[state]:
+                state = failures[state]
+            state = transitions[state].get(word, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+def get_words(text):
+    return findall(r'\w+', text.lower(), UNICODE)
+
+
+_lock = RLock()
+# The matcher of the glossary of each project, with the revision of the
+# project it was compiled at, the least recently used first
+_matchers = OrderedDict()
+
+
+def get_matcher(project):
+    """
+    Get the matcher of the glossary of a project.
+
+    It is kept until the project moves past the revision it was compiled at,
+    see system_architect/revisions.py.
+
+    """
+    project_id = getattr(project, 'pk', project)
+    revision = get_revision(project_id)
+    with _lock:
+        kept = _matchers.get(project_id)
+        if kept is not None and kept[0] == revision:
+            _matchers.move_to_end(project_id)
+            return kept[1]
+        matcher = TermMatcher(Term.objects.filter(project=project_id).values_list('pk', 'name'))
+        if revision is not None:
+            _matchers[project_id] = (revision, matcher)
+            _matchers.move_to_end(project_id)
+            while len(_matchers) > MAX_MATCHERS:
+                _matchers.popitem(last=False)
+        return matcher
+
+
+def forget_matchers(project_id=None):
+    """Forget the matcher of a project, or of every project if none is given."""
+    with _lock:
+        if project_id is None:
+            _matchers.clear()
+        else:
+            _matchers.pop(project_id, None)
+
+
+def link_terms(project, replace=False, chunk_size=2000):
+    """
+    Link every function, system and goal of a project to the glossary terms it mentions.
+
+    :param replace: also remove the links to glossary terms that are no longer
+                    mentioned; links to terms outside the glossary are kept
+    :param chunk_size: the most links written per query
+    :return: the number of links added and removed
+
+    """
+    matcher = get_matcher(project)
+    glossary = Term.objects.filter(project=project).values('pk')
+    changes = 0
+    for model, fields in LINKED_FIELDS:
+        through = model._meta.get_field('terms').remote_field.through
+        source = model._meta.model_name + '_id'
+
+        existing = set(through.objects
+                              .filter(**{model._meta.model_name + '__project': project,
+                                         'term__in': glossary})
+                              .values_list(source, 'term'))
+        wanted = set()
+        rows = model.objects.filter(project=project).values_list('pk', *fields)
+        for pk, *texts in rows.iterator():
+            wanted.update((pk, term_id) for term_id in matcher.find(" ".join(texts)))
+
+        added = wanted - existing
+        removed = existing - wanted if replace else set()
+        with transaction.atomic():
+            through.objects.bulk_create(
+                (through(**{source: pk, 'term_id': term_id}) for pk, term_id in added),
+                batch_size=chunk_size,
+            )
+            by_term = {}
+            for pk, term_id in removed:
+                by_term.setdefault(term_id, []).append(pk)
+            for term_id, pks in by_term.items():
+                for start in range(0, len(pks), chunk_size):
+                    through.objects.filter(**{source + '__in': pks[start:start + chunk_size],
+                                              'term': term_id}).delete()
+        changes += len(added) + len(removed)
+    logger.debug("Changed %d term links of %s", changes, project)
+    return changes
+
+
+def link_entity_terms(instance):
+    """
+    Link a function, system or goal to the glossary terms it mentions that it is not linked to.
+
+    Like ``link_terms`` without ``replace``, no link is removed.
+
+    """
+    fields = dict(LINKED_FIELDS)[type(instance)]
+    found = get_matcher(instance.project_id).find(
+        " ".join(getattr(instance, field) for field in fields))
+    if found:
+        instance.terms.add(*found)
+
+
+@receiver(models.signals.post_save, sender=Function)
+@receiver(models.signals.post_save, sender=System)
+@receiver(models.signals.post_save, sender=Goal)
+def link_saved_terms(sender, instance, raw=False, **kwargs):
+    if not raw:
+        link_entity_terms(instance)
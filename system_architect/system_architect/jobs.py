@@ -0,0 +1,317 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Background jobs, queued in the database and run by a pool of worker processes.
+
+Web requests only queue a ``Job`` with ``submit_job`` and poll it, while the
+``run_workers`` command claims queued jobs and runs their tasks on a local
+process pool, so no broker is needed and heavy analyses stay off the WSGI
+workers.
+
+A task is a function registered with ``register_task`` that takes a
+``JobContext`` and the keyword arguments of the job, and returns something
+JSON serializable. Through the context it reports its progress, which is
+also when it learns that the job was cancelled.
+
+While a job runs, its worker keeps its heartbeat up to date. The jobs of a
+pool process that crashed are queued again at once, and those of a worker
+that died altogether once their heartbeat is stale, until they run out of
+attempts.
+
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from json import dumps, loads
+from logging import getLogger
+from os import getpid
+from socket import gethostname
+from time import monotonic, sleep
+from traceback import format_exc
+from uuid import UUID
+from .analysis import find_cut_sets, optimize_architecture, rebuild_closure, update_credibility
+from .archive import archive_votes
+from .database import write_transaction
+from .glossary import link_terms
+from .models import Job, Project, Scenario, SystemArchitecture
+from .processes import call, prepare_call
+
+
+__all__ = ('JobCancelled', 'JobContext', 'TASKS', 'Worker', 'cancel_job', 'recover_jobs',
+           'register_task', 'submit_job')
+
+
+logger = getLogger(__name__)
+
+
+# The functions that jobs can run, by name
+TASKS = {}
+
+
+def register_task(name):
+    """Register a function as a task that jobs can run."""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+class JobCancelled(Exception):
+    """Raised by ``JobContext.report`` when the job has been cancelled."""
+
+
+class JobContext:
+    """What a running task reports its progress through."""
+
+    def __init__(self, job_id, report_interval=1.0):
+        self.job_id = job_id
+        self.report_interval = report_interval
+        self.reported_at = None
+
+    def report(self, progress, message=''):
+        """
+        Record how much of the job is done and what it is doing.
+
+        Reports closer together than the report interval are skipped, so
+        tasks can report as often as convenient.
+
+        :param progress: how much of the job is done, between 0 and 1
+        :raise JobCancelled: if the job has been cancelled since the last report
+
+        """
+        now = monotonic()
+        if self.reported_at is not None and now - self.reported_at < self.report_interval:
+            return
+        self.reported_at = now
+        updated = (Job.objects
+                      .filter(pk=self.job_id, status=Job.RUNNING, cancel_requested=False)
+                      .update(progress=min(max(progress, 0.0), 1.0), message=message[:255],
+                              heartbeat_on=timezone.now()))
+        if not updated:
+            raise JobCancelled
+
+
+def submit_job(task, project=None, max_attempts=3, **arguments):
+    """
+    Queue a job to run a registered task.
+
+    :param task: the name of the task
+    :param project: the project the job works on, if any
+    :param arguments: the JSON serializable keyword arguments of the task
+    :return: the new ``Job``
+
+    """
+    if task not in TASKS:
+        raise ValueError("Unknown task '{}'".format(task))
+    return Job.objects.create(task=task, project=project, max_attempts=max_attempts,
+                              arguments=dumps(arguments))
+
+
+def cancel_job(job):
+    """
+    Cancel a job.
+
+    A queued job is cancelled at once, and a running one at the next progress
+    report of its task.
+
+    """
+    Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+        status=Job.CANCELLED, cancel_requested=True, finished_on=timezone.now())
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def claim_jobs(worker, count):
+    """Mark up to a number of the oldest queued jobs as run by a worker and return their ids."""
+    claimed = []
+    while len(claimed) < count:
+        with write_transaction():
+            job_id = (Job.objects
+                         .filter(status=Job.QUEUED)
+                         .order_by('created_on')
+                         .values_list('pk', flat=True)
+                         .first())
+            if job_id is None:
+                break
+            now = timezone.now()
+            # Another worker may have claimed the job since it was read
+            if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+                    status=Job.RUNNING, worker=worker, started_on=now, heartbeat_on=now,
+                    attempts=F('attempts') + 1, progress=0.0, message=''):
+                claimed.append(job_id)
+    return claimed
+
+
+def finish_job(job_id, status, **fields):
+    Job.objects.filter(pk=job_id, status=Job.RUNNING).update(
+        status=status, finished_on=timezone.now(), **fields)
+
+
+def requeue_jobs(jobs, message):
+    """Queue running jobs again if they have attempts left, or fail them."""
+    jobs = jobs.filter(status=Job.RUNNING)
+    jobs.filter(cancel_requested=True).update(
+        status=Job.CANCELLED, finished_on=timezone.now())
+    jobs.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.QUEUED, worker='', message=message)
+    jobs.update(status=Job.FAILED, message=message, finished_on=timezone.now())
+
+
+def recover_jobs(stale_after=timedelta(minutes=2)):
+    """Queue again, or fail, the running jobs whose worker stopped beating."""
+    requeue_jobs(Job.objects.filter(heartbeat_on__lt=timezone.now() - stale_after),
+                 "The worker stopped responding")
+
+
+def run_job(job_id):
+    """Run the task of a claimed job and record how it went, in a pool process."""
+    try:
+        job = Job.objects.get(pk=job_id)
+        try:
+            result = TASKS[job.task](JobContext(job_id), **loads(job.arguments))
+        except JobCancelled:
+            finish_job(job_id, Job.CANCELLED, message="Cancelled")
+        except Exception as error:
+            logger.exception("Job %s failed", job_id)
+            finish_job(job_id, Job.FAILED, message=str(error)[:255], error=format_exc())
+        else:
+            finish_job(job_id, Job.SUCCEEDED, progress=1.0, message='', result=dumps(result))
+    finally:
+        connections.close_all()
+
+
+class Worker:
+    """
+    Claims queued jobs and runs them on a process pool until stopped.
+
+    """
+
+    def __init__(self, processes=2, poll_interval=1.0, stale_after=timedelta(minutes=2)):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.name = "{}:{}".format(gethostname(), getpid())
+        self.stopping = False
+
+    def stop(self, *args):
+        """Stop claiming jobs, and return once the running ones are done."""
+        self.stopping = True
+
+    def run(self, once=False):
+        """
+        Run jobs until stopped.
+
+        :param once: stop as soon as there is nothing left to run
+        :return: the number of jobs run
+
+        """
+        executor, running, count = None, {}, 0
+        try:
+            while not (self.stopping and not running):
+                recover_jobs(self.stale_after)
+                if running:
+                    Job.objects.filter(pk__in=running.values()).update(heartbeat_on=timezone.now())
+
+                free = 0 if self.stopping else self.processes - len(running)
+                job_ids = claim_jobs(self.name, free) if free else []
+                if job_ids:
+                    if executor is None:
+                        executor = ProcessPoolExecutor(self.processes)
+                    # Forked processes must not share the connections of this one
+                    connections.close_all()
+                    for job_id in job_ids:
+                        # Spawned processes set Django up before importing the job
+                        running[executor.submit(call, *prepare_call(run_job, job_id))] = job_id
+                    count += len(job_ids)
+
+                if not running:
+                    if once:
+                        break
+                    sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        logger.error("The process running job %s crashed", job_id)
+                        requeue_jobs(Job.objects.filter(pk=job_id), "The worker process crashed")
+                        broken = True
+                if broken:
+                    # The other jobs of a broken pool were lost with it
+                    requeue_jobs(Job.objects.filter(pk__in=running.values()),
+                                 "The worker process crashed")
+                    running.clear()
+                    executor.shutdown(wait=False)
+                    executor = None
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        return count
+
+
+@register_task('find_cut_sets')
+def find_cut_sets_task(context, architecture, scenario=None, threshold=0.5, max_size=3):
+    architecture = SystemArchitecture.objects.get(pk=architecture)
+    scenario = Scenario.objects.get(pk=scenario) if scenario else None
+    context.report(0.0, "Finding cut sets of {}".format(architecture))
+    # Pool processes cannot start processes of their own
+    results = find_cut_sets(architecture, scenario, threshold, max_size, processes=1,
+                            progress=context.report)
+    return {
+        str(function_id): {
+            'satisfaction': result.satisfaction,
+            'cuts': [sorted(str(system_id) for system_id in cut) for cut in result.cuts],
+        }
+        for function_id, result in results.items()
+    }
+
+
+@register_task('optimize_architecture')
+def optimize_architecture_task(context, project, scenario=None, limits=None, weights=None,
+                               name=None):
+    project = Project.objects.get(pk=project)
+    scenario = Scenario.objects.get(pk=scenario) if scenario else None
+    if weights is not None:
+        weights = {UUID(function_id): weight for function_id, weight in weights.items()}
+    context.report(0.0, "Choosing the systems of {}".format(project))
+    result = optimize_architecture(project, scenario, limits, weights)
+    architecture = None
+    if name:
+        architecture = SystemArchitecture.objects.create(project=project, name=name)
+        architecture.systems.add(*result.systems)
+    return {
+        'systems': sorted(str(system_id) for system_id in result.systems),
+        'satisfaction': result.satisfaction,
+        'functions': {str(function_id): value for function_id, value in result.functions.items()},
+        'resources': result.resources,
+        'evaluations': result.evaluations,
+        'architecture': architecture and str(architecture.pk),
+    }
+
+
+@register_task('link_terms')
+def link_terms_task(context, project, replace=False):
+    return link_terms(Project.objects.get(pk=project), replace=replace)
+
+
+@register_task('rebuild_closure')
+def rebuild_closure_task(context, project):
+    return rebuild_closure(Project.objects.get(pk=project))
+
+
+@register_task('archive_votes')
+def archive_votes_task(context, days=90):
+    return archive_votes(timezone.now() - timedelta(days=days))
+
+
+@register_task('update_credibility')
+def update_credibility_task(context):
+    return update_credibility()
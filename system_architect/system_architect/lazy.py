@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Importing heavy modules on first use rather than when the server boots.
+
+NumPy and SciPy take longer to import than the rest of the application put
+together, and most requests and management commands never use them, so the
+analyses refer to them through ``LazyModule`` instead.
+
+"""
+from importlib import import_module
+from logging import getLogger
+
+
+__all__ = ('LazyModule',)
+
+
+logger = getLogger(__name__)
+
+
+class LazyModule:
+    """
+    A module that is only imported when one of its attributes is first used.
+
+    Once imported, the attributes of the module are copied over so that using
+    them again costs no more than with the module itself.
+
+    """
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attribute):
+        module = import_module(self.__name)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return "<LazyModule: {}>".format(self.__name)
@@ -7,6 +7,7 @@ from django.contrib.auth.models import User
 from os.path import abspath, dirname, join
 
 from system_architect.models import Category, Function, FunctionRequires, Project, Scenario, System
+from system_architect.projects import purge_project
 
 
 class Command(BaseCommand):
@@ -50,7 +51,8 @@ class Command(BaseCommand):
 
         if Project.objects.filter(name=project_name).count() > 0:
             if remake:
-                Project.objects.filter(name=project_name).delete()
+                for project in Project.objects.filter(name=project_name):
+                    purge_project(project)
             else:
                 return
 
@@ -129,7 +131,8 @@ class Command(BaseCommand):
 
         if Project.objects.filter(name=project_name).count() > 0:
             if remake:
-                Project.objects.filter(name=project_name).delete()
+                for project in Project.objects.filter(name=project_name):
+                    purge_project(project)
             else:
                 return
         self.stdout.write("  Creating Fixture Data for '{}'".format(project_name))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from system_architect.archive import archive_votes
+
+
+class Command(BaseCommand):
+    """Move the votes superseded by newer ones to the vote history."""
+
+    help = ('Archives the votes that were superseded by a newer vote of the same expert '
+            'and cast more than a number of days ago. Meant to be run regularly, e.g., '
+            'from a nightly cron job.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            dest='days',
+            default=90,
+            help='Only archive votes cast more than this many days ago',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            dest='chunk_size',
+            default=500,
+            help='How many votes to look at per transaction',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1:
+            raise CommandError("The days must not be negative and the chunk size must be positive")
+
+        self.stdout.write("Running archive_votes")
+        horizon = timezone.now() - timedelta(days=options['days'])
+        archived = archive_votes(horizon, chunk_size=options['chunk_size'])
+        self.stdout.write("  - Archived {} votes cast before {:%Y-%m-%d}".format(archived, horizon))
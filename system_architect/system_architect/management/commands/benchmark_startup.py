@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from json import loads
+from os import environ, pathsep
+from os.path import join
+from statistics import median
+from subprocess import DEVNULL, PIPE, run
+from sys import executable
+from time import perf_counter
+
+
+PROFILES = ('development', 'production')
+
+# The modules that should only be imported by the requests that use them
+HEAVY_MODULES = ('numpy', 'scipy', 'debug_toolbar')
+
+# Imports the WSGI application in a fresh interpreter, timing the first import
+# of every module, including what it imports, and prints the timings as JSON
+BOOT_SCRIPT = '''
+import builtins, json, sys, time
+
+durations = {}
+original_import = builtins.__import__
+
+
+def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return original_import(name, globals, locals, fromlist, level)
+    started = time.perf_counter()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        durations.setdefault(name, time.perf_counter() - started)
+
+
+builtins.__import__ = timed_import
+started = time.perf_counter()
+import system_architect.wsgi
+for name in ('system_architect', 'system_architect.wsgi'):
+    durations.pop(name, None)
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'imports': durations,
+    'heavy': [name for name in sys.argv[1:] if name in sys.modules],
+}))
+'''
+
+
+class Command(BaseCommand):
+    """Measure how long server workers and management commands take to start."""
+
+    help = ('Starts fresh interpreters that import the WSGI application and run '
+            '"manage.py check", with the development and the production settings, and '
+            'reports the boot times, the slowest imports and the heavy modules loaded.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            dest='runs',
+            default=5,
+            help='How many times each interpreter is started',
+        )
+        parser.add_argument(
+            '--profile',
+            choices=PROFILES,
+            dest='profile',
+            default=None,
+            help='Only measure one settings profile, defaults to both',
+        )
+        parser.add_argument(
+            '--imports',
+            type=int,
+            dest='imports',
+            default=5,
+            help='How many of the slowest imports to list',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            dest='max_seconds',
+            default=None,
+            help='Fail if a worker takes longer than this to import the application',
+        )
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("The number of runs must be positive")
+
+        self.stdout.write("Running benchmark_startup with {runs} runs".format(**options))
+        too_slow = []
+        for profile in (options['profile'],) if options['profile'] else PROFILES:
+            environment = self.get_environment(profile)
+            boots = [self.boot_wsgi(environment) for _ in range(options['runs'])]
+            seconds = median(boot['seconds'] for boot in boots)
+            commands = median(self.run_check(environment) for _ in range(options['runs']))
+
+            self.stdout.write("  - {}: wsgi.py imports in {:.3f}s, manage.py check runs in "
+                              "{:.3f}s".format(profile, seconds, commands))
+            imports = sorted(boots[-1]['imports'].items(), key=lambda item: -item[1])
+            self.stdout.write("    slowest imports: {}".format(", ".join(
+                "{} {:.3f}s".format(name, duration)
+                for name, duration in imports[:options['imports']]
+            )))
+            self.stdout.write("    heavy modules loaded: {}".format(
+                ", ".join(boots[-1]['heavy']) or "none"))
+            if options['max_seconds'] is not None and seconds > options['max_seconds']:
+                too_slow.append(profile)
+
+        if too_slow:
+            raise CommandError("The {} workers take longer than {}s to start".format(
+                " and ".join(too_slow), options['max_seconds']))
+
+    @staticmethod
+    def get_environment(profile):
+        environment = dict(environ, SYSTEM_ARCHITECT_PROFILE=profile)
+        environment['PYTHONPATH'] = pathsep.join(
+            path for path in (settings.BASE_DIR, environ.get('PYTHONPATH')) if path)
+        if profile == 'production':
+            environment.setdefault('DJANGO_SECRET_KEY', 'benchmark only')
+        return environment
+
+    @staticmethod
+    def boot_wsgi(environment):
+        result = run([executable, '-c', BOOT_SCRIPT] + list(HEAVY_MODULES), env=environment,
+                     cwd=settings.BASE_DIR, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+        if result.returncode:
+            raise CommandError("Could not import wsgi.py:\n{}".format(result.stderr))
+        return loads(result.stdout.strip().splitlines()[-1])
+
+    @staticmethod
+    def run_check(environment):
+        started = perf_counter()
+        result = run([executable, join(settings.BASE_DIR, 'manage.py'), 'check'], env=environment,
+                     cwd=settings.BASE_DIR, stdout=DEVNULL, stderr=PIPE, universal_newlines=True)
+        elapsed = perf_counter() - started
+        if result.returncode:
+            raise CommandError("manage.py check failed:\n{}".format(result.stderr))
+        return elapsed
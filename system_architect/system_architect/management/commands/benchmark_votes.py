@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from threading import Thread
+from time import perf_counter
+
+from system_architect.analysis import get_consensus
+from system_architect.database import SQLITE_PROFILES, apply_pragmas, write_transaction
+from system_architect.models import FunctionRequires, Project, Vote
+from system_architect.projects import purge_project
+
+
+class Command(BaseCommand):
+    """Measure how SQLite copes with many experts voting at the same time."""
+
+    help = ('Casts votes from several threads in a throwaway project, once with the '
+            'default SQLite settings and once with the concurrent profile, and reports '
+            'the throughput and the share of votes that failed on a locked database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            dest='threads',
+            default=8,
+            help='How many experts vote at the same time',
+        )
+        parser.add_argument(
+            '--votes',
+            type=int,
+            dest='votes',
+            default=50,
+            help='How many votes each expert casts',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The benchmark only applies to SQLite databases")
+        if options['threads'] < 1 or options['votes'] < 1:
+            raise CommandError("The number of threads and votes must be positive")
+
+        self.stdout.write("Running benchmark_votes with {threads} threads casting {votes} "
+                          "votes each".format(**options))
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+
+        project = Project.objects.create(name="Vote Benchmark")
+        try:
+            scale = project.add_scale(name='Criticality')
+            level = scale.add_level('High', 1.0)
+            for profile in ('default', 'concurrent'):
+                # Each profile votes on its own relationship so that both
+                # read the same number of votes
+                relationship = FunctionRequires.objects.create(
+                    requiring=project.add_function(name='Vote'),
+                    required=project.add_function(name='Count'),
+                    project=project,
+                    scale=scale,
+                )
+                cast, failed, elapsed = self.run_profile(profile, relationship, level, **options)
+                self.stdout.write(
+                    "  - {}: {} votes in {:.2f}s ({:.0f} votes/s), {} lock errors ({:.1%})".format(
+                        profile, cast, elapsed, cast / elapsed, failed, failed / (cast + failed))
+                )
+        finally:
+            purge_project(project)
+            apply_pragmas(connection, {'journal_mode': journal_mode})
+
+    @staticmethod
+    def run_profile(profile, relationship, level, threads, votes, **options):
+        """
+        Cast votes from several threads with the pragmas of a profile.
+
+        Both profiles save every vote as the admin does, in its own short
+        write transaction, and then read the updated consensus, so that only
+        the pragmas differ between them.
+
+        :return: the number of votes cast and failed, and the time it took
+
+        """
+        pragmas = SQLITE_PROFILES[profile]
+        apply_pragmas(connection, pragmas)
+        results = []
+
+        def vote():
+            # Every thread has its own connection, set up for the profile
+            apply_pragmas(connection, pragmas)
+            cast = failed = 0
+            try:
+                for _ in range(votes):
+                    try:
+                        with write_transaction():
+                            Vote.objects.create(relationship=relationship, value=level)
+                        get_consensus(Vote.objects.filter(relationship=relationship))
+                        cast += 1
+                    except OperationalError as error:
+                        if 'locked' not in str(error):
+                            raise
+                        failed += 1
+            finally:
+                results.append((cast, failed))
+                connection.close()
+
+        workers = [Thread(target=vote) for _ in range(threads)]
+        start = perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = perf_counter() - start
+        return sum(cast for cast, _ in results), sum(failed for _, failed in results), elapsed
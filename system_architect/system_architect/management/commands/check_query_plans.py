@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from re import match, search
+from uuid import uuid4
+
+from system_architect.analysis import get_latest_votes
+from system_architect.analysis.graph import RELATIONSHIP_FIELDS
+from system_architect.models import (Function, FunctionRequires, System, SystemArchitecture,
+                                     SystemSatisfies, Vote)
+
+
+def get_queries():
+    """
+    Get the queries the analyses and admin run most, keyed by a description.
+
+    The plans only depend on the shape of the queries, so they are built with
+    placeholder keys instead of the keys of an actual project.
+
+    """
+    project_id, scenario_id, architecture_id = uuid4(), uuid4(), uuid4()
+    function_id, system_id = uuid4(), uuid4()
+    applicable = Q(scenario__in=[scenario_id]) | Q(scenario__isnull=True)
+    queries = [
+        ("Functions of a project", Function.objects.filter(project=project_id)),
+        ("Systems of a project", System.objects.filter(project=project_id)),
+    ]
+    queries.extend(
+        ("Relationships of a scenario ({})".format(kind),
+         model.objects.filter(applicable, project=project_id)
+                      .values_list('pk', 'scenario', *filter(None, fields)))
+        for kind, model, fields in RELATIONSHIP_FIELDS
+    )
+    queries.extend((
+        ("Votes of a scenario",
+         get_latest_votes(Vote.objects.filter(Q(relationship__scenario__in=[scenario_id]) |
+                                              Q(relationship__scenario__isnull=True),
+                                              relationship__project=project_id))
+         .values_list('relationship', 'value__value', 'value__scale')),
+        ("Latest votes on a relationship",
+         get_latest_votes(Vote.objects.filter(relationship=0))),
+        ("Function requirement of a scenario",
+         FunctionRequires.objects.filter(requiring=function_id, required=function_id,
+                                         scenario=scenario_id)),
+        ("System satisfaction of a scenario",
+         SystemSatisfies.objects.filter(satisfier=system_id, satisfied=function_id,
+                                        scenario=scenario_id)),
+        ("Systems of an architecture",
+         SystemArchitecture.systems.through.objects.filter(systemarchitecture=architecture_id)),
+    ))
+    return queries
+
+
+def explain(queryset):
+    """Get the lines of the query plan of a queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            # Small tables are cheaper to read whole, so sequential scans are
+            # discouraged to reveal whether an index could be used at all
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+    raise CommandError("Query plans can only be checked on SQLite and PostgreSQL")
+
+
+def get_full_scans(plan):
+    """Get the tables a query plan reads in full."""
+    tables = []
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            scan = match(r'SCAN (?:TABLE )?(\w+)', line)
+        else:
+            scan = search(r'Seq Scan on (\w+)', line)
+        if scan:
+            tables.append(scan.group(1))
+    # Subqueries are scanned as they are produced, which is not a full scan
+    table_names = set(connection.introspection.table_names())
+    return [table for table in tables if table in table_names]
+
+
+class Command(BaseCommand):
+    """Check that the main queries of the application are served by indexes."""
+
+    help = ('Explains the main queries of the application and reports the tables '
+            'they scan in full. Use a verbosity of 2 to print the plans.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Running check_query_plans on {}".format(connection.vendor))
+        failures = 0
+        for description, queryset in get_queries():
+            plan = explain(queryset)
+            tables = get_full_scans(plan)
+            if tables:
+                failures += 1
+                self.stdout.write("  - {}: full scan of {}".format(description, ", ".join(tables)))
+            else:
+                self.stdout.write("  - {}: OK".format(description))
+            if options['verbosity'] > 1:
+                for line in plan:
+                    self.stdout.write("      {}".format(line))
+
+        if failures:
+            raise CommandError("{} queries scan tables in full".format(failures))
+        self.stdout.write("  - Every query uses an index")
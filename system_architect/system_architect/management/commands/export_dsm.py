@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from system_architect.analysis import get_dsm
+from system_architect.models import Project
+
+
+class Command(BaseCommand):
+    """Export the design structure matrix of a project."""
+
+    help = ('Writes the function by function, or system by function, matrix of a project '
+            'as a CSV file or a PNG image, depending on the extension of the output.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project',
+            help='The name of the project',
+        )
+        parser.add_argument(
+            'output',
+            help='The .csv or .png file to write',
+        )
+        parser.add_argument(
+            '--systems',
+            action='store_true',
+            dest='systems',
+            default=False,
+            help='Export the system by function matrix',
+        )
+        parser.add_argument(
+            '--scenario',
+            dest='scenario',
+            default=None,
+            help='The name of the scenario to look at the project under',
+        )
+        parser.add_argument(
+            '--organize',
+            action='store_true',
+            dest='organize',
+            default=False,
+            help='Group the functions into modules and order them by dependencies',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(name=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError("Could not find project '{}'".format(options['project']))
+        scenario = None
+        if options['scenario']:
+            scenario = project.scenarios.filter(name=options['scenario']).first()
+            if scenario is None:
+                raise CommandError("Could not find scenario '{}'".format(options['scenario']))
+
+        output = options['output']
+        if not output.endswith(('.csv', '.png')):
+            raise CommandError("The output must be a .csv or .png file")
+
+        self.stdout.write("Running export_dsm")
+        dsm = get_dsm(project, scenario, systems=options['systems'], organize=options['organize'])
+        if output.endswith('.png'):
+            with open(output, 'wb') as image:
+                dsm.write_png(image)
+        else:
+            with open(output, 'w', newline='') as csvfile:
+                dsm.write_csv(csvfile)
+        self.stdout.write("  - Wrote the {} by {} matrix to {}".format(
+            len(dsm.rows), len(dsm.columns), output))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from system_architect.models import Project
+from system_architect.reports import REPORT_FORMATS, REPORTS, get_report, write_report
+
+
+class Command(BaseCommand):
+    """Export a report of a project as a spreadsheet."""
+
+    help = ('Writes the relationships, votes, experts or architectures report of a project '
+            'as a CSV file or an Excel workbook (.xml), depending on the extension of the '
+            'output, without holding the report in memory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project',
+            help='The name of the project',
+        )
+        parser.add_argument(
+            'report',
+            choices=list(REPORTS),
+            help='The report to export',
+        )
+        parser.add_argument(
+            'output',
+            help='The .csv or .xml file to write',
+        )
+        parser.add_argument(
+            '--scenario',
+            dest='scenario',
+            default=None,
+            help='Only report on what is stated for this scenario',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(name=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError("Could not find project '{}'".format(options['project']))
+        scenario = None
+        if options['scenario']:
+            scenario = project.scenarios.filter(name=options['scenario']).first()
+            if scenario is None:
+                raise CommandError("Could not find scenario '{}'".format(options['scenario']))
+
+        output = options['output']
+        extension = output.rpartition('.')[2]
+        if extension not in REPORT_FORMATS:
+            raise CommandError("The output must be a .csv or .xml file")
+
+        self.stdout.write("Running export_report")
+        report = get_report(options['report'], project, scenario)
+        with open(output, 'w', newline='', encoding='utf-8') as report_file:
+            for chunk in write_report(report, extension):
+                report_file.write(chunk)
+        self.stdout.write("  - Wrote the {} report to {}".format(options['report'], output))
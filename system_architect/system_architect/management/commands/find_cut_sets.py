@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from system_architect.analysis import find_cut_sets
+from system_architect.models import Function, Project
+
+
+class Command(BaseCommand):
+    """Report the systems whose loss brings down the top functions of an architecture."""
+
+    help = ('Lists, for each top function of an architecture, the minimal sets of systems '
+            'whose loss pushes its satisfaction below a threshold, from single points of '
+            'failure up to sets of --max-size systems.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project',
+            help='The name of the project',
+        )
+        parser.add_argument(
+            'architecture',
+            help='The name of the architecture',
+        )
+        parser.add_argument(
+            '--scenario',
+            dest='scenario',
+            default=None,
+            help='The name of the scenario to look at the project under',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            dest='threshold',
+            default=0.5,
+            help='The satisfaction below which a function is lost, between 0 and 1',
+        )
+        parser.add_argument(
+            '--max-size',
+            type=int,
+            dest='max_size',
+            default=3,
+            help='The most systems lost at once',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            dest='processes',
+            default=None,
+            help='How many processes to evaluate with, defaults to the number of CPUs',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(name=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError("Could not find project '{}'".format(options['project']))
+        architecture = project.systemarchitecture_set.filter(name=options['architecture']).first()
+        if architecture is None:
+            raise CommandError("Could not find architecture '{}'".format(options['architecture']))
+        scenario = None
+        if options['scenario']:
+            scenario = project.scenarios.filter(name=options['scenario']).first()
+            if scenario is None:
+                raise CommandError("Could not find scenario '{}'".format(options['scenario']))
+        if options['max_size'] < 1:
+            raise CommandError("The largest cut set must have at least one system")
+
+        self.stdout.write("Running find_cut_sets")
+        results = find_cut_sets(architecture, scenario, threshold=options['threshold'],
+                                max_size=options['max_size'], processes=options['processes'])
+        names = dict(architecture.systems.values_list('pk', 'name'))
+        functions = Function.objects.filter(pk__in=results).order_by('name')
+        for function in functions:
+            result = results[function.pk]
+            self.stdout.write("  - {} ({:.0%} satisfied): {}".format(
+                function.name, result.satisfaction,
+                ", ".join(
+                    "{{{}}}".format(", ".join(sorted(names[system] for system in cut)))
+                    for cut in result.cuts
+                ) or "no cut sets",
+            ))
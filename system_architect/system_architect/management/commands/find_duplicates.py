@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from system_architect.analysis import find_duplicates
+from system_architect.models import Function, Project, System
+
+
+class Command(BaseCommand):
+    """Report the functions and systems of a project that are likely duplicates."""
+
+    help = 'Lists the pairs of functions or systems that are likely duplicates, most similar first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project',
+            help='The name of the project',
+        )
+        parser.add_argument(
+            '--systems',
+            action='store_true',
+            dest='systems',
+            default=False,
+            help='Look for duplicate systems instead of functions',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            dest='threshold',
+            default=0.5,
+            help='The lowest estimated similarity to report, between 0 and 1',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(name=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError("Could not find project '{}'".format(options['project']))
+
+        model = System if options['systems'] else Function
+        candidates = find_duplicates(project, model=model, threshold=options['threshold'])
+        self.stdout.write("Found {} likely duplicates in '{}'".format(len(candidates), project.name))
+        for first, second, similarity in candidates:
+            self.stdout.write("  {:.0%}  {}  <->  {}".format(similarity, first.name, second.name))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from csv import DictReader
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from itertools import islice
+
+from system_architect.models.vote import ExpertProfile, Organization
+
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+PROFILE_FIELDS = ('title', 'phone')
+
+
+class Command(BaseCommand):
+    """Bulk import subject matter experts from a CSV file."""
+
+    help = ("Creates users, organizations and expert profiles from a CSV file with "
+            "the columns: " + ", ".join(USER_FIELDS + PROFILE_FIELDS + ('organization',)) +
+            ". Imported users get an unusable password and have to reset it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='The CSV file to import',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            dest='chunk_size',
+            default=500,
+            help='How many experts to insert per transaction',
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("The chunk size must be a positive number")
+
+        self.stdout.write("Running import_experts")
+        created = 0
+        with open(options['path'], 'r') as csvfile:
+            reader = DictReader(csvfile)
+            if 'username' not in (reader.fieldnames or ()):
+                raise CommandError("The CSV file must have a 'username' column")
+            for rows in iter(lambda: list(islice(reader, options['chunk_size'])), []):
+                created += self.import_chunk(rows)
+                self.stdout.write("  - Imported {} experts".format(created))
+
+        self.stdout.write("  - Finished importing {} experts".format(created))
+
+    def import_chunk(self, rows):
+        """
+        Import a chunk of experts with a handful of queries.
+
+        Users that already exist are skipped, but get a profile if they are
+        missing one. The profiles are created here in bulk rather than by the
+        ``post_save`` receivers, which ``bulk_create`` does not trigger.
+
+        :return: the number of users created
+
+        """
+        rows = {row['username']: row for row in rows if row.get('username')}
+        with transaction.atomic():
+            organizations = self.get_organizations(
+                row.get('organization') or None
+                for row in rows.values()
+            )
+
+            existing = set(
+                User.objects
+                    .filter(username__in=list(rows))
+                    .values_list('username', flat=True)
+            )
+            unusable_password = make_password(None)
+            User.objects.bulk_create(
+                User(password=unusable_password,
+                     **{field: rows[username].get(field) or '' for field in USER_FIELDS})
+                for username in rows
+                if username not in existing
+            )
+
+            users = (User.objects
+                         .filter(username__in=list(rows), expertprofile__isnull=True)
+                         .values_list('username', 'pk'))
+            ExpertProfile.objects.bulk_create(
+                ExpertProfile(
+                    user_id=user_id,
+                    organization=organizations.get(rows[username].get('organization')),
+                    **{field: rows[username].get(field) or '' for field in PROFILE_FIELDS}
+                )
+                for username, user_id in users
+            )
+
+        return len(rows) - len(existing)
+
+    @staticmethod
+    def get_organizations(names):
+        """Get the organizations with the given names, creating the missing ones."""
+        names = set(names) - {None}
+        organizations = {
+            organization.name: organization
+            for organization in Organization.objects.filter(name__in=names)
+        }
+        missing = [
+            Organization(name=name)
+            for name in names
+            if name not in organizations
+        ]
+        Organization.objects.bulk_create(missing)
+        organizations.update(
+            (organization.name, organization)
+            for organization in missing
+        )
+        return organizations
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from system_architect.matrix import MATRIX_KINDS, MappingMatrix, import_matrix, read_matrix
+from system_architect.models import Project
+from system_architect.models.vote import ExpertProfile
+
+
+class Command(BaseCommand):
+    """Import the votes of an expert from a matrix of relationships."""
+
+    help = ('Reads a CSV or Excel (.xlsx) grid whose first row names the columns and whose '
+            'first column names the rows, and saves the levels in its cells as the votes of '
+            'an expert, only writing the cells that changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project',
+            help='The name of the project',
+        )
+        parser.add_argument(
+            'kind',
+            choices=list(MATRIX_KINDS),
+            help='The kind of relationship in the cells',
+        )
+        parser.add_argument(
+            'scale',
+            help='The name of the weighting scale the levels belong to',
+        )
+        parser.add_argument(
+            'file',
+            help='The .csv or .xlsx file to import',
+        )
+        parser.add_argument(
+            '--scenario',
+            dest='scenario',
+            default=None,
+            help='The name of the scenario the relationships are stated for',
+        )
+        parser.add_argument(
+            '--expert',
+            dest='expert',
+            default=None,
+            help='The username of the expert casting the votes',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(name=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError("Could not find project '{}'".format(options['project']))
+        scale = project.scales.filter(name=options['scale']).first()
+        if scale is None:
+            raise CommandError("Could not find scale '{}'".format(options['scale']))
+        scenario = None
+        if options['scenario']:
+            scenario = project.scenarios.filter(name=options['scenario']).first()
+            if scenario is None:
+                raise CommandError("Could not find scenario '{}'".format(options['scenario']))
+        expert = None
+        if options['expert']:
+            expert = ExpertProfile.objects.filter(user__username=options['expert']).first()
+            if expert is None:
+                raise CommandError("Could not find expert '{}'".format(options['expert']))
+
+        self.stdout.write("Running import_matrix")
+        matrix = MappingMatrix(options['kind'], project, scale, scenario, expert)
+        try:
+            with open(options['file'], 'rb') as matrix_file:
+                changed = import_matrix(matrix, read_matrix(matrix_file, options['file']))
+        except ValidationError as error:
+            raise CommandError("\n".join(error.messages))
+        self.stdout.write("  - Saved {} cells".format(changed))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from system_architect.glossary import link_terms
+from system_architect.models import Project
+
+
+class Command(BaseCommand):
+    """Link the functions, systems and goals of projects to the glossary terms they mention."""
+
+    help = ('Scans the names and descriptions of every function, system and goal of a '
+            'project, or of all projects, for the terms of its glossary and links them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project',
+            nargs='?',
+            default=None,
+            help='The name of the project, defaults to all projects',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            dest='replace',
+            default=False,
+            help='Also unlink the glossary terms that are no longer mentioned',
+        )
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options['project']:
+            projects = projects.filter(name=options['project'])
+            if not projects.exists():
+                raise CommandError("Could not find project '{}'".format(options['project']))
+
+        self.stdout.write("Running link_terms")
+        for project in projects:
+            changes = link_terms(project, replace=options['replace'])
+            self.stdout.write("  - {}: {} links changed".format(project.name, changes))
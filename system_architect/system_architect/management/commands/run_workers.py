@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from signal import SIGINT, SIGTERM, signal
+
+from system_architect.jobs import Worker
+
+
+class Command(BaseCommand):
+    """Run queued jobs on a pool of worker processes."""
+
+    help = ('Claims the queued jobs and runs them on a local process pool until stopped, '
+            'queueing again the jobs of workers that crashed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            dest='processes',
+            default=2,
+            help='The number of jobs run at once',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            dest='poll_interval',
+            default=1.0,
+            help='The seconds between looks for new jobs',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            dest='stale_after',
+            default=120,
+            help='The seconds without a heartbeat after which a running job is queued again',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Stop once there are no queued jobs left',
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(processes=options['processes'], poll_interval=options['poll_interval'],
+                        stale_after=timedelta(seconds=options['stale_after']))
+        # Finish the running jobs before stopping
+        signal(SIGTERM, worker.stop)
+        signal(SIGINT, worker.stop)
+
+        self.stdout.write("Running run_workers")
+        self.stdout.write("  - {} with {} processes".format(worker.name, worker.processes))
+        count = worker.run(once=options['once'])
+        self.stdout.write("  - Ran {} jobs".format(count))
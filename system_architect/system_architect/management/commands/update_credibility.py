@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from system_architect.analysis import update_credibility
+
+
+class Command(BaseCommand):
+    """Recompute how much the votes of every expert count in the consensus."""
+
+    help = ('Weights every expert by the credibility of their organization, their agreement '
+            'with the rest of the panel and the confidence they declared, over the whole vote '
+            'table. Meant to be run regularly, e.g., from a nightly cron job.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Running update_credibility")
+        changed = update_credibility()
+        self.stdout.write("  - Updated the credibility of {} experts".format(changed))
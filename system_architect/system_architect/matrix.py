@@ -0,0 +1,307 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Editing the relationships of a project as a grid.
+
+A mapping matrix holds the vote of one expert on every pair of, e.g.,
+systems and functions of a project under a scenario, each cell holding the
+name of a level of the scale. The grid is loaded with a query for the
+relationships and one for the votes, and saving it only writes the cells that
+changed: missing relationships and the new votes are bulk inserted in one
+transaction, and the votes of cleared cells are deleted.
+
+Matrices can also be imported from CSV or Excel (.xlsx) files whose first row
+holds the names of the columns and whose first column holds the names of the
+rows.
+
+"""
+from collections import OrderedDict
+from csv import reader
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from io import TextIOWrapper
+from logging import getLogger
+from re import match
+from xml.etree import ElementTree
+from zipfile import BadZipFile, ZipFile
+from .analysis import get_latest_votes, update_closure
+from .database import write_transaction
+from .models import FunctionRequires, FunctionSatisfies, SystemRequires, SystemSatisfies, Vote
+from .models.relationship import Relationship
+from .projects import allocate_ids, insert_local_rows
+from .revisions import touch_project
+
+
+__all__ = ('MATRIX_KINDS', 'MappingMatrix', 'import_matrix', 'read_matrix')
+
+
+logger = getLogger(__name__)
+
+
+# The relationship model of every kind of matrix and the fields of its rows
+# and columns
+MATRIX_KINDS = OrderedDict((
+    ('function-requires', (FunctionRequires, 'requiring', 'required')),
+    ('function-satisfies', (FunctionSatisfies, 'satisfier', 'satisfied')),
+    ('system-requires', (SystemRequires, 'requiring', 'required')),
+    ('system-satisfies', (SystemSatisfies, 'satisfier', 'satisfied')),
+))
+
+
+class MappingMatrix:
+    """
+    The votes of an expert on one kind of relationship of a project, as a grid.
+
+    Cells are keyed by (row id, column id) and hold the name of a level of the
+    scale, or None. Relationships stated on another scale cannot be voted on
+    with the levels of this one, so their cells are locked.
+
+    """
+
+    def __init__(self, kind, project, scale, scenario=None, expert=None):
+        if kind not in MATRIX_KINDS:
+            raise ValueError("Unknown kind of matrix '{}'".format(kind))
+        self.kind = kind
+        self.model, self.row_field, self.column_field = MATRIX_KINDS[kind]
+        self.project = project
+        self.scale = scale
+        self.scenario = scenario
+        self.expert = expert
+
+        self.levels = OrderedDict(scale.levels.values_list('name', 'pk'))
+        self.rows = self.get_entities(self.row_field)
+        self.columns = self.get_entities(self.column_field)
+        self.relationships = {}
+        self.locked = set()
+        self.cells = {}
+        self.load()
+
+    def get_entities(self, field):
+        model = self.model._meta.get_field(field).related_model
+        return list(model.objects
+                         .filter(project=self.project)
+                         .order_by('name')
+                         .values_list('pk', 'name'))
+
+    def get_relationships(self):
+        return self.model.objects.non_polymorphic().filter(project=self.project,
+                                                           scenario=self.scenario)
+
+    def load_relationships(self):
+        """Load the relationship of every cell that has one, and lock those on another scale."""
+        rows = self.get_relationships().values_list('pk', self.row_field, self.column_field, 'scale')
+        for pk, row, column, scale_id in rows:
+            self.relationships[(row, column)] = pk
+            if scale_id != self.scale.pk:
+                self.locked.add((row, column))
+
+    def load(self):
+        relationships = self.get_relationships()
+        self.load_relationships()
+
+        level_names = {pk: name for name, pk in self.levels.items()}
+        keys = {pk: key for key, pk in self.relationships.items()}
+        votes = get_latest_votes(Vote.objects.filter(expert=self.expert,
+                                                     relationship__in=relationships.values('pk')))
+        for relationship_id, value_id in votes.values_list('relationship', 'value'):
+            if value_id in level_names:
+                self.cells[keys[relationship_id]] = level_names[value_id]
+
+    def get_changes(self, values):
+        """
+        Get the cells whose value differs from the loaded one.
+
+        :param values: a dictionary of level names keyed by (row id, column id),
+                       an empty name clearing the cell
+        :return: a dictionary of the changed cells, cleared ones being None
+
+        """
+        row_ids = {pk for pk, _ in self.rows}
+        column_ids = {pk for pk, _ in self.columns}
+        changes, errors = {}, []
+        for (row, column), value in values.items():
+            value = value or None
+            if value == self.cells.get((row, column)):
+                continue
+            if row not in row_ids or column not in column_ids:
+                errors.append("Cell ({}, {}) is not part of the matrix".format(row, column))
+            elif (row, column) in self.locked:
+                errors.append("Cell ({}, {}) is assessed on another scale".format(row, column))
+            elif value is not None and value not in self.levels:
+                errors.append("'{}' is not a level of {}".format(value, self.scale.name))
+            else:
+                changes[(row, column)] = value
+        if errors:
+            raise ValidationError(errors)
+        return changes
+
+    def save(self, values):
+        """
+        Save the cells that changed.
+
+        :param values: a dictionary of level names keyed by (row id, column id),
+                       an empty name clearing the cell; cells left out are kept
+        :return: the number of cells changed
+
+        """
+        changes = self.get_changes(values)
+        if not changes:
+            return 0
+
+        with write_transaction():
+            # Another save may have stated some of the relationships since the
+            # matrix was loaded, which must be voted on rather than duplicated
+            self.load_relationships()
+            locked = [key for key, value in changes.items()
+                      if value is not None and key in self.locked]
+            if locked:
+                raise ValidationError([
+                    "Cell ({}, {}) is assessed on another scale".format(row, column)
+                    for row, column in locked
+                ])
+            self.create_relationships([
+                key
+                for key, value in changes.items()
+                if value is not None and key not in self.relationships
+            ])
+            Vote.objects.bulk_create(
+                Vote(relationship_id=self.relationships[key], expert=self.expert,
+                     value_id=self.levels[value])
+                for key, value in changes.items()
+                if value is not None
+            )
+            cleared = [
+                self.relationships[key]
+                for key, value in changes.items()
+                if value is None and key in self.relationships
+            ]
+            if cleared:
+                Vote.objects.filter(expert=self.expert, relationship__in=cleared).delete()
+            # Bulk inserts do not send the signals that keep the analyses up to date
+            touch_project(self.project.pk)
+
+        for key, value in changes.items():
+            if value is None:
+                self.cells.pop(key, None)
+            else:
+                self.cells[key] = value
+
+        if self.model in (FunctionRequires, SystemRequires):
+            update_closure(self.project.pk, {row for row, _ in changes})
+        logger.debug("Saved %d cells of the %s matrix of %s", len(changes), self.kind, self.project)
+        return len(changes)
+
+    def create_relationships(self, keys):
+        """Insert the relationships of the given cells, parent and child rows in bulk."""
+        if not keys:
+            return
+        content_type = ContentType.objects.get_for_model(self.model, for_concrete_model=False)
+        ids = allocate_ids(Relationship, len(keys))
+        Relationship.objects.bulk_create(
+            Relationship(id=pk, polymorphic_ctype_id=content_type.pk, project_id=self.project.pk,
+                         scenario_id=getattr(self.scenario, 'pk', None), scale_id=self.scale.pk)
+            for pk in ids
+        )
+        insert_local_rows(self.model, [
+            self.model(relationship_ptr_id=pk, **{self.row_field + '_id': row,
+                                                  self.column_field + '_id': column})
+            for pk, (row, column) in zip(ids, keys)
+        ])
+        self.relationships.update(zip(keys, ids))
+
+
+def get_column_index(reference):
+    letters = match('[A-Z]+', reference).group()
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def read_xlsx(file):
+    """Read the rows of the first worksheet of an Excel workbook as lists of strings."""
+    namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    with ZipFile(file) as workbook:
+        names = workbook.namelist()
+        strings = []
+        if 'xl/sharedStrings.xml' in names:
+            for item in ElementTree.fromstring(workbook.read('xl/sharedStrings.xml')):
+                strings.append(''.join(text.text or '' for text in item.iter(namespace + 't')))
+        sheets = sorted(name for name in names if match(r'xl/worksheets/sheet\d+\.xml$', name))
+        if not sheets:
+            raise ValidationError("The workbook has no worksheet")
+        sheet = ElementTree.fromstring(workbook.read(sheets[0]))
+
+    rows = []
+    for row in sheet.iter(namespace + 'row'):
+        cells = {}
+        for cell in row.iter(namespace + 'c'):
+            kind = cell.get('t')
+            if kind == 'inlineStr':
+                value = ''.join(text.text or '' for text in cell.iter(namespace + 't'))
+            else:
+                value = cell.findtext(namespace + 'v') or ''
+                if kind == 's' and value:
+                    value = strings[int(value)]
+            cells[get_column_index(cell.get('r'))] = value
+        rows.append([cells.get(index, '') for index in range(max(cells, default=-1) + 1)])
+    return rows
+
+
+def read_matrix(file, name):
+    """
+    Read the rows of a matrix from a CSV or Excel file.
+
+    :param file: a binary file object
+    :param name: the name of the file, whose extension tells its format
+    :return: a list of rows, each a list of strings
+
+    """
+    if name.lower().endswith('.xlsx'):
+        try:
+            return read_xlsx(file)
+        except (BadZipFile, KeyError, ElementTree.ParseError):
+            raise ValidationError("The file is not a valid Excel workbook")
+    if name.lower().endswith('.csv'):
+        return list(reader(TextIOWrapper(file, encoding='utf-8-sig')))
+    raise ValidationError("Matrices can only be imported from .csv or .xlsx files")
+
+
+def import_matrix(matrix, rows):
+    """
+    Save the cells of a matrix read from a file.
+
+    The first row holds the names of the columns and the first column the
+    names of the rows. Only the rows and columns in the file are changed.
+
+    :return: the number of cells changed
+
+    """
+    def get_ids(entities, names, label):
+        ids = {}
+        for pk, name in entities:
+            ids.setdefault(name, []).append(pk)
+        errors = [
+            "Unknown {} '{}'".format(label, name) if name not in ids else
+            "More than one {} is named '{}'".format(label, name)
+            for name in names
+            if len(ids.get(name, ())) != 1
+        ]
+        if errors:
+            raise ValidationError(errors)
+        return [ids[name][0] for name in names]
+
+    if not rows:
+        return 0
+    header = [name.strip() for name in rows[0][1:]]
+    rows = [row for row in rows[1:] if any(value.strip() for value in row)]
+    column_ids = get_ids(matrix.columns, header, 'column')
+    row_ids = get_ids(matrix.rows, [row[0].strip() for row in rows], 'row')
+
+    values = {}
+    for row_id, row in zip(row_ids, rows):
+        cells = [value.strip() for value in row[1:]]
+        cells += [''] * (len(column_ids) - len(cells))
+        for column_id, value in zip(column_ids, cells):
+            values[(row_id, column_id)] = value
+    return matrix.save(values)
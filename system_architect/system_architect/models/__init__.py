@@ -2,3 +2,6 @@ from .core import *
 from .relationship import *
 from .vote import *
 from .architecture import *
+from .closure import *
+from .job import *
+from .revision import *
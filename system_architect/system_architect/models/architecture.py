@@ -28,15 +28,26 @@ class SystemArchitecture(CoreModel):
 
     @property
     def functional_satisfaction(self):
-        satisfaction = {}
-
-        if not self.systems:
-            return satisfaction
-
-        for function in self.project.functions:
-            satisfaction[function] = 0.0
-
-        return satisfaction
+        return self.evaluate()
+
+    def evaluate(self, scenario=None):
+        """
+        Get how well this architecture satisfies each function of the project.
+
+        The evaluation is kept and updated incrementally as votes and
+        relationships change, so repeated calls are cheap.
+
+        :param scenario: the scenario to evaluate under, defaults to the
+            scenario independent relationships only
+        :return: a dictionary of satisfaction values keyed by function
+
+        """
+        from ..analysis import evaluate_architecture
+        satisfaction = evaluate_architecture(self, scenario)
+        return {
+            function: satisfaction.get(function.pk, 0.0)
+            for function in self.project.functions.all()
+        }
 
 
 latest_fun_req_mappings = """
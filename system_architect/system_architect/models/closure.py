@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from django.db import models
+from logging import getLogger
+from .core import Function, Project, System
+
+
+__all__ = ('RequirementClosure',)
+
+
+logger = getLogger(__name__)
+
+
+class RequirementClosure(models.Model):
+    """
+    A function that a function or a system ultimately requires.
+
+    The rows are kept up to date from the function and system requires
+    relationships of every scenario, so that everything a node needs, or
+    everything that breaks when a function is lost, is a single lookup.
+
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    requiring_function = models.ForeignKey(
+        Function,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='+',
+        help_text="The function that requires, if it is not a system.",
+    )
+    requiring_system = models.ForeignKey(
+        System,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='+',
+        help_text="The system that requires, if it is not a function.",
+    )
+    required = models.ForeignKey(
+        Function,
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text="The function that is ultimately required.",
+    )
+    depth = models.PositiveIntegerField(
+        help_text="The fewest requires relationships leading from one to the other.",
+    )
+    criticality = models.FloatField(
+        help_text="The lowest criticality along the most critical chain of requirements.",
+    )
+
+    class Meta:
+        verbose_name_plural = 'requirement closure'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['required', 'depth']),
+                models.Index(fields=['requiring_function', 'depth']),
+                models.Index(fields=['requiring_system', 'depth']),
+            ]
+
+    @property
+    def requiring(self):
+        return self.requiring_function or self.requiring_system
+
+    def __str__(self):
+        return "{} ultimately requires {}".format(self.requiring, self.required)
@@ -5,12 +5,16 @@ from logging import getLogger
 from uuid import uuid4
 
 __all__ = ('CoreModel', 'Scenario', 'Category', 'Function', 'Goal', 'Project',
-           'System', 'Term', 'WeightingScale', 'WeightLevel')
+           'RESOURCES', 'System', 'Term', 'WeightingScale', 'WeightLevel')
 
 
 logger = getLogger(__name__)
 
 
+# The resources every system consumes, and that each project may limit
+RESOURCES = ('cost', 'weight', 'power', 'space')
+
+
 class CoreModel(models.Model):
     """
     An abstract model that sets up the common characteristics and methods
@@ -56,6 +60,31 @@ class Project(CoreModel):
         blank=True,
         help_text="A list of terms that are relevant to this project"
     )
+    cost_limit = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="The most the systems of an architecture may cost, if limited.",
+    )
+    weight_limit = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="The most the systems of an architecture may weigh, if limited.",
+    )
+    power_limit = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="The most power the systems of an architecture may draw, if limited.",
+    )
+    space_limit = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="The most space the systems of an architecture may take up, if limited.",
+    )
+
+    def get_resource_limits(self):
+        """Get the limit of each resource this project limits, keyed by resource."""
+        limits = {resource: getattr(self, resource + '_limit') for resource in RESOURCES}
+        return {resource: limit for resource, limit in limits.items() if limit is not None}
 
     def add_goal(self, **kwargs):
         return Goal.objects.create(project=self, **kwargs)
@@ -129,6 +158,11 @@ class Scenario(CoreModel):
         related_name='sub_scenarios',
         help_text="A broader and more encompassing scenario.",
     )
+    weight = models.FloatField(
+        default=1.0,
+        help_text="How likely or important this scenario is, relative to the other "
+            "scenarios of the project.",
+    )
 
 
 class Category(CoreModel):
@@ -231,6 +265,17 @@ class Function(CoreModel):
         through_fields=('satisfier', 'satisfied'),
         help_text="The functions this function satisfies.",
     )
+    terms = models.ManyToManyField(
+        Term,
+        blank=True,
+        help_text="The glossary terms the name or description mention.",
+    )
+    signature = models.BinaryField(
+        blank=True,
+        null=True,
+        help_text="The MinHash signature of the name and description, used to "
+            "find near-duplicates.",
+    )
 
 
 class System(CoreModel):
@@ -293,6 +338,36 @@ class System(CoreModel):
         through_fields=('satisfier', 'satisfied'),
         help_text="The functions this function satisfies.",
     )
+    terms = models.ManyToManyField(
+        Term,
+        blank=True,
+        help_text="The glossary terms the name or description mention.",
+    )
+    signature = models.BinaryField(
+        blank=True,
+        null=True,
+        help_text="The MinHash signature of the name and description, used to "
+            "find near-duplicates.",
+    )
+    cost = models.FloatField(
+        default=0.0,
+        help_text="What the system costs, in the units the project limits it in.",
+    )
+    weight = models.FloatField(
+        default=0.0,
+        help_text="What the system weighs, in the units the project limits it in.",
+    )
+    power = models.FloatField(
+        default=0.0,
+        help_text="The power the system draws, in the units the project limits it in.",
+    )
+    space = models.FloatField(
+        default=0.0,
+        help_text="The space the system takes up, in the units the project limits it in.",
+    )
+
+    def get_resources(self):
+        return {resource: getattr(self, resource) for resource in RESOURCES}
 
 
 class WeightingScale(CoreModel):
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from django.db import models
+from logging import getLogger
+from uuid import uuid4
+from .core import Project
+
+
+__all__ = ('Job',)
+
+
+logger = getLogger(__name__)
+
+
+class Job(models.Model):
+    """
+    A long-running task queued to be run by the ``run_workers`` command.
+
+    The arguments and the result are stored as JSON. A running job reports its
+    progress and is told when it has been cancelled, and the workers running
+    it keep its heartbeat up to date, so that the jobs of workers that died
+    can be queued again.
+
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid4,
+        editable=False,
+    )
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='jobs',
+        help_text="The project the job works on, if any.",
+    )
+    task = models.CharField(
+        max_length=64,
+        help_text="The name of the registered task to run.",
+    )
+    arguments = models.TextField(
+        default='{}',
+        help_text="The keyword arguments of the task, as JSON.",
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=QUEUED,
+    )
+    progress = models.FloatField(
+        default=0.0,
+        help_text="How much of the job is done, between 0 and 1.",
+    )
+    message = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="What the job is doing, or why it failed.",
+    )
+    result = models.TextField(
+        blank=True,
+        help_text="What the task returned, as JSON.",
+    )
+    error = models.TextField(
+        blank=True,
+        help_text="The traceback of the failure, if the job failed.",
+    )
+    cancel_requested = models.BooleanField(
+        default=False,
+        help_text="Whether the job should stop at its next progress report.",
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="How many times a worker started the job.",
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3,
+        help_text="How many times the job is started before giving up on crashed workers.",
+    )
+    worker = models.CharField(
+        max_length=128,
+        blank=True,
+        help_text="The host and process id of the worker running the job.",
+    )
+    created_on = models.DateTimeField(
+        auto_now_add=True,
+    )
+    started_on = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    heartbeat_on = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When the worker last said it was still running the job.",
+    )
+    finished_on = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        ordering = ['-created_on']
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['status', 'created_on']),
+            ]
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
+
+    def __str__(self):
+        return "<Job: {} ({})>".format(self.task, self.status)
@@ -1,5 +1,6 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+from django.core.exceptions import ValidationError
 from django.db import models
 from logging import getLogger
 from polymorphic.models import PolymorphicModel
@@ -38,11 +39,40 @@ class Relationship(PolymorphicModel):
         help_text="The project this relationship belongs to.",
     )
 
+    # The fields that, along with the scenario, identify what is being stated
+    identity_fields = ()
+
+    class Meta:
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['project', 'scenario']),
+            ]
+
+    def validate_unique(self, exclude=None):
+        """
+        Check that the same relationship is not stated twice for a scenario.
+
+        The scenario lives in the parent table, so this cannot be a database
+        constraint on the tables of the relationship types.
+
+        """
+        super().validate_unique(exclude)
+        identity = {
+            field: getattr(self, field + '_id')
+            for field in self.identity_fields
+        }
+        if not identity or None in identity.values():
+            return
+        duplicates = (type(self).objects
+                                .filter(scenario=self.scenario_id, **identity)
+                                .exclude(pk=self.pk))
+        if duplicates.exists():
+            raise ValidationError("This relationship has already been stated for this scenario.")
+
     def latest_votes(self):
-        # TODO: if using PostgreSQL, use `distinct`: http://stackoverflow.com/questions/18433314
-        # return self.votes.values('expert').annotate(cast_on=models.aggregates.Max('cast_on'))
-        # return Vote.objects.filter(relationship=self).values('expert').latest('cast_on')
-        return self.votes.values('expert').latest('cast_on')
+        """Get the latest vote of each expert on this relationship."""
+        from ..analysis import get_latest_votes
+        return get_latest_votes(self.vote_set.all())
 
 
 class FunctionRequires(Relationship):
@@ -72,8 +102,14 @@ class FunctionRequires(Relationship):
         help_text="The function that is required.",
     )
 
+    identity_fields = ('requiring', 'required')
+
     class Meta:
         verbose_name_plural = 'Required Functions'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['requiring', 'required']),
+            ]
 
     def __str__(self):
         return "{} requires {}".format(self.requiring, self.required)
@@ -106,8 +142,14 @@ class FunctionSatisfies(Relationship):
         help_text="The function that is satisfied.",
     )
 
+    identity_fields = ('satisfier', 'satisfied')
+
     class Meta:
         verbose_name_plural = 'Functions Satisfied'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['satisfier', 'satisfied']),
+            ]
 
     def __str__(self):
         return "{} satisfies {}".format(self.satisfier, self.satisfied)
@@ -138,8 +180,14 @@ class SystemRequires(Relationship):
         help_text="The function that is required.",
     )
 
+    identity_fields = ('requiring', 'required')
+
     class Meta:
         verbose_name_plural = 'Required Functions'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['requiring', 'required']),
+            ]
 
     def __str__(self):
         return "{} requires {}".format(self.requiring, self.required)
@@ -183,8 +231,14 @@ class SystemSatisfies(Relationship):
             "with.",
     )
 
+    identity_fields = ('satisfier', 'satisfied')
+
     class Meta:
         verbose_name_plural = 'Functions Satisfied'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['satisfier', 'satisfied']),
+            ]
 
     def __str__(self):
         return "{} satisfies {}".format(self.satisfier, self.satisfied)
@@ -218,8 +272,14 @@ class SystemSatisfactionRequires(Relationship):
         help_text="The function that is required.",
     )
 
+    identity_fields = ('relationship', 'required')
+
     class Meta:
         verbose_name_plural = 'Required Functions'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['relationship', 'required']),
+            ]
 
     def __str__(self):
         msg = "{} required by {} while satisfying {}"
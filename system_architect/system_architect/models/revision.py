@@ -0,0 +1,36 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+from django.db import models
+from logging import getLogger
+from .core import Project
+
+
+__all__ = ('ProjectChange',)
+
+
+logger = getLogger(__name__)
+
+
+class ProjectChange(models.Model):
+    """
+    A committed transaction that changed a project, see system_architect/revisions.py.
+
+    The revision of a project is the number of its changes. Transactions only
+    ever insert these rows, so those changing the same project do not wait
+    for each other on a counter, and a change counts as soon as, and not
+    before, its transaction commits.
+
+    There is no foreign key constraint, since deleting a project changes it
+    as its contents are deleted, after the rows pointing to it were collected.
+    The changes of a deleted project are deleted with it by a receiver.
+
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+
+    def __str__(self):
+        return "Change {} of {}".format(self.pk, self.project_id)
@@ -9,7 +9,7 @@ from .core import WeightLevel
 from .relationship import Relationship
 
 
-__all__ = ('Vote',)
+__all__ = ('Vote', 'VoteHistory', 'VoteRecord')
 
 
 logger = getLogger(__name__)
@@ -17,7 +17,10 @@ logger = getLogger(__name__)
 
 class Organization(CoreModel):
     # TODO: Complete this model
-    pass
+    credibility = models.FloatField(
+        default=1.0,
+        help_text="How much the votes of its experts count, relative to other organizations.",
+    )
 
 
 class ExpertProfile(models.Model):
@@ -39,6 +42,11 @@ class ExpertProfile(models.Model):
     phone = models.CharField(
         max_length=32,
     )
+    credibility = models.FloatField(
+        default=1.0,
+        help_text="How much the votes of the expert count in the consensus, as last "
+                  "computed by the update_credibility command.",
+    )
 
     def __str__(self):
         return str(self.user)
@@ -50,9 +58,21 @@ def create_expert_profile(sender, instance, created, **kwargs):
         ExpertProfile.objects.create(user=instance)
 
 
+def is_profile_loaded(user):
+    descriptor = User.expertprofile
+    if hasattr(descriptor, 'is_cached'):
+        return descriptor.is_cached(user)
+    return hasattr(user, descriptor.related.get_cache_name())
+
+
 @receiver(models.signals.post_save, sender=User)
-def save_expert_profile(sender, instance, **kwargs):
-    instance.expertprofile.save()
+def save_expert_profile(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Only a full save of a user whose profile was loaded can carry profile
+    # changes, partial saves such as the one recording the last login cannot
+    if created or raw or update_fields is not None:
+        return
+    if is_profile_loaded(instance):
+        instance.expertprofile.save()
 
 
 class Vote(models.Model):
@@ -98,3 +118,91 @@ class Vote(models.Model):
                                      'expert',
                                      '-cast_on']),
             ]
+
+
+class VoteHistory(models.Model):
+    """
+    A vote that was superseded by a newer one from the same expert.
+
+    Superseded votes are moved here by the ``archive_votes`` command, keeping
+    their original id, so that the vote table and its index only hold what the
+    analyses need. Only the index used to look up past votes is kept, which
+    keeps archiving cheap.
+
+    """
+    id = models.IntegerField(
+        primary_key=True,
+        help_text="The id the vote had before being archived.",
+    )
+    relationship = models.ForeignKey(
+        Relationship,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='+',
+    )
+    expert = models.ForeignKey(
+        ExpertProfile,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        db_index=False,
+        related_name='+',
+    )
+    value = models.ForeignKey(
+        WeightLevel,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='+',
+    )
+    comments = models.TextField(blank=True)
+    cast_on = models.DateTimeField()
+    confidence = models.PositiveSmallIntegerField(
+        choices=Vote.CONFIDENCE_LEVELS,
+        default=0,
+    )
+
+    class Meta:
+        verbose_name_plural = 'vote history'
+        if hasattr(models, 'Index'):
+            indexes = [
+                models.Index(fields=['relationship',
+                                     'expert',
+                                     '-cast_on']),
+            ]
+
+
+class VoteRecord(models.Model):
+    """
+    Every vote ever cast, whether current or archived.
+
+    This is a read only view over the votes and their history, which answers
+    questions about what the experts thought at some point in the past.
+
+    """
+    id = models.IntegerField(primary_key=True)
+    relationship = models.ForeignKey(
+        Relationship,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    expert = models.ForeignKey(
+        ExpertProfile,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name='+',
+    )
+    value = models.ForeignKey(
+        WeightLevel,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    comments = models.TextField()
+    cast_on = models.DateTimeField()
+    confidence = models.PositiveSmallIntegerField(choices=Vote.CONFIDENCE_LEVELS)
+
+    class Meta:
+        managed = False
+        db_table = 'system_architect_voterecord'
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Calling the functions of the app in pool processes, however they are started.
+
+Forked processes inherit the loaded apps, but those that are spawned, or
+started by a fork server, import whatever they unpickle before anything runs
+in them, and the models cannot be imported before Django is set up. Pools
+thus run ``call`` with the dotted path of the function and its pickled
+arguments, as ``prepare_call`` gives them, and this module imports nothing
+that needs the apps.
+
+"""
+from django import setup
+from django.apps import apps
+from django.utils.module_loading import import_string
+from pickle import dumps, loads
+
+
+__all__ = ('call', 'prepare_call')
+
+
+def prepare_call(function, *args):
+    """Get the arguments of ``call`` that call a function with the given arguments."""
+    return '{}.{}'.format(function.__module__, function.__qualname__), dumps(args)
+
+
+def call(path, arguments):
+    """
+    Call a function, setting Django up first if this process has not.
+
+    :param path: the dotted path of the function
+    :param arguments: the pickled tuple of its positional arguments
+    :return: what the function returns
+
+    """
+    if not apps.ready:
+        setup()
+    return import_string(path)(*loads(arguments))
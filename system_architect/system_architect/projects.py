@@ -0,0 +1,411 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Project-wide bulk operations.
+
+These work table by table with set-based queries instead of going through the
+ORM one instance at a time, so their cost grows with the number of tables
+rather than the number of rows.
+
+"""
+from collections import OrderedDict
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.sql import DeleteQuery, InsertQuery
+from logging import getLogger
+from uuid import uuid4
+from .models import (Category, Function, FunctionRequires, FunctionSatisfies, Goal, Job, Project,
+                     ProjectChange, RESOURCES, RequirementClosure, Scenario, System,
+                     SystemArchitecture, SystemRequires, SystemSatisfactionRequires, SystemSatisfies,
+                     Vote, VoteHistory, WeightingScale, WeightLevel)
+from .models.relationship import Relationship
+from .analysis import (forget_centrality, forget_evaluators, forget_scenario_scores, get_latest_votes,
+                       rebuild_closure)
+from .search import index_objects, remove_project_from_index
+
+
+__all__ = ('clone_project', 'purge_project')
+
+
+logger = getLogger(__name__)
+
+
+RELATIONSHIP_MODELS = (FunctionRequires, FunctionSatisfies, SystemRequires, SystemSatisfies,
+                       SystemSatisfactionRequires)
+
+# The relationship tables in the order they can be purged
+PURGED_RELATIONSHIPS = (
+    ('system satisfaction requirements', SystemSatisfactionRequires),
+    ('function requirements', FunctionRequires),
+    ('function satisfactions', FunctionSatisfies),
+    ('system requirements', SystemRequires),
+    ('system satisfactions', SystemSatisfies),
+)
+
+
+def get_rows(queryset, fields):
+    """Get the values of the given fields of each row, keyed by attribute name."""
+    fields = [queryset.model._meta.get_field(field) for field in fields]
+    return [
+        {field.attname: value for field, value in zip(fields, row)}
+        for row in queryset.values_list(*(field.name for field in fields))
+    ]
+
+
+def get_field_names(model, local=False):
+    fields = model._meta.local_concrete_fields if local else model._meta.concrete_fields
+    return [field.name for field in fields]
+
+
+def allocate_ids(model, count):
+    """
+    Reserve integer primary keys for rows that are going to be inserted.
+
+    On PostgreSQL the values are drawn from the table's sequence. Other
+    backends use the values after the current maximum, so the caller must
+    already hold a write lock, e.g., by having written in the transaction.
+
+    """
+    if count == 0:
+        return []
+    table = model._meta.db_table
+    column = model._meta.pk.column
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [table, column, count],
+            )
+            return [value for value, in cursor.fetchall()]
+        quote = connection.ops.quote_name
+        cursor.execute("SELECT MAX({}) FROM {}".format(quote(column), quote(table)))
+        highest, = cursor.fetchone()
+    start = (highest or 0) + 1
+    return list(range(start, start + count))
+
+
+def insert_local_rows(model, objects):
+    """
+    Insert the rows of a multi-table inherited model into its own table only.
+
+    ``bulk_create`` refuses to insert into inherited models, because it cannot
+    insert the parent rows, but here they have already been inserted.
+
+    """
+    if not objects:
+        return
+    fields = model._meta.local_concrete_fields
+    batch_size = connection.ops.bulk_batch_size(fields, objects) or len(objects)
+    for start in range(0, len(objects), batch_size):
+        query = InsertQuery(model)
+        query.insert_values(fields, objects[start:start + batch_size])
+        query.get_compiler(connection=connection).execute_sql()
+
+
+def copy_rows(model, rows, **remaps):
+    """
+    Make unsaved copies of rows, replacing the values of some fields.
+
+    :param remaps: for each attribute name, either a dictionary mapping old
+        values to new ones (values not in it become None) or a new value
+    :return: the list of copies
+
+    """
+    copies = []
+    for row in rows:
+        values = dict(row)
+        for attname, remap in remaps.items():
+            values[attname] = remap.get(values[attname]) if isinstance(remap, dict) else remap
+        copies.append(model(**values))
+    return copies
+
+
+def copy_through_rows(field, rows, source_map, target_map=None):
+    """Copy the rows of a many-to-many through table, remapping both ends."""
+    through = field.remote_field.through
+    source_name = field.m2m_column_name()
+    target_name = field.m2m_reverse_name()
+    copies = [
+        through(**{
+            source_name: source_map[source],
+            target_name: target_map.get(target) if target_map is not None else target,
+        })
+        for source, target in rows
+        if source in source_map
+    ]
+    through.objects.bulk_create(copies)
+
+
+def get_through_rows(field, sources):
+    """Get the (source, target) keys of the through rows of a queryset of sources."""
+    through = field.remote_field.through
+    return (through.objects
+                   .filter(**{field.m2m_field_name() + '__in': sources.values('pk')})
+                   .values_list(field.m2m_column_name(), field.m2m_reverse_name()))
+
+
+def clone_uuid_rows(model, queryset, parent=None, **remaps):
+    """
+    Copy the rows of a model with UUID keys and return the old to new key mapping.
+
+    :param parent: the attribute name of a foreign key to the same table, if any
+
+    """
+    rows = get_rows(queryset, get_field_names(model))
+    id_map = {row['id']: uuid4() for row in rows}
+    if parent is not None:
+        remaps[parent] = id_map
+    model.objects.bulk_create(copy_rows(model, rows, id=id_map, **remaps))
+    return id_map
+
+
+def clone_project(project, name=None):
+    """
+    Make a copy of a project and everything in it.
+
+    New keys are generated up front and every foreign key and many-to-many
+    row is remapped in memory, so each table is written with a few bulk
+    inserts inside one transaction. Only the latest vote of each expert on
+    each relationship is copied, which is all the analyses use.
+
+    :param project: the project to copy
+    :param name: the name of the copy, defaults to the original's with " (copy)"
+    :return: the new project
+
+    """
+    with transaction.atomic():
+        clone = Project.objects.create(
+            name=name or "{} (copy)".format(project.name)[:Project._meta.get_field('name').max_length],
+            description=project.description,
+            **{resource + '_limit': getattr(project, resource + '_limit') for resource in RESOURCES}
+        )
+        glossary = Project._meta.get_field('glossary')
+        copy_through_rows(glossary,
+                          get_through_rows(glossary, Project.objects.filter(pk=project.pk)),
+                          {project.pk: clone.pk})
+
+        scenario_map = clone_uuid_rows(Scenario, Scenario.objects.filter(project=project),
+                                       parent='parent_id', project_id=clone.pk)
+        category_map = clone_uuid_rows(Category, Category.objects.filter(project=project),
+                                       parent='parent_id', project_id=clone.pk)
+        scale_map = clone_uuid_rows(WeightingScale, WeightingScale.objects.filter(project=project),
+                                    project_id=clone.pk)
+        level_rows = get_rows(WeightLevel.objects.filter(scale__project=project),
+                              get_field_names(WeightLevel))
+        level_map = dict(zip(
+            (row['id'] for row in level_rows),
+            allocate_ids(WeightLevel, len(level_rows)),
+        ))
+        WeightLevel.objects.bulk_create(copy_rows(
+            WeightLevel, level_rows, id=level_map, scale_id=scale_map))
+
+        entity_maps = {}
+        for model in (Function, System, Goal):
+            entities = model.objects.filter(project=project)
+            entity_maps[model] = clone_uuid_rows(model, entities, project_id=clone.pk)
+            for field in model._meta.many_to_many:
+                if field.remote_field.through._meta.auto_created:
+                    target_map = category_map if field.related_model is Category else None
+                    copy_through_rows(field, get_through_rows(field, entities),
+                                      entity_maps[model], target_map)
+        function_map, system_map = entity_maps[Function], entity_maps[System]
+
+        relationship_map = clone_relationships(project, clone, {
+            'scenario_id': scenario_map,
+            'scale_id': scale_map,
+            'requiring_id': {**function_map, **system_map},
+            'required_id': function_map,
+            'satisfier_id': {**function_map, **system_map},
+            'satisfied_id': function_map,
+        })
+
+        latest_votes = get_rows(get_latest_votes(Vote.objects.filter(relationship__project=project)),
+                                ('relationship', 'expert', 'comments', 'value', 'confidence'))
+        Vote.objects.bulk_create(copy_rows(
+            Vote, latest_votes, relationship_id=relationship_map, value_id=level_map))
+
+        architectures = SystemArchitecture.objects.filter(project=project)
+        architecture_map = clone_uuid_rows(SystemArchitecture, architectures, project_id=clone.pk)
+        systems_field = SystemArchitecture._meta.get_field('systems')
+        copy_through_rows(systems_field, get_through_rows(systems_field, architectures),
+                          architecture_map, system_map)
+
+        # Bulk inserts do not send the signals that keep the search index up to date
+        for model in entity_maps:
+            index_objects(model.objects.filter(project=clone).iterator())
+        rebuild_closure(clone)
+
+    return clone
+
+
+def clone_relationships(project, clone, remaps):
+    """Copy the parent and child rows of every relationship of a project."""
+    base_fields = get_field_names(Relationship)
+    base_rows = get_rows(Relationship.objects.non_polymorphic().filter(project=project), base_fields)
+    relationship_map = dict(zip(
+        (row['id'] for row in base_rows),
+        allocate_ids(Relationship, len(base_rows)),
+    ))
+    Relationship.objects.bulk_create(copy_rows(
+        Relationship, base_rows,
+        id=relationship_map, project_id=clone.pk,
+        scenario_id=remaps['scenario_id'], scale_id=remaps['scale_id'],
+    ))
+
+    for model in RELATIONSHIP_MODELS:
+        fields = get_field_names(model, local=True)
+        attnames = {model._meta.get_field(field).attname for field in fields}
+        local_remaps = {
+            attname: remap
+            for attname, remap in remaps.items()
+            if attname in attnames
+        }
+        if model is SystemSatisfactionRequires:
+            local_remaps['relationship_id'] = relationship_map
+        rows = get_rows(model.objects.non_polymorphic().filter(project=project), fields)
+        insert_local_rows(model, copy_rows(
+            model, rows, relationship_ptr_id=relationship_map, **local_remaps))
+
+    incompatible = SystemSatisfies._meta.get_field('incompatible')
+    copy_through_rows(incompatible,
+                      get_through_rows(incompatible, SystemSatisfies.objects.filter(project=project)),
+                      relationship_map, relationship_map)
+    return relationship_map
+
+
+def get_chunks(values, chunk_size):
+    for start in range(0, len(values), chunk_size):
+        yield values[start:start + chunk_size]
+
+
+def get_purge_steps(project, relationship_ids, chunk_size):
+    """
+    Get what has to be deleted to purge a project, in an order that never
+    leaves a row pointing to a deleted one.
+
+    :return: a list of (label, model, querysets) tuples
+
+    """
+    def by_relationship(queryset, field):
+        return [
+            queryset.filter(**{field + '__in': chunk})
+            for chunk in get_chunks(relationship_ids, chunk_size)
+        ]
+
+    def through(model, field_name):
+        field = model._meta.get_field(field_name)
+        through_model = field.remote_field.through
+        sources = model.objects.filter(project=project).values('pk')
+        return (through_model, [
+            through_model.objects.filter(**{field.m2m_field_name() + '__in': sources})
+        ])
+
+    incompatible = SystemSatisfies._meta.get_field('incompatible').remote_field.through
+    steps = [
+        ('votes', Vote, by_relationship(Vote.objects.all(), 'relationship')),
+        ('archived votes', VoteHistory, by_relationship(VoteHistory.objects.all(), 'relationship')),
+        ('incompatibilities', incompatible, [
+            incompatible.objects.filter(Q(from_systemsatisfies__in=chunk) |
+                                        Q(to_systemsatisfies__in=chunk))
+            # Each chunk is matched against both ends of the incompatibilities
+            for chunk in get_chunks(relationship_ids, max(1, chunk_size // 2))
+        ]),
+    ]
+    for label, model in PURGED_RELATIONSHIPS:
+        steps.append((label, model,
+                      by_relationship(model.objects.non_polymorphic(), 'relationship_ptr')))
+    steps.extend((
+        ('requirement closure', RequirementClosure, [
+            RequirementClosure.objects.filter(Q(project=project) |
+                                              Q(required__project=project) |
+                                              Q(requiring_function__project=project) |
+                                              Q(requiring_system__project=project))
+        ]),
+        ('relationships', Relationship,
+         by_relationship(Relationship.objects.non_polymorphic(), 'pk')),
+        ('architecture systems',) + through(SystemArchitecture, 'systems'),
+        ('architectures', SystemArchitecture, [SystemArchitecture.objects.filter(project=project)]),
+        ('function categories',) + through(Function, 'categories'),
+        ('system categories',) + through(System, 'categories'),
+        ('function terms',) + through(Function, 'terms'),
+        ('system terms',) + through(System, 'terms'),
+        ('goal terms',) + through(Goal, 'terms'),
+        ('goals', Goal, [Goal.objects.filter(project=project)]),
+        ('functions', Function, [Function.objects.filter(project=project)]),
+        ('systems', System, [System.objects.filter(project=project)]),
+        ('weight levels', WeightLevel, [WeightLevel.objects.filter(scale__project=project)]),
+        ('weighting scales', WeightingScale, [WeightingScale.objects.filter(project=project)]),
+        ('categories', Category, [Category.objects.filter(project=project)]),
+        ('scenarios', Scenario, [Scenario.objects.filter(project=project)]),
+        ('jobs', Job, [Job.objects.filter(project=project)]),
+        ('glossary', Project.glossary.through, [Project.glossary.through.objects.filter(project=project)]),
+        ('changes', ProjectChange, [ProjectChange.objects.filter(project=project)]),
+        ('project', Project, [Project.objects.filter(pk=project.pk)]),
+    ))
+    return steps
+
+
+def get_relationship_ids(project):
+    """Get the relationships of a project and those pointing into it from elsewhere."""
+    relationship_ids = set(Relationship.objects.filter(project=project).values_list('pk', flat=True))
+    for model in RELATIONSHIP_MODELS:
+        ends = [
+            field.name
+            for field in model._meta.local_concrete_fields
+            if field.related_model in (Function, System)
+        ]
+        pointing = Q()
+        for end in ends:
+            pointing |= Q(**{end + '__project': project})
+        relationship_ids.update(model.objects.non_polymorphic()
+                                     .filter(pointing)
+                                     .exclude(project=project)
+                                     .values_list('pk', flat=True))
+    return sorted(relationship_ids)
+
+
+def purge_project(project, chunk_size=500, dry_run=False):
+    """
+    Delete a project and everything in it with set-based queries.
+
+    Django's deletion collector loads every related row into memory to
+    cascade in Python. Instead, each table is purged in dependency order by
+    deleting chunks of primary keys, each chunk in its own short transaction
+    so concurrent writers are not locked out for the whole purge.
+
+    :param project: the project to delete
+    :param chunk_size: the most rows deleted per query and transaction
+    :param dry_run: only count what would be deleted
+    :return: an ordered dictionary of the number of rows deleted per label
+
+    """
+    relationship_ids = get_relationship_ids(project)
+    if not dry_run:
+        # Detach what would otherwise point to deleted rows between chunks,
+        # as the SET_NULL foreign keys would
+        for model in (Scenario, Category):
+            model.objects.filter(parent__project=project).update(parent=None)
+        (Relationship.objects.filter(scenario__project=project)
+                             .exclude(project=project)
+                             .update(scenario=None))
+
+    counts = OrderedDict()
+    for label, model, querysets in get_purge_steps(project, relationship_ids, chunk_size):
+        if dry_run:
+            counts[label] = sum(queryset.count() for queryset in querysets)
+            continue
+        counts[label] = 0
+        for queryset in querysets:
+            while True:
+                pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+                if not pks:
+                    break
+                with transaction.atomic():
+                    counts[label] += DeleteQuery(model).delete_batch(pks, connection.alias)
+
+    if not dry_run:
+        remove_project_from_index(project.pk)
+        forget_evaluators(project_id=project.pk)
+        forget_centrality(project_id=project.pk)
+        forget_scenario_scores(project_id=project.pk)
+    return counts
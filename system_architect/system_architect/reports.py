@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Spreadsheet reports of the relationships, votes, experts and architectures of a project,
+and of where its experts disagree or contradict themselves.
+
+Every report is a header and a lazy sequence of rows read with ``iterator``,
+with the related names fetched in the same query, and is written out in
+batches of rows. A report of millions of votes thus takes the memory of one
+batch and its first bytes go out as soon as the first batch is read.
+
+Reports are written as CSV, or as SpreadsheetML, the XML workbook format
+that Excel opens natively, which keeps numbers as numbers.
+
+"""
+from collections import OrderedDict, namedtuple
+from csv import writer
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Avg, Count, Max, Min
+from io import StringIO
+from logging import getLogger
+from re import compile
+from xml.sax.saxutils import escape, quoteattr
+from .analysis import (VoteTable, evaluate_architecture, find_contradictions, get_agreement_matrix,
+                       get_consensus, get_disagreements)
+from .analysis.graph import RELATIONSHIP_FIELDS
+from .lazy import LazyModule
+from .models import SystemArchitecture, Vote
+
+
+np = LazyModule('numpy')
+
+
+__all__ = ('REPORTS', 'REPORT_FORMATS', 'Report', 'get_report', 'write_report')
+
+
+logger = getLogger(__name__)
+
+
+BATCH_SIZE = 500
+
+
+Report = namedtuple('Report', ('name', 'header', 'rows'))
+
+
+def get_relationship_rows(project, scenario=None):
+    consensus = get_consensus(Vote.objects.filter(relationship__project=project))
+    for kind, model, (source, target, _) in RELATIONSHIP_FIELDS:
+        relationships = model.objects.non_polymorphic().filter(project=project)
+        if scenario is not None:
+            relationships = relationships.filter(scenario=scenario)
+        rows = (relationships
+                    .order_by('scenario__name', source + '__name', target + '__name')
+                    .values_list('pk', 'scenario__name', source + '__name', target + '__name',
+                                 'scale__name')
+                    .iterator())
+        for pk, scenario_name, source_name, target_name, scale_name in rows:
+            yield (scenario_name or '', kind, source_name, target_name, scale_name,
+                   consensus.get(pk))
+
+
+def get_vote_rows(project, scenario=None):
+    content_types = ContentType.objects.get_for_models(
+        *(model for _, model, _ in RELATIONSHIP_FIELDS), for_concrete_models=False)
+    kinds = {
+        content_types[model].pk: kind
+        for kind, model, _ in RELATIONSHIP_FIELDS
+    }
+    confidence_levels = dict(Vote.CONFIDENCE_LEVELS)
+    votes = Vote.objects.filter(relationship__project=project)
+    if scenario is not None:
+        votes = votes.filter(relationship__scenario=scenario)
+    rows = (votes
+                .order_by('cast_on', 'pk')
+                .values_list('cast_on', 'relationship', 'relationship__polymorphic_ctype',
+                             'relationship__scenario__name', 'expert__user__username',
+                             'value__scale__name', 'value__name', 'value__value', 'confidence',
+                             'comments')
+                .iterator())
+    for (cast_on, relationship_id, content_type_id, scenario_name, expert, scale, level, value,
+         confidence, comments) in rows:
+        yield (cast_on.isoformat(), str(relationship_id), kinds.get(content_type_id, ''),
+               scenario_name or '', expert or '', scale, level, value,
+               confidence_levels.get(confidence, confidence), comments)
+
+
+def get_expert_rows(project, scenario=None):
+    votes = Vote.objects.filter(relationship__project=project)
+    if scenario is not None:
+        votes = votes.filter(relationship__scenario=scenario)
+    rows = (votes
+                .values('expert__user__username')
+                .annotate(votes=Count('pk'),
+                          relationships=Count('relationship', distinct=True),
+                          first_vote=Min('cast_on'),
+                          last_vote=Max('cast_on'),
+                          confidence=Avg('confidence'))
+                .order_by('expert__user__username')
+                .iterator())
+    for row in rows:
+        yield (row['expert__user__username'] or '', row['votes'], row['relationships'],
+               row['first_vote'].isoformat(), row['last_vote'].isoformat(), row['confidence'])
+
+
+def get_architecture_rows(project, scenario=None):
+    functions = list(project.functions.order_by('name').values_list('pk', 'name'))
+    for architecture in SystemArchitecture.objects.filter(project=project).order_by('name'):
+        satisfaction = evaluate_architecture(architecture, scenario)
+        for pk, name in functions:
+            yield (architecture.name, name, satisfaction.get(pk, 0.0))
+
+
+def get_names(project):
+    """Get the names of the functions, systems and scenarios of a project, by id."""
+    names = dict(project.functions.values_list('pk', 'name'))
+    names.update(project.systems.values_list('pk', 'name'))
+    names.update(project.scenarios.values_list('pk', 'name'))
+    return names
+
+
+def get_disagreement_rows(project, scenario=None):
+    table = VoteTable(project, scenario)
+    names = get_names(project)
+    disagreed, spreads = get_disagreements(table)
+    for position in disagreed:
+        yield (names.get(table.scenarios[position], ''), table.kinds[position],
+               names.get(table.sources[position]), names.get(table.targets[position]),
+               int(spreads.experts[position]), float(spreads.lowest[position]),
+               float(spreads.highest[position]), float(spreads.deviation[position]))
+
+
+def get_agreement_rows(project, scenario=None):
+    table = VoteTable(project, scenario)
+    experts = table.get_expert_names()
+    shared, agreement = get_agreement_matrix(table)
+    first, second = np.triu_indices(len(experts), 1)
+    pairs = shared[first, second] > 0
+    first, second = first[pairs], second[pairs]
+    # The pairs of experts who agree the least come first
+    for index in np.argsort(agreement[first, second], kind='stable'):
+        yield (experts[first[index]], experts[second[index]],
+               int(shared[first[index], second[index]]), float(agreement[first[index], second[index]]))
+
+
+def get_contradiction_rows(project, scenario=None):
+    table = VoteTable(project, scenario)
+    names = get_names(project)
+    experts = dict(zip(table.experts, table.get_expert_names()))
+    positions = {pk: position for position, pk in enumerate(table.relationships)}
+    for contradiction in sorted(find_contradictions(table),
+                                key=lambda contradiction: experts[contradiction.expert]):
+        position = positions[contradiction.relationship]
+        yield (experts[contradiction.expert], names.get(table.scenarios[position], ''),
+               contradiction.kind, names.get(table.sources[position]),
+               names.get(table.targets[position]), len(contradiction.others))
+
+
+# The header and rows of every report, by name
+REPORTS = OrderedDict((
+    ('relationships', (('Scenario', 'Kind', 'Source', 'Target', 'Scale', 'Consensus'),
+                       get_relationship_rows)),
+    ('votes', (('Cast on', 'Relationship', 'Kind', 'Scenario', 'Expert', 'Scale', 'Level',
+                'Value', 'Confidence', 'Comments'),
+               get_vote_rows)),
+    ('experts', (('Expert', 'Votes', 'Relationships', 'First vote', 'Last vote',
+                  'Average confidence'),
+                 get_expert_rows)),
+    ('architectures', (('Architecture', 'Function', 'Satisfaction'), get_architecture_rows)),
+    ('disagreements', (('Scenario', 'Kind', 'Source', 'Target', 'Experts', 'Lowest', 'Highest',
+                        'Deviation'),
+                       get_disagreement_rows)),
+    ('agreement', (('Expert', 'Other expert', 'Shared relationships', 'Agreement'),
+                   get_agreement_rows)),
+    ('contradictions', (('Expert', 'Scenario', 'Contradiction', 'Required', 'Requiring',
+                         'Contradicting votes'),
+                        get_contradiction_rows)),
+))
+
+
+def get_report(name, project, scenario=None):
+    """
+    Get a report of a project.
+
+    :param name: one of the names in ``REPORTS``
+    :param scenario: only report on the relationships stated for this scenario,
+                     or evaluate the architectures under it
+    :return: a ``Report`` whose rows are read as they are iterated over
+
+    """
+    if name not in REPORTS:
+        raise ValueError("Unknown report '{}'".format(name))
+    header, get_rows = REPORTS[name]
+    return Report(name, header, get_rows(project, scenario))
+
+
+def get_batches(rows, batch_size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_csv(report, batch_size=BATCH_SIZE):
+    """Write a report as CSV, yielding the text of one batch of rows at a time."""
+    output = StringIO()
+    csv = writer(output)
+    csv.writerow(report.header)
+    for batch in get_batches(report.rows, batch_size):
+        csv.writerows(('' if value is None else value for value in row) for row in batch)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    if output.getvalue():
+        yield output.getvalue()
+
+
+# Characters that XML 1.0 documents cannot hold
+INVALID_XML = compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def get_cell(value):
+    if value is None:
+        return '<Cell/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return '<Cell><Data ss:Type="Number">{!r}</Data></Cell>'.format(value)
+    return '<Cell><Data ss:Type="String">{}</Data></Cell>'.format(
+        escape(INVALID_XML.sub('', str(value))))
+
+
+def get_xml_row(row):
+    return '<Row>{}</Row>\n'.format(''.join(get_cell(value) for value in row))
+
+
+def write_spreadsheet(report, batch_size=BATCH_SIZE):
+    """Write a report as a SpreadsheetML workbook, yielding one batch of rows at a time."""
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<?mso-application progid="Excel.Sheet"?>\n'
+           '<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+           'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n'
+           '<Worksheet ss:Name={}>\n<Table>\n'.format(quoteattr(report.name)) +
+           get_xml_row(report.header))
+    for batch in get_batches(report.rows, batch_size):
+        yield ''.join(get_xml_row(row) for row in batch)
+    yield '</Table>\n</Worksheet>\n</Workbook>\n'
+
+
+# The content type and writer of every format, by file extension
+REPORT_FORMATS = {
+    'csv': ('text/csv', write_csv),
+    'xml': ('application/vnd.ms-excel', write_spreadsheet),
+}
+
+
+def write_report(report, extension, batch_size=BATCH_SIZE):
+    """Write a report in the format of a file extension, one chunk of text at a time."""
+    if extension not in REPORT_FORMATS:
+        raise ValueError("Reports cannot be written as '{}'".format(extension))
+    return REPORT_FORMATS[extension][1](report, batch_size)
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Telling the analyses kept in memory whether a project changed.
+
+The revision of a project is the number of committed transactions that
+changed what its analyses depend on: its votes, relationships, functions,
+systems, scenarios, weight levels, the systems of its architectures or its
+glossary. Each of them inserts one ``ProjectChange`` row, so that the change
+rolls back with the transaction, every server and job process sees it once
+committed, and concurrent transactions changing the same project do not wait
+for each other on a counter row.
+
+What is worked out from a project and kept in memory is stamped with the
+revision given by ``get_revision`` beforehand, and is worked out again once
+the project is past that revision. Once a transaction commits,
+``project_changed`` is sent with the revision it moved the project to, or
+past if others committed in between, and a ``Change`` for each thing that
+changed, so that what was stamped with the revision before can
+catch up instead of starting over.
+
+Writes that send no model signals, such as bulk creates, updates and raw
+deletes, must call ``touch_project`` themselves in their transaction.
+
+"""
+from collections import OrderedDict, namedtuple
+from django.db import models, transaction
+from django.dispatch import Signal, receiver
+from logging import getLogger
+from .database import get_pending_items, on_commit_with
+from .models import (Function, Project, ProjectChange, Scenario, System, SystemArchitecture, Term,
+                     Vote, WeightLevel, WeightingScale)
+from .models.relationship import Relationship
+
+
+__all__ = ('CREATED', 'Change', 'DELETED', 'SAVED', 'get_revision', 'project_changed',
+           'touch_project')
+
+
+logger = getLogger(__name__)
+
+
+CREATED = 'created'
+SAVED = 'saved'
+DELETED = 'deleted'
+
+
+# What changed: the model, or the through model of the systems of an
+# architecture or of a glossary, the instance, the architecture or project
+# for through models, and one of the actions above
+Change = namedtuple('Change', ('model', 'instance', 'action'))
+
+
+# Sent once a transaction that changed a project commits, with the changes in
+# the order they were made, a change of None standing for changes that cannot
+# be caught up with
+project_changed = Signal(providing_args=['project_id', 'revision', 'changes'])
+
+
+def touch_project(project_id, change=None):
+    """
+    Count a change to a project in its revision, once per transaction.
+
+    :param change: the ``Change`` made, or None if what changed cannot be told
+
+    """
+    with transaction.atomic(savepoint=False):
+        if not is_touched(project_id):
+            ProjectChange.objects.create(project_id=project_id)
+        on_commit_with(send_changes, (project_id, change))
+
+
+def is_touched(project_id):
+    """Tell whether the current transaction changed a project."""
+    return any(touched_id == project_id for touched_id, _ in get_pending_items(send_changes))
+
+
+def get_revision(project_id):
+    """
+    Get the revision of a project, to stamp what is worked out from it next.
+
+    :return: the committed revision, or None if the current transaction
+             changed the project, in which case what is worked out from it
+             must not be kept
+
+    """
+    if is_touched(project_id):
+        return None
+    return ProjectChange.objects.filter(project=project_id).count()
+
+
+def send_changes(items):
+    changes = OrderedDict()
+    for project_id, change in items:
+        changes.setdefault(project_id, []).append(change)
+    for project_id, project_changes in changes.items():
+        # Counted once committed, along with what others committed since
+        revision = ProjectChange.objects.filter(project=project_id).count()
+        responses = project_changed.send_robust(
+            sender=Project, project_id=project_id, revision=revision, changes=project_changes)
+        for receiver_function, response in responses:
+            if isinstance(response, Exception):
+                # The change is committed anyway, what is kept will be worked out again
+                logger.error("%s could not catch up with revision %d of %s",
+                             receiver_function.__name__, revision, project_id, exc_info=response)
+
+
+def get_action(kwargs):
+    if 'created' not in kwargs:
+        return DELETED
+    return CREATED if kwargs['created'] else SAVED
+
+
+@receiver(models.signals.post_save, sender=Vote)
+@receiver(models.signals.post_delete, sender=Vote)
+def touch_voted_project(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    relationship = getattr(instance, Vote._meta.get_field('relationship').get_cache_name(), None)
+    if relationship is not None and relationship.pk == instance.relationship_id:
+        project_id = relationship.project_id
+    else:
+        # Read after the vote was written, see database.write_transaction
+        project_id = (Relationship.objects
+                                  .non_polymorphic()
+                                  .filter(pk=instance.relationship_id)
+                                  .values_list('project', flat=True)
+                                  .first())
+    if project_id is not None:
+        touch_project(project_id, Change(sender, instance, get_action(kwargs)))
+
+
+@receiver(models.signals.post_save)
+@receiver(models.signals.post_delete)
+def touch_changed_project(sender, instance, raw=False, **kwargs):
+    if raw or not isinstance(instance, (Relationship, Function, System, Scenario,
+                                        SystemArchitecture)):
+        return
+    touch_project(instance.project_id, Change(sender, instance, get_action(kwargs)))
+
+
+@receiver(models.signals.post_save, sender=WeightLevel)
+@receiver(models.signals.post_delete, sender=WeightLevel)
+def touch_rescaled_project(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    project_id = (WeightingScale.objects
+                                .filter(pk=instance.scale_id)
+                                .values_list('project', flat=True)
+                                .first())
+    if project_id is not None:
+        touch_project(project_id, Change(sender, instance, get_action(kwargs)))
+
+
+@receiver(models.signals.m2m_changed, sender=SystemArchitecture.systems.through)
+def touch_architecture_project(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_project(instance.project_id, Change(sender, instance, SAVED))
+    elif pk_set is None:
+        # Clearing the architectures of a system does not say which ones it was in
+        touch_project(instance.project_id)
+    else:
+        for architecture in SystemArchitecture.objects.filter(pk__in=pk_set):
+            touch_project(architecture.project_id, Change(sender, architecture, SAVED))
+
+
+@receiver(models.signals.post_save, sender=Term)
+@receiver(models.signals.pre_delete, sender=Term)
+def touch_glossary_projects(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Before it is deleted, while it is still in the glossaries
+    for project_id in Project.objects.filter(glossary=instance).values_list('pk', flat=True):
+        touch_project(project_id, Change(sender, instance, get_action(kwargs)))
+
+
+@receiver(models.signals.m2m_changed, sender=Project.glossary.through)
+def touch_glossary_project(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_project(instance.pk, Change(sender, instance, SAVED))
+        return
+    if action == 'pre_clear':
+        # Clearing the glossaries of a term does not say which ones it was in
+        projects = Project.objects.filter(glossary=instance)
+    elif action in ('post_add', 'post_remove'):
+        projects = Project.objects.filter(pk__in=pk_set)
+    else:
+        return
+    for project in projects:
+        touch_project(project.pk, Change(sender, project, SAVED))
+
+
+@receiver(models.signals.post_delete, sender=Project)
+def delete_project_changes(sender, instance, **kwargs):
+    # Along with those of the deletion itself
+    ProjectChange.objects.filter(project=instance.pk).delete()
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Full-text search over the functions, systems, goals and terms of a project.
+
+On SQLite builds with FTS5 the entities are indexed in a virtual table that is
+kept in sync by signals, giving ranked prefix search that does not need to scan
+the entity tables. On other backends the search falls back to case insensitive
+containment filters ranked in Python.
+
+"""
+from collections import namedtuple
+from django.db import DatabaseError, connection, models
+from django.db.models import Q
+from django.dispatch import receiver
+from itertools import islice
+from logging import getLogger
+from re import UNICODE, findall
+from uuid import UUID
+from .models import Function, Goal, Project, System, Term
+
+
+__all__ = ('SearchResult', 'index_objects', 'rebuild_search_index', 'remove_project_from_index',
+           'search')
+
+
+logger = getLogger(__name__)
+
+
+SEARCH_TABLE = 'system_architect_search'
+
+SEARCHABLE_MODELS = {
+    'function': Function,
+    'system': System,
+    'goal': Goal,
+    'term': Term,
+}
+
+# The fields indexed as the description of each kind, besides its name
+DESCRIPTION_FIELDS = {
+    'function': ('description',),
+    'system': ('description',),
+    'goal': ('description', 'body'),
+    'term': ('description',),
+}
+
+# How much more a match in the name counts than a match in the description
+NAME_WEIGHT = 10.0
+
+
+SearchResult = namedtuple('SearchResult', ('kind', 'pk', 'name', 'score'))
+
+
+def get_words(query):
+    return findall(r'\w+', query.lower(), UNICODE)
+
+
+def get_kind(model):
+    for kind, searchable_model in SEARCHABLE_MODELS.items():
+        if issubclass(model, searchable_model):
+            return kind
+    return None
+
+
+# Whether each database has the search table, to avoid introspecting it on every save
+_has_search_table = {}
+
+
+def has_search_table():
+    if connection.vendor != 'sqlite':
+        return False
+    database = connection.settings_dict['NAME']
+    if database not in _has_search_table:
+        _has_search_table[database] = SEARCH_TABLE in connection.introspection.table_names()
+    return _has_search_table[database]
+
+
+def create_search_table():
+    """Create the FTS5 search table if the backend supports it."""
+    if connection.vendor != 'sqlite':
+        return False
+    _has_search_table.pop(connection.settings_dict['NAME'], None)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5("
+                "name, description, kind UNINDEXED, object_id UNINDEXED, "
+                "project_id UNINDEXED, prefix='2 3')".format(SEARCH_TABLE)
+            )
+    except DatabaseError:
+        logger.warning("SQLite was built without FTS5, falling back to unindexed search")
+        return False
+    return True
+
+
+def get_rowid(pk):
+    # FTS5 tables can only be looked up efficiently by their integer rowid, so
+    # the top 63 bits of the UUID are used as one
+    return pk.int >> 65
+
+
+def get_document(kind, instance):
+    description = " ".join(getattr(instance, field) for field in DESCRIPTION_FIELDS[kind])
+    project_id = getattr(instance, 'project_id', None)
+    return (get_rowid(instance.pk), instance.name, description, kind, instance.pk.hex,
+            project_id.hex if project_id else '')
+
+
+def index_objects(objects):
+    """Add or refresh the given entities in the search index."""
+    if not has_search_table():
+        return
+    documents = [
+        get_document(get_kind(type(instance)), instance)
+        for instance in objects
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "DELETE FROM {} WHERE rowid = %s".format(SEARCH_TABLE),
+            [(rowid,) for rowid, *_ in documents],
+        )
+        cursor.executemany(
+            "INSERT INTO {} (rowid, name, description, kind, object_id, project_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s)".format(SEARCH_TABLE),
+            documents,
+        )
+
+
+def remove_project_from_index(project_id):
+    """Remove the entities of a project deleted without signals from the index."""
+    if not has_search_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} WHERE project_id = %s".format(SEARCH_TABLE),
+                       [project_id.hex])
+
+
+def rebuild_search_index(chunk_size=2000):
+    """Re-index every searchable entity, creating the search table if needed."""
+    if not create_search_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {}".format(SEARCH_TABLE))
+    for model in SEARCHABLE_MODELS.values():
+        instances = model.objects.all().iterator()
+        for chunk in iter(lambda: list(islice(instances, chunk_size)), []):
+            index_objects(chunk)
+
+
+def search(query, project=None, kinds=None, limit=20):
+    """
+    Search the functions, systems, goals and terms matching all words of a query.
+
+    Every word also matches longer words it is a prefix of, e.g., "detec"
+    matches "detection". Matches in the name rank higher than in the description.
+
+    :param query: the text to search for
+    :param project: only search within the entities of this project
+    :param kinds: the kinds of entity to search, any of ``SEARCHABLE_MODELS``
+    :param limit: the maximum number of results to return
+    :return: a list of search results, best match first
+
+    """
+    words = get_words(query)
+    kinds = list(kinds or SEARCHABLE_MODELS)
+    if not words or not kinds:
+        return []
+    if has_search_table():
+        return search_index(words, project, kinds, limit)
+    return search_models(words, project, kinds, limit)
+
+
+def search_index(words, project, kinds, limit):
+    match = " ".join('"{}"*'.format(word) for word in words)
+    sql = [
+        "SELECT kind, object_id, name, -bm25({0}, %s, 1.0) AS score FROM {0}".format(SEARCH_TABLE),
+        "WHERE {} MATCH %s".format(SEARCH_TABLE),
+        "AND kind IN ({})".format(", ".join(["%s"] * len(kinds))),
+    ]
+    params = [NAME_WEIGHT, match] + kinds
+    if project is not None:
+        glossary = Project.glossary.through._meta.db_table
+        sql.append("AND (project_id = %s OR (kind = 'term' AND object_id IN "
+                   "(SELECT term_id FROM {} WHERE project_id = %s)))".format(glossary))
+        params.extend((project.pk.hex, project.pk.hex))
+    sql.append("ORDER BY score DESC LIMIT %s")
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(" ".join(sql), params)
+        return [
+            SearchResult(kind, UUID(object_id), name, score)
+            for kind, object_id, name, score in cursor.fetchall()
+        ]
+
+
+def search_models(words, project, kinds, limit):
+    results = []
+    for kind in kinds:
+        fields = DESCRIPTION_FIELDS[kind]
+        queryset = SEARCHABLE_MODELS[kind].objects.all()
+        if project is not None:
+            queryset = queryset.filter(project=project)
+        for word in words:
+            match = Q(name__icontains=word)
+            for field in fields:
+                match |= Q(**{field + '__icontains': word})
+            queryset = queryset.filter(match)
+        for pk, name, *descriptions in queryset.values_list('pk', 'name', *fields):
+            description = " ".join(descriptions)
+            score = sum(
+                NAME_WEIGHT * (word in name.lower()) + (word in description.lower())
+                for word in words
+            )
+            results.append(SearchResult(kind, pk, name, score))
+    results.sort(key=lambda result: result.score, reverse=True)
+    return results[:limit]
+
+
+@receiver(models.signals.post_save)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw and get_kind(sender) is not None:
+        index_objects([instance])
+
+
+@receiver(models.signals.post_delete)
+def remove_from_search_index(sender, instance, **kwargs):
+    if get_kind(sender) is None or not has_search_table():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {} WHERE rowid = %s".format(SEARCH_TABLE),
+                       [get_rowid(instance.pk)])
+
+
+@receiver(models.signals.post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == 'system_architect':
+        rebuild_search_index()
@@ -12,31 +12,50 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # TODO: Review the Django Deployment Checklist
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# TODO: Change location of secret key file in production
-SECRET_FILE = '.secret_key'
-if os.path.exists(SECRET_FILE):
-    with open(SECRET_FILE) as f:
-        SECRET_KEY = f.read().strip()
+# Set SYSTEM_ARCHITECT_PROFILE=production to run without the debugging apps,
+# with the secret key, allowed hosts and database taken from the environment:
+# DJANGO_SECRET_KEY, DJANGO_ALLOWED_HOSTS (comma separated), DJANGO_DATABASE_NAME
+# and DJANGO_CONN_MAX_AGE. See the benchmark_startup command for boot times.
+PROFILE = os.environ.get('SYSTEM_ARCHITECT_PROFILE', 'development')
+if PROFILE not in ('development', 'production'):
+    raise ImproperlyConfigured("Unknown SYSTEM_ARCHITECT_PROFILE '{}'".format(PROFILE))
+PRODUCTION = PROFILE == 'production'
+
+if PRODUCTION:
+    SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+    if not SECRET_KEY:
+        raise ImproperlyConfigured("Set DJANGO_SECRET_KEY to run in production")
 else:
-    from random import SystemRandom
-    from string import ascii_letters, digits, punctuation
-    alphabet = ascii_letters + digits + punctuation
-    SECRET_KEY = ''.join([SystemRandom().choice(alphabet)
-                          for i in range(50)])
-    with open(SECRET_FILE, 'w') as f:
-        f.write(SECRET_KEY)
-del SECRET_FILE
+    SECRET_FILE = os.path.join(BASE_DIR, '.secret_key')
+    if os.path.exists(SECRET_FILE):
+        with open(SECRET_FILE) as f:
+            SECRET_KEY = f.read().strip()
+    else:
+        from random import SystemRandom
+        from string import ascii_letters, digits, punctuation
+        alphabet = ascii_letters + digits + punctuation
+        SECRET_KEY = ''.join([SystemRandom().choice(alphabet)
+                              for i in range(50)])
+        with open(SECRET_FILE, 'w') as f:
+            f.write(SECRET_KEY)
+    del SECRET_FILE
 
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
 ALLOWED_HOSTS = ()
+if PRODUCTION:
+    ALLOWED_HOSTS = tuple(host.strip()
+                          for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+                          if host.strip())
 
 INTERNAL_IPS = (
     '127.0.0.1',
@@ -62,6 +81,11 @@ INSTALLED_APPS = (
     'system_architect',
 )
 
+# The apps only used while developing, which production workers do not load
+DEVELOPMENT_APPS = ('material.frontend', 'debug_toolbar')
+if PRODUCTION:
+    INSTALLED_APPS = tuple(app for app in INSTALLED_APPS if app not in DEVELOPMENT_APPS)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -72,6 +96,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if PRODUCTION:
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
 
 ROOT_URLCONF = 'system_architect.urls'
 
@@ -91,21 +117,66 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # Compile every template once per worker rather than once per request
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove('django.template.context_processors.debug')
+
 WSGI_APPLICATION = 'system_architect.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-        'TEST': {
-            'NAME': 'testdb',
-        },
+# Set DJANGO_DATABASE_ENGINE=postgresql, or the dotted path of any other
+# backend, to use another database than SQLite, connecting with
+# DJANGO_DATABASE_NAME, DJANGO_DATABASE_USER, DJANGO_DATABASE_PASSWORD,
+# DJANGO_DATABASE_HOST and DJANGO_DATABASE_PORT
+DATABASE_ENGINE = os.environ.get('DJANGO_DATABASE_ENGINE', 'sqlite3')
+if '.' not in DATABASE_ENGINE:
+    DATABASE_ENGINE = 'django.db.backends.' + DATABASE_ENGINE
+
+if DATABASE_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'TEST': {
+                'NAME': 'testdb',
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DATABASE_ENGINE,
+            'NAME': 'system_architect',
+            'USER': os.environ.get('DJANGO_DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DJANGO_DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DJANGO_DATABASE_HOST', ''),
+            'PORT': os.environ.get('DJANGO_DATABASE_PORT', ''),
+        }
+    }
+DATABASES['default']['NAME'] = os.environ.get('DJANGO_DATABASE_NAME',
+                                              DATABASES['default']['NAME'])
+if PRODUCTION:
+    # Keep connections open between requests rather than setting them up again
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DJANGO_CONN_MAX_AGE', 600))
+
+# Set SQLITE_PROFILE=concurrent to tune SQLite for many experts voting at the
+# same time, see system_architect/database.py
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE')
+if SQLITE_PROFILE not in (None, '', 'default', 'concurrent'):
+    raise ImproperlyConfigured("Unknown SQLITE_PROFILE '{}'".format(SQLITE_PROFILE))
+if SQLITE_PROFILE == 'concurrent':
+    # Keep connections open between requests rather than setting them up again
+    DATABASES['default']['CONN_MAX_AGE'] = 600
 
 
 # Password validation
@@ -148,6 +219,15 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'build/static')
 
 
+# The power each factor of the credibility of experts is raised to, see
+# system_architect/analysis/credibility.py
+EXPERT_CREDIBILITY = {
+    'organization': 1.0,
+    'agreement': 1.0,
+    'confidence': 1.0,
+}
+
+
 # TODO: Remove this for production!
 FIXTURE_SUPER_USERNAME = 'admin'
 FIXTURE_USER_EMAIL = 'sanbales@gmail.com'
@@ -0,0 +1,49 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from io import StringIO
+from system_architect.analysis import get_consensus
+from system_architect.archive import archive_votes, get_votes_as_of
+from system_architect.models import FunctionRequires, Project, Vote, VoteHistory, VoteRecord
+from system_architect.projects import purge_project
+
+
+class ArchiveVotesTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Archive Test")
+        scale = project.add_scale(name='Criticality')
+        high, low = scale.add_level('High', 1.0), scale.add_level('Low', 0.0)
+        self.relationship = FunctionRequires.objects.create(
+            requiring=project.add_function(name='Intercept'),
+            required=project.add_function(name='Detect'),
+            project=project, scale=scale)
+
+        self.now = now = timezone.now()
+        first, second = (User.objects.create_user(name).expertprofile for name in ('first', 'second'))
+        for expert, value, days in ((first, low, 100), (first, high, 95),
+                                    (second, low, 100), (second, high, 1)):
+            vote = Vote.objects.create(relationship=self.relationship, expert=expert, value=value)
+            Vote.objects.filter(pk=vote.pk).update(cast_on=now - timedelta(days=days))
+
+    def test_archive_votes(self):
+        consensus = get_consensus(Vote.objects.all())
+        self.assertEqual(archive_votes(self.now - timedelta(days=90), chunk_size=1), 2)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(VoteHistory.objects.count(), 2)
+        self.assertEqual(get_consensus(Vote.objects.all()), consensus)
+
+        self.assertEqual(VoteRecord.objects.count(), 4)
+        past = self.now - timedelta(days=97)
+        self.assertEqual(get_votes_as_of(past).count(), 2)
+        self.assertAlmostEqual(get_consensus(VoteRecord.objects.filter(cast_on__lte=past))
+                               [self.relationship.pk], 0.0)
+
+        purge_project(self.project)
+        self.assertFalse(VoteRecord.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_votes', days=96, stdout=out)
+        self.assertIn("Archived 2 votes", out.getvalue())
@@ -0,0 +1,72 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TransactionTestCase
+from scipy import sparse
+from system_architect.analysis import get_centrality, rank_functions
+from system_architect.analysis.centrality import get_dependent_sets
+from system_architect.models import FunctionRequires, Project, SystemRequires, SystemSatisfies, Vote
+
+
+class CentralityTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Centrality Test")
+        self.scale = project.add_scale(name='Criticality')
+        self.scale.add_level('High', 1.0)
+        self.low = self.scale.add_level('Low', 0.0)
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.engage = project.add_function(name='Engage')
+        self.power = project.add_function(name='Power')
+        self.radar = project.add_system(name='Radar')
+        self.missile = project.add_system(name='Missile')
+
+        for required in (self.detect, self.engage):
+            FunctionRequires.objects.create(requiring=self.intercept, required=required,
+                                            project=project, scale=self.scale)
+        self.detection = SystemSatisfies.objects.create(
+            satisfier=self.radar, satisfied=self.detect, project=project, scale=self.scale)
+        SystemSatisfies.objects.create(satisfier=self.missile, satisfied=self.engage,
+                                       project=project, scale=self.scale)
+        SystemRequires.objects.create(requiring=self.radar, required=self.power,
+                                      project=project, scale=self.scale)
+
+    def test_dependent_counts(self):
+        centrality = get_centrality(self.project)
+        self.assertEqual(centrality[self.power.pk].dependent_functions, 2)
+        self.assertEqual(centrality[self.power.pk].dependent_systems, 1)
+        self.assertEqual(centrality[self.intercept.pk].dependent_functions, 0)
+
+    def test_ranking(self):
+        for by in ('pagerank', 'katz', 'dependent_functions'):
+            ranking = rank_functions(self.project, by=by)
+            self.assertEqual(ranking[0][0], self.power, by)
+            self.assertEqual(ranking[-1][0], self.intercept, by)
+
+    def test_cache(self):
+        centrality = get_centrality(self.project)
+        self.assertIs(get_centrality(self.project), centrality)
+        Vote.objects.create(relationship=self.detection, value=self.low)
+        self.assertIsNot(get_centrality(self.project), centrality)
+
+        # Nothing uncommitted is kept
+        centrality = get_centrality(self.project)
+        with transaction.atomic():
+            Vote.objects.create(relationship=self.detection, value=self.low)
+            self.assertIsNot(get_centrality(self.project), get_centrality(self.project))
+            transaction.set_rollback(True)
+        self.assertIs(get_centrality(self.project), centrality)
+
+    def test_cycles(self):
+        # 0 and 1 depend on each other, and 2 depends on 1
+        structure = sparse.csr_matrix(([1, 1, 1], ([0, 1, 2], [1, 0, 1])), shape=(3, 3))
+        self.assertEqual(get_dependent_sets(structure), [0b110, 0b101, 0])
+
+    def test_admin_view(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get('/admin/system_architect/project/{}/ranking/'.format(self.project.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Power')
+        response = self.client.get('/admin/system_architect/project/{}/change/'.format(self.project.pk))
+        self.assertContains(response, 'Function ranking')
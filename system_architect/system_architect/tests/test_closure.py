@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+from random import Random
+from system_architect.analysis import get_impact, get_requirements, rebuild_closure
+from system_architect.models import FunctionRequires, Project, RequirementClosure, SystemRequires, Vote
+from system_architect.projects import clone_project, purge_project
+
+
+class ClosureTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Closure Test")
+        self.scale = project.add_scale(name='Criticality')
+        self.high = self.scale.add_level('High', 1.0)
+        self.low = self.scale.add_level('Low', 0.0)
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.power = project.add_function(name='Power')
+        self.radar = project.add_system(name='Radar')
+
+        self.detection = self.require(self.intercept, self.detect)
+        self.require(self.detect, self.power)
+        SystemRequires.objects.create(requiring=self.radar, required=self.detect,
+                                      project=project, scale=self.scale)
+
+    def require(self, requiring, required):
+        return FunctionRequires.objects.create(requiring=requiring, required=required,
+                                               project=self.project, scale=self.scale)
+
+    def get_rows(self):
+        return {
+            (row.requiring.pk, row.required_id): (row.depth, round(row.criticality, 6))
+            for row in RequirementClosure.objects.filter(project=self.project)
+                                                 .select_related('requiring_function',
+                                                                 'requiring_system')
+        }
+
+    def assertUpToDate(self):
+        rows = self.get_rows()
+        rebuild_closure(self.project)
+        self.assertEqual(rows, self.get_rows())
+
+    def test_chains(self):
+        requirements = get_requirements(self.intercept)
+        self.assertEqual([(row.required, row.depth) for row in requirements],
+                         [(self.detect, 1), (self.power, 2)])
+        impact = get_impact(self.power)
+        self.assertEqual({(row.requiring, row.depth) for row in impact},
+                         {(self.detect, 1), (self.intercept, 2), (self.radar, 2)})
+
+    def test_criticality(self):
+        Vote.objects.create(relationship=self.detection, value=self.low)
+        criticality = {row.required: row.criticality for row in get_requirements(self.intercept)}
+        self.assertEqual(criticality[self.power], 0.0)
+
+        # A more critical chain around the weak link takes over
+        shortcut = self.require(self.intercept, self.power)
+        Vote.objects.create(relationship=shortcut, value=self.high)
+        criticality = {row.required: row.criticality for row in get_requirements(self.intercept)}
+        self.assertEqual(criticality[self.power], 1.0)
+        self.assertUpToDate()
+
+    def test_incremental_updates(self):
+        cooling = self.project.add_function(name='Cooling')
+        requirement = self.require(self.power, cooling)
+        self.assertEqual(get_impact(cooling).count(), 4)
+        self.assertUpToDate()
+
+        requirement.requiring = self.intercept
+        requirement.save()
+        self.assertEqual({row.requiring for row in get_impact(cooling)}, {self.intercept})
+        self.assertUpToDate()
+
+        requirement.delete()
+        self.assertFalse(get_impact(cooling).exists())
+        self.detect.delete()
+        self.assertFalse(RequirementClosure.objects.filter(project=self.project).exists())
+
+    def test_cycles(self):
+        self.require(self.power, self.intercept)
+        self.assertEqual({row.required for row in get_requirements(self.power)},
+                         {self.intercept, self.detect})
+        self.assertUpToDate()
+
+    def test_random_changes(self):
+        random = Random(7)
+        functions = [self.intercept, self.detect, self.power] + [
+            self.project.add_function(name='Function {}'.format(number)) for number in range(6)]
+        requirements = []
+        for _ in range(40):
+            action = random.random()
+            if action < 0.4 or not requirements:
+                requirements.append(self.require(*random.sample(functions, 2)))
+            elif action < 0.6:
+                requirement = requirements.pop(random.randrange(len(requirements)))
+                requirement.delete()
+            elif action < 0.8:
+                requirement = random.choice(requirements)
+                requirement.requiring = random.choice(functions)
+                requirement.save()
+            else:
+                Vote.objects.create(relationship=random.choice(requirements),
+                                    value=random.choice([self.high, self.low]))
+            self.assertUpToDate()
+
+    def test_rolled_back_changes(self):
+        rows = self.get_rows()
+        with transaction.atomic():
+            self.require(self.power, self.intercept)
+            transaction.set_rollback(True)
+        self.assertEqual(self.get_rows(), rows)
+
+        self.require(self.power, self.intercept)
+        self.assertIn((self.power.pk, self.intercept.pk), self.get_rows())
+        self.assertUpToDate()
+
+    def test_clone_and_purge(self):
+        clone = clone_project(self.project)
+        self.assertEqual(RequirementClosure.objects.filter(project=clone).count(),
+                         len(self.get_rows()))
+        purge_project(clone)
+        self.assertFalse(RequirementClosure.objects.filter(project=clone.pk).exists())
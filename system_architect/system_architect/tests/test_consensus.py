@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from system_architect.analysis import get_consensus, get_latest_votes
+from system_architect.analysis.consensus import get_latest_vote_strategies
+from system_architect.models import FunctionRequires, Project, Vote
+
+
+class LatestVotesTestCase(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name="Consensus Test")
+        scale = project.add_scale(name='Criticality')
+        self.high = scale.add_level('High', 1.0)
+        self.low = scale.add_level('Low', 0.0)
+        self.relationship = FunctionRequires.objects.create(
+            requiring=project.add_function(name='Intercept'),
+            required=project.add_function(name='Detect'),
+            project=project, scale=scale)
+
+        now = timezone.now()
+        first, second = (User.objects.create_user(name).expertprofile for name in ('first', 'second'))
+        self.latest = set()
+        for expert, values in ((first, (self.low, self.high)),
+                               (second, (self.high, self.low, self.low)),
+                               (None, (self.high, self.low))):
+            for minutes, value in enumerate(values):
+                vote = Vote.objects.create(relationship=self.relationship, expert=expert, value=value)
+                # The last two votes of the second expert are cast at the same time
+                cast_on = now + timedelta(minutes=min(minutes, 1))
+                Vote.objects.filter(pk=vote.pk).update(cast_on=cast_on)
+            self.latest.add(vote.pk)
+
+    def test_strategies_agree(self):
+        for strategy in get_latest_vote_strategies(connection):
+            latest = get_latest_votes(Vote.objects.all(), strategy=strategy)
+            self.assertEqual(set(latest.values_list('pk', flat=True)), self.latest, strategy)
+
+    def test_consensus(self):
+        self.assertEqual(set(self.relationship.latest_votes().values_list('pk', flat=True)),
+                         self.latest)
+        self.assertAlmostEqual(get_consensus(Vote.objects.all())[self.relationship.pk], 1 / 3)
@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from io import StringIO
+from system_architect.analysis import get_consensus, update_credibility
+from system_architect.models import FunctionRequires, Project, Vote
+from system_architect.models.vote import ExpertProfile, Organization
+
+
+class CredibilityTestCase(TestCase):
+    def setUp(self):
+        project = Project.objects.create(name="Credibility Test")
+        scale = project.add_scale(name='Criticality')
+        high = scale.add_level('High', 1.0)
+        low = scale.add_level('Low', 0.0)
+        intercept = project.add_function(name='Intercept')
+        self.relationships = [
+            FunctionRequires.objects.create(requiring=intercept,
+                                            required=project.add_function(name=name),
+                                            project=project, scale=scale)
+            for name in ('Detect', 'Engage')
+        ]
+
+        self.agency = Organization.objects.create(name='Agency', credibility=0.5)
+        self.first, self.second, self.dissenter = (
+            User.objects.create_user(name).expertprofile
+            for name in ('first', 'second', 'dissenter')
+        )
+        ExpertProfile.objects.filter(pk=self.second.pk).update(organization=self.agency)
+        for relationship in self.relationships:
+            Vote.objects.create(relationship=relationship, expert=self.first, value=high)
+            Vote.objects.create(relationship=relationship, expert=self.second, value=high)
+            Vote.objects.create(relationship=relationship, expert=self.dissenter, value=low,
+                                confidence=2)
+
+    def get_credibility(self):
+        return dict(ExpertProfile.objects.values_list('user__username', 'credibility'))
+
+    def test_organization(self):
+        update_credibility({'organization': 1.0, 'agreement': 0.0, 'confidence': 0.0})
+        self.assertEqual(self.get_credibility(), {'first': 1.0, 'second': 0.5, 'dissenter': 1.0})
+        consensus = get_consensus(Vote.objects.all())
+        self.assertAlmostEqual(consensus[self.relationships[0].pk], 1.5 / 2.5)
+
+    def test_agreement(self):
+        update_credibility({'organization': 0.0, 'agreement': 1.0, 'confidence': 0.0})
+        credibility = self.get_credibility()
+        # Each expert shares two relationships with the panel, whose mean
+        # deviation from the others is 2 / 3
+        panel = 1 / 3
+        self.assertAlmostEqual(credibility['first'], (2 - 1 + 5 * panel) / 7)
+        self.assertAlmostEqual(credibility['dissenter'], (2 - 2 + 5 * panel) / 7)
+
+    def test_confidence(self):
+        update_credibility({'organization': 0.0, 'agreement': 0.0, 'confidence': 1.0})
+        self.assertEqual(self.get_credibility(), {'first': 1.0, 'second': 1.0, 'dissenter': 0.5})
+        consensus = get_consensus(Vote.objects.all())
+        self.assertAlmostEqual(consensus[self.relationships[0].pk], 2 / 2.5)
+
+    def test_no_credibility(self):
+        ExpertProfile.objects.update(credibility=0.0)
+        self.assertEqual(get_consensus(Vote.objects.all()), {})
+
+    def test_command(self):
+        output = StringIO()
+        call_command('update_credibility', stdout=output)
+        self.assertIn("Updated the credibility of 3 experts", output.getvalue())
+        self.assertEqual(update_credibility(), 0)
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from system_architect.database import SQLITE_PROFILES, apply_pragmas, on_commit_with, write_transaction
+from system_architect.models import FunctionRequires, Project, Vote
+
+
+class DatabaseTestCase(TransactionTestCase):
+    def get_pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA {}".format(name))
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PROFILE='concurrent')
+    def test_concurrent_profile(self):
+        connection.close()
+        try:
+            self.assertEqual(self.get_pragma('journal_mode'), 'wal')
+            self.assertEqual(self.get_pragma('busy_timeout'), 20000)
+        finally:
+            apply_pragmas(connection, SQLITE_PROFILES['default'])
+
+    @override_settings(SQLITE_PROFILE='concurent')
+    def test_unknown_profile(self):
+        connection.close()
+        try:
+            with self.assertRaises(ImproperlyConfigured):
+                connection.ensure_connection()
+        finally:
+            connection.close()
+
+    def test_write_transaction(self):
+        with write_transaction():
+            self.assertTrue(connection.connection.in_transaction)
+            Project.objects.create(name="Write Test")
+            with write_transaction():
+                Project.objects.create(name="Nested Write Test")
+        self.assertFalse(connection.connection.in_transaction)
+        self.assertEqual(Project.objects.filter(name__endswith="Write Test").count(), 2)
+
+    def test_on_commit_with(self):
+        calls = []
+        on_commit_with(calls.append, 'autocommit')
+        with transaction.atomic():
+            on_commit_with(calls.append, 'first')
+            try:
+                with transaction.atomic():
+                    on_commit_with(calls.append, 'rolled back')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            on_commit_with(calls.append, 'second')
+            self.assertEqual(calls, [['autocommit']])
+        self.assertEqual(calls, [['autocommit'], ['first', 'second']])
+
+    def test_admin_vote(self):
+        project = Project.objects.create(name="Admin Vote Test")
+        scale = project.add_scale(name='Criticality')
+        level = scale.add_level('High', 1.0)
+        relationship = FunctionRequires.objects.create(
+            requiring=project.add_function(name='Vote'),
+            required=project.add_function(name='Count'),
+            project=project,
+            scale=scale,
+        )
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.post('/admin/system_architect/vote/add/', {
+            'relationship': relationship.pk,
+            'value': level.pk,
+            'confidence': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(connection.connection.in_transaction)
+        self.assertEqual(Vote.objects.filter(relationship=relationship, value=level).count(), 1)
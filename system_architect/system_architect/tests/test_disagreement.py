@@ -0,0 +1,93 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from system_architect.analysis import (VoteTable, find_contradictions, get_agreement_matrix,
+                                       get_disagreements)
+from system_architect.analysis.disagreement import MUTUAL, UNSATISFIABLE
+from system_architect.models import FunctionRequires, Project, SystemSatisfies, Vote
+from system_architect.reports import get_report
+
+
+class DisagreementTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Disagreement Test")
+        self.scale = scale = project.add_scale(name='Criticality')
+        self.high = scale.add_level('Cannot Be Achieved Without', 1.0)
+        self.medium = scale.add_level('Helps', 0.5)
+        self.low = scale.add_level('Does not satisfy', 0.0)
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.radar = project.add_system(name='Radar')
+        self.requirement = FunctionRequires.objects.create(
+            requiring=self.intercept, required=self.detect, project=project, scale=scale)
+        self.converse = FunctionRequires.objects.create(
+            requiring=self.detect, required=self.intercept, project=project, scale=scale)
+        self.detection = SystemSatisfies.objects.create(
+            satisfier=self.radar, satisfied=self.detect, project=project, scale=scale)
+
+        self.ada, self.bob, self.cy = (
+            User.objects.create_user(name, '{}@example.com'.format(name), name).expertprofile
+            for name in ('ada', 'bob', 'cy'))
+
+    def vote(self, expert, relationship, value):
+        Vote.objects.create(relationship=relationship, value=value, expert=expert)
+
+    def test_agreement(self):
+        self.vote(self.ada, self.requirement, self.low)
+        self.vote(self.ada, self.requirement, self.high)
+        self.vote(self.ada, self.detection, self.high)
+        self.vote(self.bob, self.requirement, self.medium)
+        self.vote(self.bob, self.detection, self.low)
+        self.vote(self.cy, self.converse, self.high)
+        table = VoteTable(self.project)
+        shared, agreement = get_agreement_matrix(table)
+        ada, bob, cy = (table.experts.index(expert.pk) for expert in (self.ada, self.bob, self.cy))
+        self.assertEqual(shared[ada, bob], 2)
+        # Only the latest votes count: they are 0.5 and 1.0 apart
+        self.assertAlmostEqual(agreement[ada, bob], 0.25)
+        self.assertAlmostEqual(agreement[bob, ada], 0.25)
+        self.assertAlmostEqual(agreement[ada, ada], 1.0)
+        self.assertEqual(shared[ada, cy], 0)
+
+        disagreed, spreads = get_disagreements(table)
+        self.assertEqual([table.relationships[position] for position in disagreed],
+                         [self.detection.pk, self.requirement.pk])
+        self.assertEqual(spreads.experts[disagreed[0]], 2)
+
+    def test_contradictions(self):
+        # Ada says detection is critical to interception, but the only detector cannot detect
+        self.vote(self.ada, self.requirement, self.high)
+        self.vote(self.ada, self.detection, self.low)
+        # Bob says so too but has not voted on the radar, and Cy says it helps
+        self.vote(self.bob, self.requirement, self.high)
+        self.vote(self.cy, self.requirement, self.high)
+        self.vote(self.cy, self.detection, self.medium)
+        # Cy says interception and detection cannot be achieved without each other
+        self.vote(self.cy, self.converse, self.high)
+
+        contradictions = find_contradictions(VoteTable(self.project))
+        self.assertEqual(len(contradictions), 2)
+        unsatisfiable = next(c for c in contradictions if c.kind == UNSATISFIABLE)
+        self.assertEqual((unsatisfiable.expert, unsatisfiable.relationship, unsatisfiable.others),
+                         (self.ada.pk, self.requirement.pk, (self.detection.pk,)))
+        mutual = next(c for c in contradictions if c.kind == MUTUAL)
+        self.assertEqual(mutual.expert, self.cy.pk)
+        self.assertEqual({mutual.relationship} | set(mutual.others),
+                         {self.requirement.pk, self.converse.pk})
+
+        # Another satisfier that ada has not voted down lifts her contradiction
+        SystemSatisfies.objects.create(satisfier=self.project.add_system(name='Sonar'),
+                                       satisfied=self.detect, project=self.project,
+                                       scale=self.scale)
+        self.assertEqual([c.kind for c in find_contradictions(VoteTable(self.project))], [MUTUAL])
+
+    def test_reports(self):
+        self.vote(self.ada, self.requirement, self.high)
+        self.vote(self.ada, self.detection, self.low)
+        self.vote(self.bob, self.requirement, self.low)
+        self.assertEqual(list(get_report('disagreements', self.project).rows),
+                         [('', 'function requires', 'Detect', 'Intercept', 2, 0.0, 1.0, 0.5)])
+        self.assertEqual(list(get_report('agreement', self.project).rows),
+                         [('ada', 'bob', 1, 0.0)])
+        self.assertEqual(list(get_report('contradictions', self.project).rows),
+                         [('ada', '', UNSATISFIABLE, 'Detect', 'Intercept', 1)])
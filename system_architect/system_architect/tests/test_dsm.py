@@ -0,0 +1,82 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from io import BytesIO, StringIO
+from system_architect.analysis import DesignStructureMatrix, get_dsm
+from system_architect.models import FunctionRequires, Project, SystemSatisfies
+
+
+class DesignStructureMatrixTestCase(TestCase):
+    def make_dsm(self, dependencies):
+        elements = sorted({element for pair in dependencies for element in pair})
+        return DesignStructureMatrix.from_marks(
+            elements, elements, {element: element for element in elements},
+            {pair: 1.0 for pair in dependencies})
+
+    def test_sequence(self):
+        # c depends on b which depends on a, and d and e depend on each other
+        dsm = self.make_dsm([('c', 'b'), ('b', 'a'), ('d', 'e'), ('e', 'd'), ('d', 'c')])
+        order, blocks = dsm.sequence()
+        self.assertLess(order.index('a'), order.index('b'))
+        self.assertLess(order.index('b'), order.index('c'))
+        self.assertLess(order.index('c'), order.index('d'))
+        self.assertEqual(blocks[order.index('d')], blocks[order.index('e')])
+        self.assertEqual(dsm.reorder(order, order).get_feedback(), 1.0)
+
+    def test_cluster(self):
+        first, second = 'abcd', 'efgh'
+        dsm = self.make_dsm([
+            (one, other)
+            for group in (first, second)
+            for one in group
+            for other in group
+            if one != other
+        ] + [('a', 'e')])
+        labels = dict(zip(dsm.rows, dsm.cluster()))
+        self.assertEqual(len({labels[element] for element in first}), 1)
+        self.assertEqual(len({labels[element] for element in second}), 1)
+        self.assertNotEqual(labels['a'], labels['e'])
+        self.assertLess(dsm.get_cost(list(labels.values())), dsm.get_cost(range(len(dsm.rows))))
+
+        limited = dsm.cluster(max_size=2)
+        self.assertLessEqual(max(limited.count(label) for label in limited), 2)
+
+
+class ProjectDSMTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="DSM Test")
+        scale = project.add_scale(name='Criticality')
+        scale.add_level('High', 1.0)
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.radar = project.add_system(name='Radar')
+        FunctionRequires.objects.create(requiring=self.intercept, required=self.detect,
+                                        project=project, scale=scale)
+        SystemSatisfies.objects.create(satisfier=self.radar, satisfied=self.detect,
+                                       project=project, scale=scale)
+
+    def test_function_dsm(self):
+        dsm = get_dsm(self.project, organize=True)
+        self.assertEqual(dsm.rows, [self.detect.pk, self.intercept.pk])
+        self.assertEqual(dsm.matrix[1, 0], 1.0)
+        self.assertEqual(dsm.get_feedback(), 0.0)
+
+        output = StringIO()
+        dsm.write_csv(output)
+        self.assertEqual(output.getvalue().splitlines(), [',Detect,Intercept', 'Detect,,', 'Intercept,1,'])
+
+        image = BytesIO()
+        dsm.write_png(image, cell_size=2)
+        self.assertTrue(image.getvalue().startswith(b'\x89PNG'))
+
+    def test_system_dsm(self):
+        dsm = get_dsm(self.project, systems=True, organize=True)
+        self.assertEqual(dsm.rows, [self.radar.pk])
+        self.assertEqual(dsm.matrix[0, dsm.columns.index(self.detect.pk)], 1.0)
+
+    def test_view(self):
+        User.objects.create_user('architect', password='architect')
+        self.client.login(username='architect', password='architect')
+        response = self.client.get('/api/projects/{}/dsm.png'.format(self.project.pk),
+                                   {'kind': 'systems'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
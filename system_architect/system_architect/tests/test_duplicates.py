@@ -0,0 +1,69 @@
+from django.test import TestCase
+from system_architect.analysis import find_duplicates, merge_entities
+from system_architect.models import (Function, FunctionRequires, Project, SystemArchitecture, SystemSatisfies,
+                                     Vote)
+
+
+class DuplicatesTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Duplicates Test")
+        self.scale = project.add_scale(name='Criticality')
+        self.level = self.scale.add_level('High', 1.0)
+        self.detect = project.add_function(name='Detect airborne targets')
+        self.detection = project.add_function(name='Airborne target detection')
+        self.engage = project.add_function(name='Engage surface contacts with guns')
+        self.radar = project.add_system(name='AN/SPY-1D radar')
+
+    def test_find_duplicates(self):
+        candidates = find_duplicates(self.project)
+        self.assertEqual(len(candidates), 1)
+        first, second, similarity = candidates[0]
+        self.assertEqual({first, second}, {self.detect, self.detection})
+        self.assertGreater(similarity, 0.9)
+
+    def test_merge(self):
+        intercept = self.project.add_function(name='Intercept')
+        kept = FunctionRequires.objects.create(requiring=intercept, required=self.detect,
+                                               project=self.project, scale=self.scale)
+        merged = FunctionRequires.objects.create(requiring=intercept, required=self.detection,
+                                                 project=self.project, scale=self.scale)
+        Vote.objects.create(relationship=merged, value=self.level)
+        satisfies = SystemSatisfies.objects.create(satisfier=self.radar, satisfied=self.detection,
+                                                   project=self.project, scale=self.scale)
+
+        merge_entities(self.detect, [self.detection])
+
+        self.assertFalse(Function.objects.filter(pk=self.detection.pk).exists())
+        self.assertEqual(list(FunctionRequires.objects.filter(requiring=intercept)), [
+            FunctionRequires.objects.get(pk=min((kept.pk, merged.pk), key=str))
+        ])
+        self.assertEqual(Vote.objects.filter(relationship__functionrequires__requiring=intercept).count(), 1)
+        self.assertEqual(SystemSatisfies.objects.get(pk=satisfies.pk).satisfied, self.detect)
+
+    def test_merge_systems(self):
+        sonar = self.project.add_system(name='Sonar')
+        architecture = SystemArchitecture.objects.create(name='Frigate', project=self.project)
+        architecture.systems.add(sonar)
+        merge_entities(self.radar, [sonar])
+        self.assertEqual(list(architecture.systems.all()), [self.radar])
+
+    def test_merge_incompatibilities(self):
+        sonar = self.project.add_system(name='Sonar')
+        guns, missile = self.project.add_system(name='Guns'), self.project.add_system(name='Missile')
+        radar_detection, sonar_detection = (
+            SystemSatisfies.objects.create(satisfier=system, satisfied=self.detect,
+                                           project=self.project, scale=self.scale)
+            for system in (self.radar, sonar))
+        gunnery, launch = (
+            SystemSatisfies.objects.create(satisfier=system, satisfied=self.engage,
+                                           project=self.project, scale=self.scale)
+            for system in (guns, missile))
+        radar_detection.incompatible.add(gunnery, sonar_detection)
+        sonar_detection.incompatible.add(gunnery, launch)
+
+        merge_entities(self.radar, [sonar])
+
+        survivor = SystemSatisfies.objects.get(satisfied=self.detect)
+        self.assertEqual(set(survivor.incompatible.all()), {gunnery, launch})
+        self.assertEqual(list(launch.incompatible.all()), [survivor])
+        self.assertEqual(SystemSatisfies.incompatible.through.objects.count(), 4)
@@ -0,0 +1,173 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TransactionTestCase
+from json import dumps
+from unittest import mock
+from system_architect.analysis import (SatisfactionEvaluator, SatisfactionGraph, evaluate_variants,
+                                       get_evaluator)
+from system_architect.analysis import evaluation
+from system_architect.models import (FunctionRequires, FunctionSatisfies, Project, ProjectChange,
+                                     SystemArchitecture, SystemSatisfies, Vote)
+
+
+class EvaluationTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Evaluation Test")
+        self.scale = project.add_scale(name='Criticality')
+        self.high = self.scale.add_level('High', 1.0)
+        self.medium = self.scale.add_level('Medium', 0.5)
+        self.scale.add_level('None', 0.0)
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.engage = project.add_function(name='Engage')
+        self.radar = project.add_system(name='Radar')
+        self.missile = project.add_system(name='Missile')
+
+        for required in (self.detect, self.engage):
+            FunctionRequires.objects.create(requiring=self.intercept, required=required,
+                                            project=project, scale=self.scale)
+        self.detection = SystemSatisfies.objects.create(
+            satisfier=self.radar, satisfied=self.detect, project=project, scale=self.scale)
+        SystemSatisfies.objects.create(satisfier=self.missile, satisfied=self.engage,
+                                       project=project, scale=self.scale)
+
+        self.architecture = SystemArchitecture.objects.create(name='Destroyer', project=project)
+        self.architecture.systems.add(self.radar, self.missile)
+
+    def assert_matches_fresh_evaluation(self, evaluator):
+        graph = SatisfactionGraph.from_project(self.project)
+        fresh = SatisfactionEvaluator(graph, self.architecture.systems.values_list('pk', flat=True))
+        for function_id, value in fresh.get_function_values().items():
+            self.assertAlmostEqual(evaluator.get_function_values()[function_id], value)
+
+    def test_full_architecture(self):
+        satisfaction = self.architecture.functional_satisfaction
+        self.assertAlmostEqual(satisfaction[self.intercept], 1.0)
+        self.assertAlmostEqual(satisfaction[self.detect], 1.0)
+
+    def test_incremental_updates(self):
+        evaluator = get_evaluator(self.architecture)
+
+        Vote.objects.create(relationship=self.detection, value=self.medium)
+        self.assertAlmostEqual(self.architecture.evaluate()[self.intercept], 0.5)
+        self.assert_matches_fresh_evaluation(evaluator)
+
+        self.architecture.systems.remove(self.missile)
+        self.assertAlmostEqual(self.architecture.evaluate()[self.intercept], 0.0)
+        self.assert_matches_fresh_evaluation(evaluator)
+
+        sonar = self.project.add_system(name='Sonar')
+        SystemSatisfies.objects.create(satisfier=sonar, satisfied=self.engage,
+                                       project=self.project, scale=self.scale)
+        self.architecture.systems.add(sonar)
+        self.assertAlmostEqual(self.architecture.evaluate()[self.engage], 1.0)
+        self.assert_matches_fresh_evaluation(evaluator)
+        self.assertIs(get_evaluator(self.architecture), evaluator)
+
+    def test_rolled_back_changes(self):
+        evaluator = get_evaluator(self.architecture)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Vote.objects.create(relationship=self.detection, value=self.medium)
+            # The uncommitted vote counts, but is not kept
+            self.assertAlmostEqual(self.architecture.evaluate()[self.intercept], 0.5)
+            raise RuntimeError
+        self.assertIs(get_evaluator(self.architecture), evaluator)
+        self.assertAlmostEqual(self.architecture.evaluate()[self.intercept], 1.0)
+
+        # The rolled back vote does not keep later votes from being caught up with
+        Vote.objects.create(relationship=self.detection, value=self.medium)
+        self.assertAlmostEqual(self.architecture.evaluate()[self.intercept], 0.5)
+        self.assertIs(get_evaluator(self.architecture), evaluator)
+
+    def test_changed_elsewhere(self):
+        evaluator = get_evaluator(self.architecture)
+        # As another process would, bulk inserts sending no signals
+        Vote.objects.bulk_create([Vote(relationship=self.detection, value=self.medium)])
+        ProjectChange.objects.create(project=self.project)
+        self.assertIsNot(get_evaluator(self.architecture), evaluator)
+        self.assertAlmostEqual(self.architecture.evaluate()[self.intercept], 0.5)
+
+    def test_least_recently_used(self):
+        general = self.project.scenarios.create(name='General')
+        arctic = self.project.scenarios.create(name='Arctic')
+        with mock.patch.object(evaluation, 'MAX_EVALUATORS', 2):
+            evaluator = get_evaluator(self.architecture)
+            get_evaluator(self.architecture, general)
+            self.assertIs(get_evaluator(self.architecture), evaluator)
+            get_evaluator(self.architecture, arctic)
+            self.assertEqual(list(evaluation._evaluators),
+                             [(self.architecture.pk, None), (self.architecture.pk, arctic.pk)])
+
+    def test_cycles_do_not_support_themselves(self):
+        FunctionSatisfies.objects.create(satisfier=self.detect, satisfied=self.engage,
+                                         project=self.project, scale=self.scale)
+        FunctionSatisfies.objects.create(satisfier=self.engage, satisfied=self.detect,
+                                         project=self.project, scale=self.scale)
+        evaluator = get_evaluator(self.architecture)
+        self.architecture.systems.clear()
+        self.assertAlmostEqual(self.architecture.evaluate()[self.detect], 0.0)
+        self.assert_matches_fresh_evaluation(evaluator)
+
+    def test_specific_scenarios_override(self):
+        general = self.project.scenarios.create(name='General')
+        arctic = self.project.scenarios.create(name='Arctic', parent=general)
+        relationship = SystemSatisfies.objects.create(
+            satisfier=self.radar, satisfied=self.detect, project=self.project,
+            scale=self.scale, scenario=arctic)
+        Vote.objects.create(relationship=relationship, value=self.medium)
+        self.assertAlmostEqual(self.architecture.evaluate(general)[self.detect], 1.0)
+        self.assertAlmostEqual(self.architecture.evaluate(arctic)[self.detect], 0.5)
+
+    def test_what_if(self):
+        sonar = self.project.add_system(name='Sonar')
+        engagement = SystemSatisfies.objects.create(satisfier=sonar, satisfied=self.engage,
+                                                    project=self.project, scale=self.scale)
+        Vote.objects.create(relationship=engagement, value=self.medium)
+        # The detection and engagement cycle is solved for all the variants too
+        FunctionSatisfies.objects.create(satisfier=self.detect, satisfied=self.engage,
+                                         project=self.project, scale=self.scale)
+        variants = [
+            ((), [self.missile.pk]),
+            ([sonar.pk], [self.missile.pk]),
+            ([sonar.pk], ()),
+            ((), [self.radar.pk, self.missile.pk]),
+        ]
+        results = evaluate_variants(self.architecture, variants)
+        self.assertEqual([result.delta for result in results], [0.0, 0.0, 0.0, -1.0])
+        self.assertEqual(results[0].functions, {})
+        self.assertEqual(results[3].functions, {self.intercept.pk: -1.0, self.detect.pk: -1.0,
+                                                self.engage.pk: -1.0})
+
+        results = evaluate_variants(self.architecture, variants, weights={self.engage.pk: 1.0})
+        self.assertEqual(results[0].satisfaction, 1.0)
+
+        # Without the cycle, the sonar only half engages
+        FunctionSatisfies.objects.filter(project=self.project).delete()
+        results = evaluate_variants(self.architecture, variants)
+        graph = SatisfactionGraph.from_project(self.project)
+        base = set(self.architecture.systems.values_list('pk', flat=True))
+        for (added, removed), result in zip(variants, results):
+            fresh = SatisfactionEvaluator(graph, (base | set(added)) - set(removed))
+            self.assertAlmostEqual(result.satisfaction, fresh.values[self.intercept.pk])
+        self.assertEqual(results[1].functions, {self.intercept.pk: -0.5, self.engage.pk: -0.5})
+        # The architecture itself is left as is
+        self.assertEqual(self.architecture.evaluate()[self.intercept], 1.0)
+
+    def test_what_if_view(self):
+        sonar = self.project.add_system(name='Sonar')
+        User.objects.create_superuser('engineer', 'e@example.com', 'engineer')
+        self.client.login(username='engineer', password='engineer')
+        url = '/api/architectures/{}/what-if/'.format(self.architecture.pk)
+        response = self.client.post(url, dumps({
+            'variants': [{'remove': [str(self.radar.pk)]}],
+            'swap': {'system': str(self.missile.pk)},
+        }), content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['satisfaction'], 1.0)
+        self.assertEqual([variant['add'] for variant in data['variants']], [[], [str(sonar.pk)]])
+        self.assertEqual(data['variants'][1]['delta'], -1.0)
+
+        response = self.client.post(url, dumps({'variants': [{'add': ['unknown']}]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
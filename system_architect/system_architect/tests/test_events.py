@@ -0,0 +1,131 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from system_architect.events import Broadcaster, broadcaster, watch
+from system_architect.matrix import MappingMatrix
+from system_architect.models import Project, SystemArchitecture, SystemSatisfies, Vote
+from threading import Thread
+
+
+class EventTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Event Test")
+        scale = project.add_scale(name='Criticality')
+        self.high = scale.add_level('High', 1.0)
+        self.low = scale.add_level('Low', 0.0)
+        self.detect = project.add_function(name='Detect')
+        radar = project.add_system(name='Radar')
+        self.relationship = SystemSatisfies.objects.create(satisfier=radar, satisfied=self.detect,
+                                                           project=project, scale=scale)
+        self.architecture = SystemArchitecture.objects.create(name='Single', project=project)
+        self.architecture.systems.add(radar)
+
+        self.user = User.objects.create_superuser('facilitator', 'f@example.com', 'facilitator')
+        self.experts = [User.objects.create_user(name).expertprofile for name in ('first', 'second')]
+        self.after = broadcaster.last_id
+
+    def tearDown(self):
+        # Stop treating the projects of the test as watched
+        broadcaster.left_on.clear()
+
+    def vote(self, expert, value):
+        return Vote.objects.create(relationship=self.relationship, expert=expert, value=value)
+
+    def test_consensus_and_satisfaction(self):
+        with watch(self.project.pk):
+            self.vote(self.experts[0], self.high)
+            self.vote(self.experts[1], self.low)
+            events = broadcaster.get_events(self.project.pk, self.after)
+
+        self.assertEqual([event.kind for event in events], ['consensus', 'consensus', 'architecture'])
+        self.assertEqual(events[0].data, {'relationship': self.relationship.pk, 'consensus': 1.0,
+                                          'previous': None, 'delta': None})
+        self.assertEqual(events[1].data['delta'], -0.5)
+        self.assertEqual(events[2].data, {
+            'architecture': str(self.architecture.pk),
+            'functions': {str(self.detect.pk): {'satisfaction': 0.5, 'delta': -0.5}},
+        })
+
+    def test_rolled_back_votes(self):
+        with watch(self.project.pk):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.vote(self.experts[0], self.high)
+                raise RuntimeError
+            self.assertEqual(broadcaster.get_events(self.project.pk, self.after), [])
+            # The rolled back vote does not keep later votes from being published
+            self.vote(self.experts[0], self.low)
+            events = broadcaster.get_events(self.project.pk, self.after)
+        self.assertEqual([event.data['consensus'] for event in events if event.kind == 'consensus'],
+                         [0.0])
+
+    def test_bulk_changes(self):
+        matrix = MappingMatrix('system-satisfies', self.project, self.relationship.scale,
+                               expert=self.experts[0])
+        with watch(self.project.pk):
+            matrix.save({(self.relationship.satisfier_id, self.detect.pk): 'Low'})
+            events = broadcaster.get_events(self.project.pk, self.after)
+        self.assertEqual([event.kind for event in events], ['consensus', 'architecture'])
+        self.assertEqual(events[0].data['relationship'], self.relationship.pk)
+
+    def test_concurrent_publications(self):
+        def vote(expert, value):
+            self.vote(expert, value)
+            connection.close()
+
+        with watch(self.project.pk):
+            with broadcaster.get_lock(self.project.pk):
+                threads = [Thread(target=vote, args=(self.experts[0], self.high)),
+                           Thread(target=vote, args=(self.experts[1], self.low))]
+                for thread in threads:
+                    thread.start()
+                # The votes wait for the published state to be free
+                threads[0].join(0.2)
+                self.assertEqual(broadcaster.get_events(self.project.pk, self.after), [])
+            for thread in threads:
+                thread.join()
+            events = broadcaster.get_events(self.project.pk, self.after)
+        # Each delta is taken from the consensus published before it
+        consensus = [event.data for event in events if event.kind == 'consensus']
+        self.assertEqual(consensus[-1]['consensus'], 0.5)
+        for previous, data in zip([{'consensus': None}] + consensus, consensus):
+            self.assertEqual(data['previous'], previous['consensus'])
+
+    def test_unwatched_project(self):
+        other = Project.objects.create(name="Watched")
+        with watch(other.pk):
+            self.vote(self.experts[0], self.high)
+        self.assertEqual(broadcaster.get_events(self.project.pk, self.after), [])
+
+    def test_missed_events(self):
+        events = Broadcaster(history_size=2)
+        for index in range(3):
+            events.publish(self.project.pk, 'consensus', {'index': index})
+        self.assertEqual([event.data for event in events.get_events(self.project.pk, 1)],
+                         [{'index': 1}, {'index': 2}])
+        self.assertEqual([event.kind for event in events.get_events(self.project.pk, 0)],
+                         ['reset'])
+
+    def test_long_poll(self):
+        self.client.login(username='facilitator', password='facilitator')
+        url = '/api/projects/{}/events/'.format(self.project.pk)
+        response = self.client.get(url, {'timeout': 0})
+        self.assertEqual(response.json(), {'events': [], 'last_event_id': self.after})
+
+        # Votes cast between two polls are not missed
+        self.vote(self.experts[0], self.high)
+        data = self.client.get(url, {'after': self.after, 'timeout': 0}).json()
+        self.assertEqual([event['kind'] for event in data['events']], ['consensus'])
+        self.assertEqual(data['last_event_id'], data['events'][0]['id'])
+
+    def test_event_stream(self):
+        self.client.login(username='facilitator', password='facilitator')
+        with watch(self.project.pk):
+            self.vote(self.experts[0], self.high)
+        response = self.client.get('/api/projects/{}/events/'.format(self.project.pk),
+                                   HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID=str(self.after))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        self.assertIn(b'event: consensus\n', next(chunks))
+        response.close()
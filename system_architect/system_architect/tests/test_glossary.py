@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from io import StringIO
+from unittest import mock
+from system_architect import glossary
+from system_architect.glossary import TermMatcher, get_matcher, link_terms
+from system_architect.models import Function, Project, ProjectChange, Term
+
+
+class GlossaryTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name="Glossary Test")
+        self.terms = {
+            name: Term.objects.create(name=name)
+            for name in ('Air Defense', 'Defense', 'Radar', 'AAW')
+        }
+        self.project.glossary.add(*self.terms.values())
+
+    def test_matcher(self):
+        matcher = TermMatcher((term.pk, term.name) for term in self.terms.values())
+        found = matcher.find("Provide  air\ndefense with radars and the AAW radar.")
+        self.assertEqual(found, {self.terms[name].pk for name in ('Air Defense', 'Defense',
+                                                                  'Radar', 'AAW')})
+        self.assertEqual(matcher.find("Paaw radars"), set())
+        self.assertEqual(TermMatcher([(1, 'she'), (2, 'he'), (3, 'hers')]).find("he ushers hers"),
+                         {2, 3})
+
+    def test_link_terms(self):
+        function = self.project.add_function(name='Detect', description='Radar detection')
+        self.assertEqual(set(function.terms.all()), {self.terms['Radar']})
+
+        Function.objects.filter(pk=function.pk).update(description='Air defense detection')
+        self.assertEqual(link_terms(self.project), 2)
+        self.assertEqual(set(function.terms.all()),
+                         {self.terms[name] for name in ('Radar', 'Air Defense', 'Defense')})
+        self.assertEqual(link_terms(self.project, replace=True), 1)
+        self.assertEqual(link_terms(self.project), 0)
+
+    def test_saved_entity(self):
+        function = self.project.add_function(name='Detect', description='Radar detection')
+        function.description = 'AAW detection'
+        function.save()
+        self.assertEqual(set(function.terms.all()), {self.terms['AAW'], self.terms['Radar']})
+
+        # Links picked by hand are kept
+        goal = self.project.add_goal(name='Protect', body='Keep the fleet safe')
+        goal.terms.add(self.terms['Radar'])
+        goal.name = 'Defend'
+        goal.save()
+        self.assertEqual(set(goal.terms.all()), {self.terms['Radar']})
+        self.assertEqual(link_terms(self.project, replace=True), 2)
+        self.assertEqual(set(goal.terms.all()), set())
+
+    def test_admin(self):
+        function = self.project.add_function(name='Detect')
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        url = '/admin/system_architect/function/{}/change/'.format(function.pk)
+        data = {'name': 'Detect', 'description': 'Radar detection', 'project': self.project.pk,
+                'terms': [self.terms['AAW'].pk]}
+        for inline in self.client.get(url).context['inline_admin_formsets']:
+            management = inline.formset.management_form
+            data.update({management.add_prefix(name): value
+                         for name, value in management.initial.items()})
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        # The terms picked in the form are kept along with those mentioned
+        self.assertEqual(set(function.terms.all()), {self.terms['AAW'], self.terms['Radar']})
+
+    def test_cache(self):
+        matcher = get_matcher(self.project)
+        self.assertIs(get_matcher(self.project), matcher)
+        self.project.glossary.add(Term.objects.create(name='Sonar'))
+        self.assertIsNot(get_matcher(self.project), matcher)
+        system = self.project.add_system(name='Hull Sonar')
+        self.assertEqual([term.name for term in system.terms.all()], ['Sonar'])
+
+        # Renamed in another process, which sends no signals here
+        sonar = Term.objects.get(name='Sonar')
+        Term.objects.filter(pk=sonar.pk).update(name='Hull')
+        self.assertEqual(get_matcher(self.project).find("Hull"), set())
+        ProjectChange.objects.create(project=self.project)
+        self.assertEqual(get_matcher(self.project).find("Hull"), {sonar.pk})
+
+        # A term of the glossary changed
+        matcher = get_matcher(self.project)
+        self.terms['Radar'].name = 'Radars'
+        self.terms['Radar'].save()
+        self.assertIsNot(get_matcher(self.project), matcher)
+        self.terms['Radar'].delete()
+        self.assertEqual(get_matcher(self.project).find("Radars"), set())
+
+    def test_least_recently_used(self):
+        others = [Project.objects.create(name=name) for name in ('First', 'Second')]
+        with mock.patch.object(glossary, 'MAX_MATCHERS', 2):
+            matcher = get_matcher(self.project)
+            get_matcher(others[0])
+            self.assertIs(get_matcher(self.project), matcher)
+            get_matcher(others[1])
+            self.assertEqual(list(glossary._matchers), [self.project.pk, others[1].pk])
+
+    def test_command(self):
+        self.project.add_goal(name='Protect', body='Layered air defense')
+        output = StringIO()
+        call_command('link_terms', stdout=output)
+        self.assertIn("Glossary Test: 0 links changed", output.getvalue())
+        self.assertEqual(self.project.goals.get().terms.count(), 2)
@@ -0,0 +1,127 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.utils import timezone
+from io import StringIO
+from json import loads
+from os import _exit
+from system_architect.jobs import Worker, cancel_job, recover_jobs, register_task, submit_job
+from system_architect.models import Job, Project, SystemArchitecture, SystemSatisfies
+
+
+@register_task('test_add')
+def add(context, numbers):
+    for index in range(len(numbers)):
+        context.report(index / len(numbers))
+    return sum(numbers)
+
+
+@register_task('test_crash')
+def crash(context):
+    if Job.objects.get(pk=context.job_id).attempts == 1:
+        _exit(1)
+    return 'recovered'
+
+
+@register_task('test_cancel')
+def cancel(context):
+    Job.objects.filter(pk=context.job_id).update(cancel_requested=True)
+    context.report(0.5)
+    return 'not cancelled'
+
+
+@register_task('test_fail')
+def fail(context):
+    raise ValueError("Something went wrong")
+
+
+class JobTestCase(TransactionTestCase):
+    def run_jobs(self):
+        return Worker(processes=1, poll_interval=0.05).run(once=True)
+
+    def test_result(self):
+        job = submit_job('test_add', numbers=[1, 2, 3])
+        self.assertEqual(self.run_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.progress, 1.0)
+        self.assertEqual(loads(job.result), 6)
+        self.assertEqual(job.attempts, 1)
+
+    def test_failure(self):
+        job = submit_job('test_fail')
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.message, "Something went wrong")
+        self.assertIn('ValueError', job.error)
+
+    def test_crashed_worker(self):
+        job = submit_job('test_crash')
+        doomed = submit_job('test_crash', max_attempts=1)
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(loads(job.result), 'recovered')
+        doomed.refresh_from_db()
+        self.assertEqual(doomed.status, Job.FAILED)
+        self.assertEqual(doomed.message, "The worker process crashed")
+
+    def test_cancellation(self):
+        queued = cancel_job(submit_job('test_add', numbers=[1]))
+        self.assertEqual(queued.status, Job.CANCELLED)
+        running = submit_job('test_cancel')
+        self.assertEqual(self.run_jobs(), 1)
+        running.refresh_from_db()
+        self.assertEqual(running.status, Job.CANCELLED)
+        self.assertEqual(running.result, '')
+
+    def test_stale_jobs(self):
+        old = timezone.now() - timedelta(hours=1)
+        retried = Job.objects.create(task='test_add', status=Job.RUNNING, attempts=1,
+                                     heartbeat_on=old)
+        exhausted = Job.objects.create(task='test_add', status=Job.RUNNING, attempts=3,
+                                       heartbeat_on=old)
+        alive = Job.objects.create(task='test_add', status=Job.RUNNING, attempts=1,
+                                   heartbeat_on=timezone.now())
+        recover_jobs()
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[retried.pk], Job.QUEUED)
+        self.assertEqual(statuses[exhausted.pk], Job.FAILED)
+        self.assertEqual(statuses[alive.pk], Job.RUNNING)
+
+    def test_cut_sets_api(self):
+        project = Project.objects.create(name="Job Test")
+        scale = project.add_scale(name='Criticality')
+        detect = project.add_function(name='Detect')
+        radar = project.add_system(name='Radar')
+        SystemSatisfies.objects.create(satisfier=radar, satisfied=detect, project=project,
+                                       scale=scale)
+        architecture = SystemArchitecture.objects.create(name='Single', project=project)
+        architecture.systems.add(radar)
+        User.objects.create_superuser('expert', 'expert@example.com', 'expert')
+        self.client.login(username='expert', password='expert')
+
+        response = self.client.post('/api/architectures/{}/cut-sets/'.format(architecture.pk))
+        self.assertEqual(response.status_code, 202)
+        url = response.json()['url']
+        self.assertEqual(self.client.get(url).json()['status'], Job.QUEUED)
+        self.assertEqual(self.client.get('/api/jobs/abc/').status_code, 404)
+        response = self.client.post('/api/architectures/{}/cut-sets/'.format(architecture.pk),
+                                    {'scenario': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+        self.run_jobs()
+        data = self.client.get(url).json()
+        self.assertEqual(data['status'], Job.SUCCEEDED)
+        self.assertEqual(data['result'], {
+            str(detect.pk): {'satisfaction': 1.0, 'cuts': [[str(radar.pk)]]},
+        })
+
+    def test_command(self):
+        submit_job('test_add', numbers=[1])
+        output = StringIO()
+        call_command('run_workers', processes=1, poll_interval=0.05, once=True, stdout=output)
+        self.assertIn("Ran 1 jobs", output.getvalue())
@@ -1,6 +1,14 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
 from django.test.utils import override_settings
+from io import StringIO
+from os import remove
 from system_architect.management.commands.add_fixture_data import Command
+from system_architect.management.commands.check_query_plans import explain, get_full_scans
+from system_architect.models import Function, Project
+from system_architect.models.vote import ExpertProfile, Organization
+from tempfile import NamedTemporaryFile
 
 
 command = Command()
@@ -19,3 +27,67 @@ class ManagementCommandsTestCase(TestCase):
 
     def test_simple(self):
         command.make_simple_example(project_name="Simple Test")
+
+    def test_remake(self):
+        command.make_simple_example(project_name="Remake Test")
+        command.make_simple_example(project_name="Remake Test", remake=True)
+        self.assertEqual(Project.objects.filter(name="Remake Test").count(), 1)
+
+
+class ImportExpertsTestCase(TestCase):
+    def test_import_experts(self):
+        with NamedTemporaryFile('w', suffix='.csv', delete=False) as csvfile:
+            csvfile.write("username,email,title,organization\n")
+            for number in range(5):
+                csvfile.write("expert{0},expert{0}@navy.mil,Engineer,Org {1}\n".format(number, number % 2))
+        User.objects.create_user('expert0')
+
+        try:
+            call_command('import_experts', csvfile.name, chunk_size=2, stdout=StringIO())
+            call_command('import_experts', csvfile.name, stdout=StringIO())
+        finally:
+            remove(csvfile.name)
+
+        self.assertEqual(User.objects.filter(username__startswith='expert').count(), 5)
+        self.assertEqual(ExpertProfile.objects.filter(user__username__startswith='expert').count(), 5)
+        self.assertEqual(Organization.objects.count(), 2)
+        self.assertEqual(ExpertProfile.objects.get(user__username='expert3').organization.name, 'Org 1')
+
+
+class FindDuplicatesTestCase(TestCase):
+    def test_find_duplicates(self):
+        project = Project.objects.create(name="Duplicates Command Test")
+        project.add_function(name='Detect airborne targets')
+        project.add_function(name='Airborne target detection')
+        output = StringIO()
+        call_command('find_duplicates', project.name, stdout=output)
+        self.assertIn("Found 1 likely duplicates", output.getvalue())
+
+
+class CheckQueryPlansTestCase(TestCase):
+    def test_check_query_plans(self):
+        out = StringIO()
+        call_command('check_query_plans', verbosity=2, stdout=out)
+        self.assertIn("Every query uses an index", out.getvalue())
+        self.assertNotIn("full scan", out.getvalue())
+
+    def test_full_scans_are_reported(self):
+        plan = explain(Function.objects.filter(name='Detect'))
+        self.assertEqual(get_full_scans(plan), [Function._meta.db_table])
+
+
+class BenchmarkVotesTestCase(TransactionTestCase):
+    def test_benchmark_votes(self):
+        out = StringIO()
+        call_command('benchmark_votes', threads=2, votes=3, stdout=out)
+        self.assertIn("default: 6 votes", out.getvalue())
+        self.assertIn("concurrent: 6 votes", out.getvalue())
+        self.assertFalse(Project.objects.filter(name="Vote Benchmark").exists())
+
+
+class BenchmarkStartupTestCase(TestCase):
+    def test_benchmark_startup(self):
+        out = StringIO()
+        call_command('benchmark_startup', runs=1, profile='production', stdout=out)
+        self.assertIn("production: wsgi.py imports in", out.getvalue())
+        self.assertIn("heavy modules loaded: none", out.getvalue())
@@ -0,0 +1,122 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from io import BytesIO, StringIO
+from json import dumps
+from os import path
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
+from system_architect.matrix import MappingMatrix, import_matrix, read_matrix
+from system_architect.models import FunctionRequires, Project, SystemSatisfies, Vote
+
+XLSX_NAMESPACE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+
+class MatrixTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Matrix Test")
+        self.scale = project.add_scale(name='Criticality')
+        self.scale.add_level('High', 1.0)
+        self.scale.add_level('Low', 0.0)
+        self.detect = project.add_function(name='Detect')
+        self.engage = project.add_function(name='Engage')
+        self.radar = project.add_system(name='Radar')
+        self.missile = project.add_system(name='Missile')
+        self.user = User.objects.create_superuser('expert', 'expert@example.com', 'expert')
+        self.expert = self.user.expertprofile
+
+    def get_matrix(self):
+        return MappingMatrix('system-satisfies', self.project, self.scale, expert=self.expert)
+
+    def test_save_changes(self):
+        matrix = self.get_matrix()
+        self.assertEqual([name for _, name in matrix.rows], ['Missile', 'Radar'])
+        self.assertEqual(matrix.cells, {})
+
+        changed = matrix.save({(self.radar.pk, self.detect.pk): 'High',
+                               (self.missile.pk, self.engage.pk): 'Low',
+                               (self.missile.pk, self.detect.pk): ''})
+        self.assertEqual(changed, 2)
+        satisfaction = SystemSatisfies.objects.get(satisfier=self.radar)
+        self.assertEqual(satisfaction.satisfied, self.detect)
+        self.assertEqual(satisfaction.latest_votes().get().value.name, 'High')
+
+        matrix = self.get_matrix()
+        self.assertEqual(matrix.cells, {(self.radar.pk, self.detect.pk): 'High',
+                                        (self.missile.pk, self.engage.pk): 'Low'})
+        # Unchanged cells are not written again
+        self.assertEqual(matrix.save({(self.radar.pk, self.detect.pk): 'High',
+                                      (self.missile.pk, self.engage.pk): ''}), 1)
+        self.assertEqual(Vote.objects.count(), 1)
+        self.assertEqual(SystemSatisfies.objects.count(), 2)
+
+    def test_concurrent_saves(self):
+        first, second = self.get_matrix(), self.get_matrix()
+        other = MappingMatrix('system-satisfies', self.project, self.scale)
+        first.save({(self.radar.pk, self.detect.pk): 'High'})
+        # The relationship stated since the matrix was loaded is voted on
+        second.save({(self.radar.pk, self.detect.pk): 'Low'})
+        other.save({(self.radar.pk, self.detect.pk): 'High'})
+        satisfaction = SystemSatisfies.objects.get()
+        self.assertEqual(Vote.objects.filter(relationship=satisfaction).count(), 3)
+
+        late = self.get_matrix()
+        SystemSatisfies.objects.create(satisfier=self.missile, satisfied=self.engage,
+                                       project=self.project,
+                                       scale=self.project.add_scale(name='Other'))
+        with self.assertRaises(ValidationError):
+            late.save({(self.missile.pk, self.engage.pk): 'High'})
+        self.assertEqual(Vote.objects.count(), 3)
+
+    def test_invalid_cells(self):
+        other = self.project.add_scale(name='Other')
+        FunctionRequires.objects.create(requiring=self.detect, required=self.engage,
+                                        project=self.project, scale=other)
+        matrix = MappingMatrix('function-requires', self.project, self.scale, expert=self.expert)
+        with self.assertRaises(ValidationError):
+            matrix.save({(self.detect.pk, self.engage.pk): 'High'})
+        with self.assertRaises(ValidationError):
+            matrix.save({(self.engage.pk, self.detect.pk): 'Medium'})
+
+    def test_import_csv(self):
+        rows = read_matrix(BytesIO('\ufeff,Detect,Engage\nRadar,High\nMissile,,Low\n'.encode()),
+                           'matrix.csv')
+        self.assertEqual(import_matrix(self.get_matrix(), rows), 2)
+        with self.assertRaises(ValidationError):
+            import_matrix(self.get_matrix(), [['', 'Track'], ['Radar', 'High']])
+
+    def test_import_xlsx(self):
+        workbook = BytesIO()
+        with ZipFile(workbook, 'w') as archive:
+            archive.writestr('xl/sharedStrings.xml', (
+                '<sst xmlns="{}"><si><t>Detect</t></si><si><t>Radar</t></si>'
+                '<si><t>High</t></si></sst>').format(XLSX_NAMESPACE))
+            archive.writestr('xl/worksheets/sheet1.xml', (
+                '<worksheet xmlns="{}"><sheetData>'
+                '<row r="1"><c r="B1" t="s"><v>0</v></c></row>'
+                '<row r="2"><c r="A2" t="s"><v>1</v></c><c r="B2" t="s"><v>2</v></c></row>'
+                '</sheetData></worksheet>').format(XLSX_NAMESPACE))
+        workbook.seek(0)
+        self.assertEqual(read_matrix(workbook, 'matrix.xlsx'), [['', 'Detect'], ['Radar', 'High']])
+
+    def test_admin_view(self):
+        self.client.login(username='expert', password='expert')
+        url = '/admin/system_architect/project/{}/matrix/?kind=system-satisfies'.format(
+            self.project.pk)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url + '&scenario=abc&scale=abc').status_code, 200)
+        cells = {'{}:{}'.format(self.radar.pk, self.detect.pk): 'High'}
+        response = self.client.post(url, {'cells': dumps(cells)})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_matrix().cells, {(self.radar.pk, self.detect.pk): 'High'})
+
+    def test_command(self):
+        with TemporaryDirectory() as directory:
+            name = path.join(directory, 'matrix.csv')
+            with open(name, 'w') as matrix_file:
+                matrix_file.write(',Engage\nMissile,High\n')
+            output = StringIO()
+            call_command('import_matrix', self.project.name, 'system-satisfies', 'Criticality',
+                         name, expert='expert', stdout=output)
+        self.assertIn("Saved 1 cells", output.getvalue())
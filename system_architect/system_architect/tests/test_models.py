@@ -1,6 +1,8 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 from system_architect.management.commands.add_fixture_data import Command
-from system_architect.models import (Function, Project, System)
+from system_architect.models import (Function, FunctionRequires, Project, System)
 
 
 class ModelsTestCase(TestCase):
@@ -13,4 +15,38 @@ class ModelsTestCase(TestCase):
                                 .filter(name="Simple Test Case")
                                 .count(), 1)
 
+    def test_login_does_not_save_profile(self):
+        user = User.objects.create_user('expert', password='expert')
+        user = User.objects.get(pk=user.pk)
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+        user.expertprofile.title = 'Engineer'
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).expertprofile.title, 'Engineer')
+
+    def test_relationships_are_unique_per_scenario(self):
+        project = Project.objects.get(name="Simple Test Case")
+        requiring, required = project.functions.all()[:2]
+        scale = project.scales.first()
+        FunctionRequires.objects.create(requiring=requiring, required=required, project=project,
+                                        scale=scale)
+        duplicate = FunctionRequires(requiring=requiring, required=required, project=project,
+                                     scale=scale)
+        with self.assertRaises(ValidationError):
+            duplicate.validate_unique()
+        duplicate.scenario = project.scenarios.create(name='Arctic')
+        duplicate.validate_unique()
+
+    def test_project_copy(self):
+        project = Project.objects.get(name="Simple Test Case")
+        project.add_function(name='Counted')
+        project.pk, project.name = None, "Copy"
+        project.save()
+        self.assertEqual(Project.objects.filter(name__in=["Simple Test Case", "Copy"]).count(), 2)
+
+        # A deleted project is inserted again
+        Project.objects.filter(pk=project.pk).delete()
+        project.save()
+        self.assertTrue(Project.objects.filter(pk=project.pk, name="Copy").exists())
+
     # TODO: complete the tests for all the models
@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from system_architect.analysis import optimize_architecture, solve_knapsack, solve_lagrangian
+from system_architect.models import (FunctionRequires, Project, SystemRequires, SystemSatisfies,
+                                     Vote)
+
+
+class OptimizationTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Optimization Test")
+        self.scale = scale = project.add_scale(name='Criticality')
+        scale.add_level('High', 1.0)
+        medium = scale.add_level('Medium', 0.5)
+        scale.add_level('Low', 0.0)
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.engage = project.add_function(name='Engage')
+        self.radar = project.add_system(name='Radar', cost=4.0, weight=1.0)
+        self.missile = project.add_system(name='Missile', cost=5.0, weight=3.0)
+        self.cannon = project.add_system(name='Cannon', cost=2.0, weight=1.0)
+
+        for required in (self.detect, self.engage):
+            FunctionRequires.objects.create(requiring=self.intercept, required=required,
+                                            project=project, scale=scale)
+        for satisfier, satisfied in ((self.radar, self.detect), (self.missile, self.engage)):
+            SystemSatisfies.objects.create(satisfier=satisfier, satisfied=satisfied,
+                                           project=project, scale=scale)
+        # The cannon only half engages
+        cannon = SystemSatisfies.objects.create(satisfier=self.cannon, satisfied=self.engage,
+                                                project=project, scale=scale)
+        expert = User.objects.create_user('expert').expertprofile
+        Vote.objects.create(relationship=cannon, expert=expert, value=medium)
+
+    def test_single_resource(self):
+        result = optimize_architecture(self.project, limits={'cost': 9.0})
+        self.assertEqual(result.systems, {self.radar.pk, self.missile.pk})
+        self.assertEqual(result.satisfaction, 1.0)
+        self.assertEqual(result.functions, {self.intercept.pk: 1.0})
+        self.assertEqual(result.resources, {'cost': 9.0, 'power': 0.0, 'space': 0.0, 'weight': 4.0})
+
+        result = optimize_architecture(self.project, limits={'cost': 8.0})
+        self.assertEqual(result.systems, {self.radar.pk, self.cannon.pk})
+        self.assertEqual(result.satisfaction, 0.5)
+
+        result = optimize_architecture(self.project, limits={'cost': 3.0})
+        self.assertEqual(result.satisfaction, 0.0)
+
+    def test_several_resources(self):
+        self.project.cost_limit = 20.0
+        self.project.weight_limit = 3.0
+        self.project.save()
+        result = optimize_architecture(self.project)
+        self.assertEqual(result.systems, {self.radar.pk, self.cannon.pk})
+        self.assertEqual(result.resources['weight'], 2.0)
+
+    def test_unlimited(self):
+        result = optimize_architecture(self.project)
+        self.assertEqual(result.satisfaction, 1.0)
+        self.assertIn(self.missile.pk, result.systems)
+
+    def test_function_weights(self):
+        result = optimize_architecture(self.project, limits={'cost': 9.0},
+                                       weights={self.detect.pk: 1.0})
+        self.assertEqual(result.systems, {self.radar.pk})
+        with self.assertRaises(ValueError):
+            optimize_architecture(self.project, weights={self.detect.pk: 0.0})
+
+    def test_required_systems(self):
+        # The missile now needs power, which only the generator provides
+        power = self.project.add_function(name='Power')
+        generator = self.project.add_system(name='Generator', cost=1.0)
+        SystemRequires.objects.create(requiring=self.missile, required=power,
+                                      project=self.project, scale=self.scale)
+        SystemSatisfies.objects.create(satisfier=generator, satisfied=power,
+                                       project=self.project, scale=self.scale)
+        result = optimize_architecture(self.project, limits={'cost': 10.0},
+                                       weights={self.intercept.pk: 1.0})
+        self.assertEqual(result.systems, {self.radar.pk, self.missile.pk, generator.pk})
+        self.assertEqual(result.satisfaction, 1.0)
+
+    def test_knapsack_solvers(self):
+        self.assertEqual(solve_knapsack([6.0, 10.0, 12.0], [1.0, 2.0, 3.0], 5.0).tolist(),
+                         [False, True, True])
+        chosen = solve_lagrangian([6.0, 10.0, 12.0], [[1.0, 3.0], [2.0, 1.0], [3.0, 1.0]],
+                                  [5.0, 2.0])
+        self.assertEqual(chosen.tolist(), [False, True, True])
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from system_architect.management.commands.add_fixture_data import Command
+from system_architect.models import (Category, Function, FunctionRequires, Project, Scenario, System,
+                                     SystemArchitecture, SystemSatisfactionRequires, SystemSatisfies, Vote,
+                                     WeightLevel)
+from system_architect.models.relationship import Relationship
+from system_architect.projects import clone_project, purge_project
+from system_architect.search import search
+
+
+class ProjectTestCase(TestCase):
+    def setUp(self):
+        Command().make_naval_example(project_name="Clone Test")
+        self.project = project = Project.objects.get(name="Clone Test")
+        self.scale = project.scales.get(name='Criticality')
+        self.function, self.other_function = project.functions.all()[:2]
+        self.system = project.systems.first()
+        requires = FunctionRequires.objects.create(requiring=self.function, required=self.other_function,
+                                                   project=project, scale=self.scale,
+                                                   scenario=project.scenarios.last())
+        satisfies = SystemSatisfies.objects.create(satisfier=self.system, satisfied=self.function,
+                                                   project=project, scale=self.scale)
+        SystemSatisfactionRequires.objects.create(relationship=satisfies, required=self.other_function,
+                                                  project=project, scale=self.scale)
+        levels = self.scale.levels.all()
+        Vote.objects.create(relationship=requires, value=levels[0])
+        Vote.objects.create(relationship=requires, value=levels[1])
+        self.function.categories.add(project.categories.first())
+        architecture = SystemArchitecture.objects.create(name='Destroyer', project=project)
+        architecture.systems.add(self.system)
+
+
+class CloneProjectTestCase(ProjectTestCase):
+    def test_clone_project(self):
+        clone = clone_project(self.project, name="Clone Test FY27")
+
+        for model in (Function, Scenario, Category):
+            self.assertEqual(model.objects.filter(project=clone).count(),
+                             model.objects.filter(project=self.project).count())
+        self.assertEqual(WeightLevel.objects.filter(scale__project=clone).count(),
+                         WeightLevel.objects.filter(scale__project=self.project).count())
+        self.assertEqual(clone.scenarios.exclude(parent=None).filter(parent__project=clone).count(),
+                         self.project.scenarios.exclude(parent=None).count())
+
+        requires = FunctionRequires.objects.get(project=clone)
+        self.assertEqual((requires.requiring.name, requires.required.name),
+                         (self.function.name, self.other_function.name))
+        self.assertEqual(requires.requiring.project, clone)
+        self.assertEqual(requires.scenario.project, clone)
+        self.assertEqual(requires.scale.project, clone)
+
+        condition = SystemSatisfactionRequires.objects.get(project=clone)
+        self.assertEqual(condition.relationship.satisfier.project, clone)
+
+        vote = Vote.objects.get(relationship__project=clone)
+        self.assertEqual(vote.value.scale.project, clone)
+        self.assertEqual(clone.functions.get(name=self.function.name).categories.get().project, clone)
+        self.assertEqual(SystemArchitecture.objects.get(project=clone).systems.get().project, clone)
+        self.assertEqual(len(search(self.function.name, project=clone, kinds=['function'])), 1)
+
+
+class PurgeProjectTestCase(ProjectTestCase):
+    def test_purge_project(self):
+        other = clone_project(self.project)
+        counts = purge_project(self.project, chunk_size=7, dry_run=True)
+        self.assertEqual(counts['functions'], self.project.functions.count())
+        self.assertEqual(counts['votes'], 2)
+        self.assertTrue(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertEqual(purge_project(self.project, chunk_size=1, dry_run=True), counts)
+
+        self.assertEqual(purge_project(self.project, chunk_size=7), counts)
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        for model in (Function, System, Scenario, Relationship, SystemArchitecture):
+            self.assertFalse(model.objects.filter(project=self.project.pk).exists())
+        self.assertEqual(other.functions.count(), counts['functions'])
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_admin_delete(self):
+        User.objects.create_superuser('admin', 'admin@navy.mil', 'admin')
+        self.client.login(username='admin', password='admin')
+        url = reverse('admin:system_architect_project_delete', args=(self.project.pk,))
+        self.assertContains(self.client.get(url), "votes")
+        self.client.post(url, {'post': 'yes'})
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
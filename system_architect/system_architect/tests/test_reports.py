@@ -0,0 +1,70 @@
+from csv import reader
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from xml.etree import ElementTree
+from system_architect.models import FunctionRequires, Project, SystemArchitecture, Vote
+from system_architect.reports import get_report, write_report
+
+
+class ReportsTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Reports Test")
+        scale = project.add_scale(name='Criticality')
+        high = scale.add_level('High', 1.0)
+        scale.add_level('Low', 0.0)
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        requirement = FunctionRequires.objects.create(
+            requiring=self.intercept, required=self.detect, project=project, scale=scale)
+        self.user = User.objects.create_superuser('expert', 'expert@example.com', 'expert')
+        for comments in ("First", "Second <thoughts> & \x0bmore"):
+            Vote.objects.create(relationship=requirement, value=high, comments=comments,
+                                expert=self.user.expertprofile)
+        SystemArchitecture.objects.create(name='Empty', project=project)
+
+    def read_csv(self, name, **kwargs):
+        text = ''.join(write_report(get_report(name, self.project), 'csv', **kwargs))
+        return list(reader(StringIO(text)))
+
+    def test_csv_reports(self):
+        relationships = self.read_csv('relationships')
+        self.assertEqual(relationships[1],
+                         ['', 'function requires', 'Detect', 'Intercept', 'Criticality', '1.0'])
+        votes = self.read_csv('votes')
+        self.assertEqual(len(votes), 3)
+        self.assertEqual(votes[1][4:9], ['expert', 'Criticality', 'High', '1.0', 'High'])
+        experts = self.read_csv('experts')
+        self.assertEqual(experts[1][:3], ['expert', '2', '1'])
+        architectures = self.read_csv('architectures')
+        self.assertEqual(len(architectures), 3)
+
+    def test_batches(self):
+        chunks = list(write_report(get_report('votes', self.project), 'csv', batch_size=1))
+        self.assertEqual(len(chunks), 2)
+
+    def test_spreadsheet(self):
+        text = ''.join(write_report(get_report('votes', self.project), 'xml'))
+        namespace = '{urn:schemas-microsoft-com:office:spreadsheet}'
+        rows = ElementTree.fromstring(text).iter(namespace + 'Row')
+        self.assertEqual(len(list(rows)), 3)
+        self.assertIn('Second &lt;thoughts&gt; &amp; more', text)
+
+    def test_view(self):
+        self.client.login(username='expert', password='expert')
+        url = '/api/projects/{}/reports/votes.csv'.format(self.project.pk)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+        response = self.client.get('/api/projects/{}/reports/other.csv'.format(self.project.pk))
+        self.assertEqual(response.status_code, 404)
+
+    def test_command(self):
+        with TemporaryDirectory() as directory:
+            output = path.join(directory, 'experts.xml')
+            call_command('export_report', self.project.name, 'experts', output, stdout=StringIO())
+            self.assertEqual(ElementTree.parse(output).getroot().tag,
+                             '{urn:schemas-microsoft-com:office:spreadsheet}Workbook')
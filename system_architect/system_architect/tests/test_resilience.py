@@ -0,0 +1,78 @@
+from django.core.management import call_command
+from django.test import TestCase
+from io import StringIO
+from multiprocessing import get_context
+from unittest import mock
+from system_architect.analysis import find_cut_sets
+from system_architect.models import FunctionRequires, Project, SystemArchitecture, SystemSatisfies
+
+
+class ResilienceTestCase(TestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Resilience Test")
+        self.scale = scale = project.add_scale(name='Criticality')
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.engage = project.add_function(name='Engage')
+        self.radar = project.add_system(name='Radar')
+        self.backup = project.add_system(name='Backup Radar')
+        self.missile = project.add_system(name='Missile')
+        self.cannon = project.add_system(name='Cannon')
+
+        for required in (self.detect, self.engage):
+            FunctionRequires.objects.create(requiring=self.intercept, required=required,
+                                            project=project, scale=scale)
+        for satisfier, satisfied in ((self.radar, self.detect), (self.backup, self.detect),
+                                     (self.missile, self.engage)):
+            SystemSatisfies.objects.create(satisfier=satisfier, satisfied=satisfied,
+                                           project=project, scale=scale)
+
+        self.architecture = SystemArchitecture.objects.create(name='Layered', project=project)
+        self.architecture.systems.add(self.radar, self.backup, self.missile, self.cannon)
+
+    def test_minimal_cut_sets(self):
+        results = find_cut_sets(self.architecture, processes=1)
+        self.assertEqual(set(results), {self.intercept.pk})
+        result = results[self.intercept.pk]
+        self.assertEqual(result.satisfaction, 1.0)
+        self.assertEqual(result.cuts, [frozenset([self.missile.pk]),
+                                       frozenset([self.radar.pk, self.backup.pk])])
+
+        results = find_cut_sets(self.architecture, max_size=1, functions=[self.detect.pk])
+        self.assertEqual(results[self.detect.pk].cuts, [])
+
+    def test_progress(self):
+        reported = []
+        with mock.patch('system_architect.analysis.resilience.CHUNK_SIZE', 1):
+            find_cut_sets(self.architecture, processes=1, max_size=3, progress=reported.append)
+        # Reported after each set, and done although the sizes stopped early
+        self.assertGreater(len(reported), 3)
+        self.assertEqual(reported, sorted(reported))
+        self.assertLess(reported[-2], 1.0)
+        self.assertEqual(reported[-1], 1.0)
+
+    def test_unsatisfied_function(self):
+        self.architecture.systems.remove(self.missile)
+        result = find_cut_sets(self.architecture, processes=1)[self.intercept.pk]
+        self.assertEqual(result.cuts, [frozenset()])
+
+    def test_process_pool(self):
+        for index in range(30):
+            spare = self.project.add_system(name='Spare {}'.format(index))
+            SystemSatisfies.objects.create(satisfier=spare, satisfied=self.detect,
+                                           project=self.project, scale=self.scale)
+            self.architecture.systems.add(spare)
+        single = find_cut_sets(self.architecture, processes=1)
+        pooled = find_cut_sets(self.architecture, processes=2)
+        self.assertEqual(single, pooled)
+
+        # Spawned processes import the app from scratch
+        with mock.patch('system_architect.analysis.resilience.Pool', get_context('spawn').Pool):
+            self.assertEqual(find_cut_sets(self.architecture, processes=2), single)
+
+    def test_command(self):
+        output = StringIO()
+        call_command('find_cut_sets', self.project.name, self.architecture.name, stdout=output)
+        self.assertIn("Intercept (100% satisfied): {Missile}, {Backup Radar, Radar}",
+                      output.getvalue())
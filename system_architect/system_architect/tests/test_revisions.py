@@ -0,0 +1,53 @@
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from system_architect.models import Project, ProjectChange, SystemSatisfies, Vote
+from system_architect.revisions import get_revision, project_changed
+
+
+class RevisionTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Revision Test")
+        scale = project.add_scale(name='Criticality')
+        self.high = scale.add_level('High', 1.0)
+        self.relationship = SystemSatisfies.objects.create(
+            satisfier=project.add_system(name='Radar'), satisfied=project.add_function(name='Detect'),
+            project=project, scale=scale)
+        self.sent = []
+        project_changed.connect(self.receive)
+
+    def tearDown(self):
+        project_changed.disconnect(self.receive)
+
+    def receive(self, sender, project_id, revision, changes, **kwargs):
+        self.sent.append((project_id, revision, [change.model for change in changes]))
+
+    def test_revision(self):
+        revision = get_revision(self.project.pk)
+        with transaction.atomic():
+            Vote.objects.create(relationship=self.relationship, value=self.high)
+            Vote.objects.create(relationship=self.relationship, value=self.high)
+            # What is worked out from uncommitted changes is not to be kept
+            self.assertIsNone(get_revision(self.project.pk))
+        self.assertEqual(get_revision(self.project.pk), revision + 1)
+        self.assertEqual(self.sent, [(self.project.pk, revision + 1, [Vote, Vote])])
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Vote.objects.create(relationship=self.relationship, value=self.high)
+            raise RuntimeError
+        self.assertEqual(get_revision(self.project.pk), revision + 1)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_vote_writes(self):
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            Vote.objects.create(relationship=self.relationship, value=self.high)
+        # The project is taken from the loaded relationship, and no row is updated
+        self.assertEqual([query['sql'].split()[:3] for query in queries], [
+            ['INSERT', 'INTO', '"system_architect_vote"'],
+            ['INSERT', 'INTO', '"system_architect_projectchange"'],
+        ])
+
+    def test_deleted_project(self):
+        Vote.objects.create(relationship=self.relationship, value=self.high)
+        self.project.delete()
+        self.assertFalse(ProjectChange.objects.exists())
@@ -0,0 +1,106 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TransactionTestCase
+from system_architect.analysis import evaluate_architecture, evaluate_scenarios
+from system_architect.models import (FunctionRequires, Project, SystemArchitecture, SystemSatisfies,
+                                     SystemSatisfactionRequires, Vote)
+
+
+class ScenarioScoresTestCase(TransactionTestCase):
+    def setUp(self):
+        self.project = project = Project.objects.create(name="Scenario Test")
+        self.scale = scale = project.add_scale(name='Criticality')
+        scale.add_level('High', 1.0)
+        self.medium = scale.add_level('Medium', 0.5)
+        scale.add_level('None', 0.0)
+
+        self.general = project.scenarios.create(name='General', weight=3.0)
+        self.arctic = project.scenarios.create(name='Arctic', parent=self.general, weight=1.0)
+        self.tropical = project.scenarios.create(name='Tropical', weight=0.0)
+
+        self.intercept = project.add_function(name='Intercept')
+        self.detect = project.add_function(name='Detect')
+        self.engage = project.add_function(name='Engage')
+        self.power = project.add_function(name='Power')
+        self.radar = project.add_system(name='Radar')
+        self.missile = project.add_system(name='Missile')
+        self.generator = project.add_system(name='Generator')
+
+        for required in (self.detect, self.engage):
+            FunctionRequires.objects.create(requiring=self.intercept, required=required,
+                                            project=project, scale=scale)
+        detection = SystemSatisfies.objects.create(satisfier=self.radar, satisfied=self.detect,
+                                                   project=project, scale=scale)
+        # Only the general detection needs power
+        SystemSatisfactionRequires.objects.create(relationship=detection, required=self.power,
+                                                  project=project, scale=scale)
+        SystemSatisfies.objects.create(satisfier=self.generator, satisfied=self.power,
+                                       project=project, scale=scale)
+        # The missile only engages in the general scenarios, and half as well in the arctic
+        SystemSatisfies.objects.create(satisfier=self.missile, satisfied=self.engage,
+                                       project=project, scale=scale, scenario=self.general)
+        self.arctic_engagement = SystemSatisfies.objects.create(
+            satisfier=self.missile, satisfied=self.engage, project=project, scale=scale,
+            scenario=self.arctic)
+        Vote.objects.create(relationship=self.arctic_engagement, value=self.medium)
+        # The radar detects in the arctic without power
+        SystemSatisfies.objects.create(satisfier=self.radar, satisfied=self.detect,
+                                       project=project, scale=scale, scenario=self.arctic)
+
+        self.architecture = SystemArchitecture.objects.create(name='Destroyer', project=project)
+        self.architecture.systems.add(self.radar, self.missile)
+
+    def test_matches_each_scenario(self):
+        self.architecture.systems.add(self.generator)
+        other = SystemArchitecture.objects.create(name='Radar only', project=self.project)
+        other.systems.add(self.radar)
+        for architecture in (self.architecture, other):
+            scores = evaluate_scenarios(architecture)
+            for scenario in (None, self.general, self.arctic, self.tropical):
+                expected = evaluate_architecture(architecture, scenario)
+                # Only a condition requires power, so it is a top function too
+                self.assertAlmostEqual(scores.scenarios[getattr(scenario, 'pk', None)],
+                                       (expected[self.intercept.pk] + expected[self.power.pk]) / 2)
+
+    def test_aggregate(self):
+        scores = evaluate_scenarios(self.architecture)
+        # Without the generator, the radar only detects in the arctic
+        self.assertEqual(scores.scenarios, {None: 0.0, self.general.pk: 0.0, self.arctic.pk: 0.25,
+                                            self.tropical.pk: 0.0})
+        self.assertAlmostEqual(scores.satisfaction, 0.0625)
+        self.assertAlmostEqual(scores.functions[self.detect.pk], 0.25)
+
+        # Without scenario weights, only the project without a scenario counts
+        self.project.scenarios.exclude(pk=self.arctic.pk).update(weight=0.0)
+        self.arctic.weight = 0.0
+        self.arctic.save()
+        self.assertEqual(evaluate_scenarios(self.architecture).satisfaction, 0.0)
+
+    def test_kept_until_changed(self):
+        scores = evaluate_scenarios(self.architecture)
+        # Only the revision of the project is read
+        with self.assertNumQueries(1):
+            self.assertEqual(evaluate_scenarios(self.architecture), scores)
+
+        with transaction.atomic():
+            Vote.objects.create(relationship=self.arctic_engagement,
+                                value=self.scale.levels.get(name='High'))
+            self.assertNotEqual(evaluate_scenarios(self.architecture), scores)
+            transaction.set_rollback(True)
+        with self.assertNumQueries(1):
+            self.assertEqual(evaluate_scenarios(self.architecture), scores)
+
+        Vote.objects.create(relationship=self.arctic_engagement,
+                            value=self.scale.levels.get(name='High'))
+        self.assertAlmostEqual(evaluate_scenarios(self.architecture).scenarios[self.arctic.pk], 0.5)
+        self.architecture.systems.remove(self.radar)
+        self.assertEqual(evaluate_scenarios(self.architecture).satisfaction, 0.0)
+
+    def test_view(self):
+        User.objects.create_superuser('planner', 'p@example.com', 'planner')
+        self.client.login(username='planner', password='planner')
+        data = self.client.get('/api/projects/{}/scenario-scores/'.format(self.project.pk)).json()
+        self.assertEqual([architecture['name'] for architecture in data['architectures']],
+                         ['Destroyer'])
+        self.assertAlmostEqual(data['architectures'][0]['satisfaction'], 0.0625)
+        self.assertEqual(data['architectures'][0]['scenarios'][str(self.arctic.pk)], 0.25)
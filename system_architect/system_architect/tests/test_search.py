@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from system_architect import search as search_module
+from system_architect.models import Project
+from system_architect.search import has_search_table, search
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.project = Project.objects.create(name="Search Test")
+        self.other_project = Project.objects.create(name="Other Search Test")
+        self.detect = self.project.add_function(name='Detect airborne targets',
+                                                description='Find aircraft and missiles')
+        self.track = self.project.add_function(name='Track surface targets',
+                                               description='Follow airborne and surface contacts')
+        self.radar = self.project.add_system(name='AN/SPY-1D', description='Airborne target radar')
+        self.other_project.add_function(name='Detect airborne targets')
+        self.term = self.project.glossary.create(name='Airborne', description='In the air')
+        self.goal = self.project.add_goal(name='Protect the fleet', body='Intercept incoming missiles')
+
+    def assert_search(self):
+        results = search('airb targ', project=self.project)
+        self.assertEqual([result.pk for result in results[:2]], [self.detect.pk, self.track.pk])
+        self.assertEqual({result.pk for result in results}, {self.detect.pk, self.track.pk, self.radar.pk})
+        self.assertEqual([result.pk for result in search('airborne', project=self.project, kinds=['term'])],
+                         [self.term.pk])
+        self.assertEqual([result.pk for result in search('intercept', project=self.project)],
+                         [self.goal.pk])
+        self.assertEqual(len(search('detect airborne')), 2)
+
+        self.detect.delete()
+        self.assertEqual(len(search('detect airborne')), 1)
+
+    def test_search_index(self):
+        self.assertTrue(has_search_table())
+        self.assert_search()
+
+    def test_search_fallback(self):
+        has_search_table = search_module.has_search_table
+        search_module.has_search_table = lambda: False
+        try:
+            self.assert_search()
+        finally:
+            search_module.has_search_table = has_search_table
+
+    def test_search_view(self):
+        User.objects.create_user('expert', password='expert')
+        self.client.login(username='expert', password='expert')
+        url = reverse('search', kwargs={'project_id': self.project.pk})
+        response = self.client.get(url, {'q': 'spy', 'kind': 'system'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], str(self.radar.pk))
+        # Ids that are not UUIDs are not found
+        self.assertEqual(self.client.get('/api/projects/abc/search/', {'q': 'x'}).status_code, 404)
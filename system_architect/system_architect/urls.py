@@ -2,9 +2,32 @@ from django.conf import settings
 from django.conf.urls import url, include
 from django.contrib import admin
 
+from . import views
+
+
+# The ids in the paths, which must be whole UUIDs for the views to look them up
+UUID_PATTERN = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+PROJECT_ID = r'(?P<project_id>' + UUID_PATTERN + ')'
+ARCHITECTURE_ID = r'(?P<architecture_id>' + UUID_PATTERN + ')'
+JOB_ID = r'(?P<job_id>' + UUID_PATTERN + ')'
+
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
+    url(r'^api/projects/' + PROJECT_ID + r'/search/$', views.search_project, name='search'),
+    url(r'^api/projects/' + PROJECT_ID + r'/dsm\.(?P<extension>csv|png)$', views.project_dsm,
+        name='dsm'),
+    url(r'^api/projects/' + PROJECT_ID + r'/reports/(?P<report>[a-z]+)\.(?P<extension>csv|xml)$',
+        views.project_report, name='report'),
+    url(r'^api/projects/' + PROJECT_ID + r'/events/$', views.project_events, name='events'),
+    url(r'^api/projects/' + PROJECT_ID + r'/scenario-scores/$', views.project_scenario_scores,
+        name='scenario_scores'),
+    url(r'^api/architectures/' + ARCHITECTURE_ID + r'/cut-sets/$', views.architecture_cut_sets,
+        name='cut_sets'),
+    url(r'^api/architectures/' + ARCHITECTURE_ID + r'/what-if/$', views.architecture_what_if,
+        name='what_if'),
+    url(r'^api/jobs/' + JOB_ID + r'/$', views.job_status, name='job'),
+    url(r'^api/jobs/' + JOB_ID + r'/cancel/$', views.job_cancel, name='job_cancel'),
     url(r'^nested_admin/', include('nested_admin.urls')),
 ]
 
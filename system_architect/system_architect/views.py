@@ -0,0 +1,314 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from io import BytesIO, StringIO
+from json import loads
+from uuid import UUID
+
+from .analysis import evaluate_variants, get_dsm, score_architectures
+from .events import broadcaster, stream_events, watch
+from .jobs import cancel_job, submit_job
+from .models import Function, Job, Project, Scenario, System, SystemArchitecture
+from .reports import REPORT_FORMATS, REPORTS, get_report, write_report
+from .search import SEARCHABLE_MODELS, search
+
+
+MAX_SEARCH_RESULTS = 100
+
+# The most variants of an architecture evaluated in one request
+MAX_VARIANTS = 5000
+
+# The longest a long polling client is kept waiting for events, in seconds
+MAX_POLL_TIMEOUT = 30.0
+
+
+def get_uuid(value):
+    """Parse an id sent by a client, or get None if it is not a UUID."""
+    try:
+        return UUID(str(value))
+    except ValueError:
+        return None
+
+
+@login_required
+def search_project(request, project_id):
+    """
+    Search the functions, systems, goals and terms of a project.
+
+    Takes the query in ``q``, optionally the kinds of entity to search in
+    ``kind`` (repeatable) and the maximum number of results in ``limit``.
+
+    """
+    project = get_object_or_404(Project, pk=project_id)
+    kinds = [
+        kind
+        for kind in request.GET.getlist('kind')
+        if kind in SEARCHABLE_MODELS
+    ]
+    try:
+        limit = min(int(request.GET.get('limit', 20)), MAX_SEARCH_RESULTS)
+    except ValueError:
+        limit = 20
+
+    results = search(request.GET.get('q', ''), project=project, kinds=kinds, limit=limit)
+    return JsonResponse({
+        'results': [
+            {
+                'kind': result.kind,
+                'id': str(result.pk),
+                'name': result.name,
+                'score': result.score,
+            }
+            for result in results
+        ],
+    })
+
+
+@login_required
+def project_dsm(request, project_id, extension):
+    """
+    Download the design structure matrix of a project as CSV or PNG.
+
+    Takes ``kind=systems`` for the system by function matrix, a ``scenario``
+    id and ``organize=1`` to cluster and sequence the functions.
+
+    """
+    project = get_object_or_404(Project, pk=project_id)
+    scenario = None
+    if request.GET.get('scenario'):
+        scenario = get_object_or_404(Scenario, pk=get_uuid(request.GET['scenario']),
+                                     project=project)
+    dsm = get_dsm(project, scenario, systems=request.GET.get('kind') == 'systems',
+                  organize=bool(request.GET.get('organize')))
+
+    if extension == 'png':
+        output = BytesIO()
+        dsm.write_png(output)
+        return HttpResponse(output.getvalue(), content_type='image/png')
+    output = StringIO()
+    dsm.write_csv(output)
+    response = HttpResponse(output.getvalue(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="dsm.csv"'
+    return response
+
+
+@login_required
+def project_report(request, project_id, report, extension):
+    """
+    Download a report of a project as CSV or as an Excel workbook.
+
+    The rows are streamed as they are read from the database. Takes a
+    ``scenario`` id to only report on what is stated for that scenario.
+
+    """
+    project = get_object_or_404(Project, pk=project_id)
+    if report not in REPORTS or extension not in REPORT_FORMATS:
+        raise Http404("Unknown report")
+    scenario = None
+    if request.GET.get('scenario'):
+        scenario = get_object_or_404(Scenario, pk=get_uuid(request.GET['scenario']),
+                                     project=project)
+
+    response = StreamingHttpResponse(
+        write_report(get_report(report, project, scenario), extension),
+        content_type=REPORT_FORMATS[extension][0],
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(report, extension)
+    return response
+
+
+@login_required
+def project_events(request, project_id):
+    """
+    Watch the consensus and architecture changes of a project as votes come in.
+
+    Clients accepting ``text/event-stream`` get server-sent events, and
+    others long poll: they get the events after the ``after`` event id,
+    waiting up to ``timeout`` seconds for one, and ask again with the
+    ``last_event_id`` of the response.
+
+    """
+    project = get_object_or_404(Project, pk=project_id)
+    after = request.GET.get('after', request.META.get('HTTP_LAST_EVENT_ID'))
+    try:
+        after = int(after) if after else broadcaster.last_id
+        timeout = min(float(request.GET.get('timeout', 25)), MAX_POLL_TIMEOUT)
+    except ValueError:
+        return JsonResponse({'error': "Invalid event id or timeout"}, status=400)
+
+    if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        response = StreamingHttpResponse(stream_events(project.pk, after),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keep proxies such as nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    with watch(project.pk):
+        events = broadcaster.get_events(project.pk, after, max(timeout, 0.0))
+    return JsonResponse({
+        'events': [
+            {'id': event.id, 'kind': event.kind, 'data': event.data}
+            for event in events
+        ],
+        'last_event_id': events[-1].id if events else after,
+    })
+
+
+@login_required
+def project_scenario_scores(request, project_id):
+    """
+    Score every architecture of a project under each scenario and across them.
+
+    The architectures come from the best aggregate score, which weights the
+    scenarios by their ``weight``, along with their score in each scenario.
+
+    """
+    project = get_object_or_404(Project, pk=project_id)
+    architectures = list(SystemArchitecture.objects.filter(project=project))
+    scores = score_architectures(architectures)
+    architectures.sort(key=lambda architecture: (-scores[architecture.pk].satisfaction,
+                                                 architecture.name))
+    return JsonResponse({
+        'architectures': [
+            {
+                'id': str(architecture.pk),
+                'name': architecture.name,
+                'satisfaction': scores[architecture.pk].satisfaction,
+                'scenarios': {
+                    str(scenario_id) if scenario_id else '': value
+                    for scenario_id, value in scores[architecture.pk].scenarios.items()
+                },
+            }
+            for architecture in architectures
+        ],
+    })
+
+
+def get_job_data(job):
+    return {
+        'id': str(job.pk),
+        'task': job.task,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'attempts': job.attempts,
+        'created_on': job.created_on.isoformat(),
+        'finished_on': job.finished_on.isoformat() if job.finished_on else None,
+        'result': loads(job.result) if job.status == Job.SUCCEEDED and job.result else None,
+        'url': reverse('job', args=[job.pk]),
+    }
+
+
+@login_required
+def job_status(request, job_id):
+    """Get the status, progress and, once it succeeded, the result of a job."""
+    return JsonResponse(get_job_data(get_object_or_404(Job, pk=job_id)))
+
+
+@login_required
+@require_POST
+def job_cancel(request, job_id):
+    """Cancel a job, at once if it is queued and at its next progress report if it runs."""
+    return JsonResponse(get_job_data(cancel_job(get_object_or_404(Job, pk=job_id))))
+
+
+@login_required
+@require_POST
+def architecture_cut_sets(request, architecture_id):
+    """
+    Queue a job finding the minimal cut sets of an architecture.
+
+    Takes a ``scenario`` id, the ``threshold`` below which a function is lost
+    and the ``max_size`` of the sets. Responds with the job, to be polled.
+
+    """
+    architecture = get_object_or_404(SystemArchitecture, pk=architecture_id)
+    scenario = None
+    if request.POST.get('scenario'):
+        scenario = get_object_or_404(Scenario, pk=get_uuid(request.POST['scenario']),
+                                     project=architecture.project_id).pk
+    try:
+        threshold = float(request.POST.get('threshold', 0.5))
+        max_size = int(request.POST.get('max_size', 3))
+    except ValueError:
+        return JsonResponse({'error': "Invalid threshold or size"}, status=400)
+    job = submit_job('find_cut_sets', architecture.project, architecture=str(architecture.pk),
+                     scenario=str(scenario) if scenario else None, threshold=threshold,
+                     max_size=max_size)
+    return JsonResponse(get_job_data(job), status=202)
+
+
+def get_ids(model, project, ids):
+    """Parse ids of a model, raising ``ValueError`` unless they all belong to the project."""
+    ids = {UUID(str(pk)) for pk in ids}
+    if model.objects.filter(project=project, pk__in=ids).count() != len(ids):
+        raise ValueError("Unknown {} ids".format(model._meta.model_name))
+    return ids
+
+
+@login_required
+@require_POST
+def architecture_what_if(request, architecture_id):
+    """
+    Evaluate variants of an architecture that add, remove and swap systems.
+
+    Takes a JSON body with a list of ``variants``, each with the system ids
+    to ``add`` and to ``remove``, and optionally a ``swap`` of one ``system``
+    for each of some ``candidates``, all the systems not in the architecture
+    by default. The ``weights`` of the functions and the ``scenario`` to
+    evaluate under are optional too. Responds with the satisfaction of the
+    architecture and the variants from the best, with the change of every
+    function whose satisfaction changes.
+
+    """
+    architecture = get_object_or_404(SystemArchitecture, pk=architecture_id)
+    project = architecture.project
+    try:
+        data = loads(request.body.decode('utf-8'))
+        scenario = None
+        if data.get('scenario'):
+            scenario = get_object_or_404(Scenario, pk=UUID(data['scenario']), project=project)
+        variants = [
+            (get_ids(System, project, variant.get('add', ())),
+             get_ids(System, project, variant.get('remove', ())))
+            for variant in data.get('variants', ())
+        ]
+        swap = data.get('swap')
+        if swap:
+            system, = get_ids(System, project, [swap['system']])
+            candidates = swap.get('candidates')
+            if candidates is None:
+                candidates = (System.objects
+                                    .filter(project=project)
+                                    .exclude(systemarchitecture=architecture)
+                                    .values_list('pk', flat=True))
+            variants.extend(({candidate}, {system})
+                            for candidate in get_ids(System, project, candidates))
+        weights = data.get('weights')
+        if weights is not None:
+            get_ids(Function, project, weights)
+            weights = {UUID(pk): float(weight) for pk, weight in weights.items()}
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return JsonResponse({'error': "Invalid variants, systems, functions or weights"}, status=400)
+    if len(variants) > MAX_VARIANTS:
+        return JsonResponse({'error': "At most {} variants".format(MAX_VARIANTS)}, status=400)
+
+    # The variant changing nothing gives the satisfaction of the architecture
+    base, *results = evaluate_variants(architecture, [((), ())] + variants, scenario, weights)
+    return JsonResponse({
+        'architecture': str(architecture.pk),
+        'satisfaction': base.satisfaction,
+        'variants': [
+            {
+                'add': sorted(str(pk) for pk in result.added),
+                'remove': sorted(str(pk) for pk in result.removed),
+                'satisfaction': result.satisfaction,
+                'delta': result.delta,
+                'functions': {str(pk): delta for pk, delta in result.functions.items()},
+            }
+            for result in sorted(results, key=lambda result: -result.delta)
+        ],
+    })